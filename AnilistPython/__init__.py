@@ -8,8 +8,18 @@ try:
     from .manga import Manga
     from .deep_search import DeepSearch
     from .user import User
+    from .request_handler import RequestHandler
+    from .rate_limiter import RateLimiter
+    from .response_cache import ResponseCache
+    from .async_anilist import AsyncAnilist
+    from .bulk_fetcher import BulkFetcher, BulkResult
+    from .deadline import Deadline, DeadlineExceeded, deadline_scope
+    from .health_monitor import HealthMonitor, CircuitOpenError
     from .databases.database_anime_retrieval import DatabaseSearcher
     from .databases.search_engine import SearchEngine
+    from .databases.sqlite_cache import SQLiteCache
+    from .databases.id_cache import IDCache
+    from .databases.delta_sync import DeltaSync
 
     from .anilistpython_info import AnilistPythonInfo
 
@@ -30,13 +40,32 @@ class Anilist:
         :ivar dict access: Access required data used through out the program
         :ivar ALAuth auth: Handle Authorization endpoints
     """
-    def __init__(self, cid = None, csecret = None, credentials = None, activated = True):
+    def __init__(self, cid = None, csecret = None, credentials = None, activated = True, pool_size = 10, keep_alive = True, timeout = 30, fused_search = True, rate_limit = 90, max_retries = 5, cache = False, persistent_cache = False, health_monitor = False, local_resolution = True, id_cache = False):
         """
         :param cid: Client ID
         :param csecret: Client Secret
         :param credentials: If provided, a JWT token for auth requests
         :param: activated: Bot Support - ensures that the program is activated. Default = True
+        :param pool_size: Max number of pooled keep-alive connections to Anilist. Default = 10
+        :param keep_alive: Reuse connections between requests. Default = True
+        :param timeout: Per-request timeout in seconds. Default = 30
+        :param fused_search: Retrieve anime/manga/character info by name with a single request instead of two. Default = True
+        :param rate_limit: Max requests per minute sent to Anilist (None disables pacing and retries). Default = 90
+        :param max_retries: Number of retries for rate limited (429) and 5xx responses. Default = 5
+        :param cache: Keep responses in an in-memory LRU/TTL cache. True or a ResponseCache instance to enable. Default = False
+        :param persistent_cache: Keep responses in the local sqlite database across restarts. True or an SQLiteCache instance to enable. Default = False
+        :param health_monitor: Watch the health of Anilist and answer anime lookups from the local database while it is down. True or a HealthMonitor instance to enable. Default = False
+        :param local_resolution: Resolve anime titles found in the bundled database to their ID locally instead of searching Anilist. Default = True
+        :param id_cache: Keep the IDs that names resolved to (and names that were not found) in the local sqlite database, so repeated lookups skip the search. True or an IDCache instance to enable. Default = False
         """
+        self.rate_limiter = RateLimiter(rate_limit, max_retries=max_retries) if rate_limit is not None else None
+        self.cache = (ResponseCache() if cache == True else cache) or None
+        self.persistent_cache = (SQLiteCache() if persistent_cache == True else persistent_cache) or None
+        self.health_monitor = (HealthMonitor() if health_monitor == True else health_monitor) or None
+        self.id_cache = (IDCache() if id_cache == True else id_cache) or None
+        self.request_handler = RequestHandler(pool_size=pool_size, keep_alive=keep_alive, timeout=timeout,
+                                              rate_limiter=self.rate_limiter, cache=self.cache,
+                                              persistent_cache=self.persistent_cache, health_monitor=self.health_monitor)
         self.access = {'header': {'Content-Type': 'application/json',
                                     'User-Agent': 'AnilistPython (github.com/ReZeroE/AnilistPython)',
                                     'Accept': 'application/json'},
@@ -44,11 +73,12 @@ class Anilist:
                          'apiurl': 'https://graphql.anilist.co',
                          'cid': cid,
                          'csecret': csecret,
-                         'token': credentials}
+                         'token': credentials,
+                         'request_handler': self.request_handler}
 
-        self.anime = Anime(self.access, activated)
-        self.character = Character(self.access, activated)
-        self.manga = Manga(self.access, activated)
+        self.anime = Anime(self.access, activated, fused_search, local_resolution, self.id_cache)
+        self.character = Character(self.access, activated, fused_search, self.id_cache)
+        self.manga = Manga(self.access, activated, fused_search, self.id_cache)
         self.user = User(self.access, activated)
         self.log_data = LogData()
 
@@ -61,37 +91,51 @@ class Anilist:
         api_help.help()
 
     # ANIME =====================================================================================================================
-    def get_anime_id(self, anime_name, manual_select=False) -> int:
+    def get_anime_id(self, anime_name, manual_select=False, timeout=None, deadline=None) -> int:
         '''
         Retrieves the anime ID on Anilist.
 
         :param anime_name: The name of the anime
         :manual_select: prompts the user the top three results to select in the terminal
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: The anime's ID on Anilist. Returns -1 if an error is caught.
         :rtype: int
         '''      
 
-        return self.anime.getAnimeID(anime_name, manual_select)
+        with deadline_scope(timeout, deadline):
+            return self.anime.getAnimeID(anime_name, manual_select)
 
-    def get_anime(self, anime_name, deepsearch=False, manual_select=False) -> dict:
+    def get_anime(self, anime_name, deepsearch=False, manual_select=False, fields=None, timeout=None, deadline=None) -> dict:
         '''
         Retrieve the anime info in the form of a dictionary.
 
         :param anime_name: the name of the anime
         :param deepsearch: deepsearch control value. False by default.
         :manual_select: prompts the user the top three results to select in the terminal
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'average_score']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: parsed dict containing the anime's data
         :rtype: dict
         '''
 
-        # deepsearch
-        if deepsearch == True:
-            ds = DeepSearch()
-            return self.anime.getAnime(ds.deep_search_name_conversion(anime_name), manual_select)
+        with deadline_scope(timeout, deadline):
+            # Anilist is unavailable, search the local database (see HealthMonitor)
+            if self.health_monitor is not None and not self.health_monitor.online:
+                return self._get_anime_offline(anime_name, fields)
 
-        # normal search
-        else:
-            return self.anime.getAnime(anime_name, manual_select)
+            try:
+                # deepsearch
+                if deepsearch == True:
+                    ds = DeepSearch()
+                    return self.anime.getAnime(ds.deep_search_name_conversion(anime_name), manual_select, fields)
+
+                # normal search
+                else:
+                    return self.anime.getAnime(anime_name, manual_select, fields)
+            except CircuitOpenError:
+                return self._get_anime_offline(anime_name, fields)
 
     def get_anime_from_database(self, anime_name) -> list:
         '''
@@ -105,16 +149,87 @@ class Anilist:
         se = SearchEngine()
         return se.search_anime_database(anime_name)
 
-    def get_anime_with_id(self, anime_id) -> dict:
+    def _get_anime_offline(self, anime_name, fields=None) -> dict:
+        '''
+        Local database fallback of get_anime while Anilist is unavailable.
+        '''
+        results = SearchEngine().search_anime_database(anime_name)
+        if len(results) == 0:
+            raise IndexError('Anime Not Found')
+        return Anime.selectFields(results[0], fields)
+
+    def get_anime_with_id(self, anime_id, fields=None, timeout=None, deadline=None) -> dict:
         '''
         Retrieve anime info in the form of a dictionary using the anime's ID.
 
         :param anime_id: The ID of the anime on Anilist
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'average_score']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :rtype: dict
         '''
 
-        return self.anime.getAnimeWithID(anime_id)
+        with deadline_scope(timeout, deadline):
+            try:
+                return self.anime.getAnimeWithID(anime_id, fields)
+            except CircuitOpenError:
+                # Anilist is unavailable, fall back to the local database
+                record = SearchEngine().get_anime_record(anime_id)
+                if record is None:
+                    raise
+                return Anime.selectFields(record, fields)
         
+    def get_anime_with_ids(self, anime_ids, batch_size=25, fields=None, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve the info of many anime at once using their IDs (one request per batch_size IDs).
+
+        :param anime_ids: list of anime IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: list of parsed dicts in the order of anime_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+
+        with deadline_scope(timeout, deadline):
+            try:
+                return self.anime.getAnimeWithIDs(anime_ids, batch_size, fields)
+            except CircuitOpenError:
+                # Anilist is unavailable, fall back to the local database
+                records = SearchEngine().get_anime_records(anime_ids)
+                return [Anime.selectFields(record, fields) if record is not None else None for record in records]
+
+    def iter_anime_search(self, anime_name, page_size=50):
+        '''
+        Iterates over every search result of an anime name, page after page. Pages are only requested as the
+        results are consumed (the next one is prefetched in the background), so breaking out of the loop stops the search.
+
+        :param anime_name: The name of the anime
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: generator of search entries (dicts containing the ID, title and image of each result)
+        :rtype: generator
+        '''
+
+        return self.anime.iterAnimeSearch(anime_name, page_size)
+
+    def get_anime_bulk(self, anime_names, workers=4, progress=None, fields=None, timeout=None) -> list:
+        '''
+        Retrieve the info of many anime by name through a bounded thread pool (see get_anime).
+        Requests stay paced by the rate limiter, and a name that fails (i.e. not found) does not abort the others.
+
+        :param anime_names: list of anime names
+        :param workers: number of lookups running at once. Default = 4
+        :param progress: callback called as progress(done, total, bulk_result) after each name. Default = None
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds per name (a name that runs out records DeadlineExceeded). Default = None
+        :return: list of BulkResult (with .item, .data and .error) in the order of anime_names
+        :rtype: list
+        '''
+
+        fetcher = BulkFetcher(workers)
+        return fetcher.run(lambda name: self.get_anime(name, fields=fields, timeout=timeout), anime_names, progress)
+
     def print_anime_info(self, anime_name):
         '''
         Displays all anime data.
@@ -125,56 +240,140 @@ class Anilist:
 
         self.anime.displayAnimeInfo(anime_name)
 
-    def search_anime(self, genre=None, year=None, score=None, id_only=False) -> list:
+    def search_anime(self, genre=None, year=None, score=None, id_only=False, score_bounds='(]', genre_mode='and',
+                     exclude_genre=None, exclude_year=None, order_by='id', offset=0, limit=None) -> list:
         '''
         Searches anime with genre, season, and/or year. Returns a list of anime within the given restrictions.
         Auto formats the displayed version of the data. (Accesses local database only)
 
-        :param retrieve_count: Max number of anime records to be retrieved. Retrieve all (-1) by default.
         :param genre: The genre of the anime in str or list of str (i.e. 'Action' or ['Action', 'Romance'])
         :param year: The year of the anime in str or list of str (i.e. '2012' or ['2012', '2013'])
-        :param score: The score of the anime in str as in range (i.e. '50' or '50-60' or range(50, 60))
+        :param score: The score of the anime, exact or as a range (i.e. '50', '50-60', '72.5-80', range(50, 60) or (72.5, None))
         :param id_only: Only retrieve the ID of the anime. False by default.
-
-        :return: a list of parsed dict containing the anime's data
+        :param score_bounds: Whether a score range includes its bounds: '(]' excludes the min and includes the max (default), '[]', '[)' or '()'
+        :param genre_mode: 'and' to match anime with every genre (default), 'or' to match anime with any of them
+        :param exclude_genre: Genre(s) the anime must not have, str or list of str (i.e. 'Ecchi' or ['Ecchi', 'Horror'])
+        :param exclude_year: Year(s) the anime must not be released in, str or list of str
+        :param order_by: 'id' (default), or 'score' or 'year' to retrieve the highest first (i.e. the best 10 with order_by='score', limit=10).
+                         'popularity' raises ValueError until the local records hold it
+        :param offset: Number of anime to skip, for paging. Default = 0
+        :param limit: Max number of anime to retrieve. Retrieve all by default.
+
+        :return: a list of parsed dict containing the anime's data (partial records for the anime without a stored
+                 record, see DatabaseSearcher.anime_mix_search), or their IDs with id_only
         :rtype: list
         '''
 
         database_searcher = DatabaseSearcher()
-        return database_searcher.anime_mix_search(genre=genre, year=year, score=score, id_only=id_only)
+        return database_searcher.anime_mix_search(genre=genre, year=year, score=score, id_only=id_only, score_bounds=score_bounds,
+                                                 genre_mode=genre_mode, exclude_genre=exclude_genre, exclude_year=exclude_year,
+                                                 order_by=order_by, offset=offset, limit=limit)
+
+    def sync_database(self, max_pages=None, since=None, batch_size=25, timeout=None, deadline=None) -> dict:
+        '''
+        Updates the local anime database with the anime changed on Anilist since the last sync (see DeltaSync).
+        An interrupted sync (error, timeout or max_pages) resumes where it stopped on the next call.
+
+        :param max_pages: stop after listing this many pages of updated anime (50 per page), None to finish the sync
+        :param since: unix time to sync from instead of the time of the last sync (ignored when resuming)
+        :param batch_size: number of anime retrieved per request. Default = 25
+        :param timeout: max seconds for the sync, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: dict with 'complete', 'pending', 'updated', 'removed' and 'high_water_mark' (see DeltaSync.run)
+        :rtype: dict
+        '''
+
+        with deadline_scope(timeout, deadline):
+            return DeltaSync(self.access, batch_size=batch_size).run(max_pages=max_pages, since=since)
 
     # CHARACTER =================================================================================================================
-    def get_character_id(self, character_name, manual_select=False) -> int:
+    def get_character_id(self, character_name, manual_select=False, timeout=None, deadline=None) -> int:
         '''
         Retrieves the character ID on Anilist.
 
         :param character_name: The character of the anime
         :manual_select: prompts the user the top three results to select in the terminal
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: The character's ID on Anilist. Returns -1 if an error is caught.
         :rtype: int
         '''
-        return self.character.getCharacterID(character_name, manual_select)
+        with deadline_scope(timeout, deadline):
+            return self.character.getCharacterID(character_name, manual_select)
 
-    def get_character(self, character_name, manual_select=False) -> dict:
+    def get_character(self, character_name, manual_select=False, fields=None, timeout=None, deadline=None) -> dict:
         '''
         Retrieve the character info in the form of a dictionary.
 
         :param anime_name: the name of the character
         :manual_select: prompts the user the top three results to select in the terminal
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['first_name', 'image']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: parsed dict containing the character's data
         :rtype: dict
         '''
-        return self.character.getCharacter(character_name, manual_select)
+        with deadline_scope(timeout, deadline):
+            return self.character.getCharacter(character_name, manual_select, fields)
 
-    def get_character_with_id(self, character_id) -> dict:
+    def get_character_with_id(self, character_id, fields=None, timeout=None, deadline=None) -> dict:
         '''
         Retrieve character info in the form of a dictionary with the character's ID on Anilist.
 
         :param character_name: The name of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['first_name', 'image']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: parsed dict containing the character's data
         :rtype: dict
         '''
-        return self.character.getCharacterWithID(character_id)
+        with deadline_scope(timeout, deadline):
+            return self.character.getCharacterWithID(character_id, fields)
+
+    def get_character_with_ids(self, character_ids, batch_size=25, fields=None, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve the info of many characters at once using their IDs (one request per batch_size IDs).
+
+        :param character_ids: list of character IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: list of parsed dicts in the order of character_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        with deadline_scope(timeout, deadline):
+            return self.character.getCharacterWithIDs(character_ids, batch_size, fields)
+
+    def iter_character_search(self, character_name, page_size=50):
+        '''
+        Iterates over every search result of a character name, page after page. Pages are only requested as the
+        results are consumed (the next one is prefetched in the background), so breaking out of the loop stops the search.
+
+        :param character_name: The name of the character
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: generator of search entries (dicts containing the ID, name and image of each result)
+        :rtype: generator
+        '''
+
+        return self.character.iterCharacterSearch(character_name, page_size)
+
+    def get_character_bulk(self, character_names, workers=4, progress=None, fields=None, timeout=None) -> list:
+        '''
+        Retrieve the info of many character by name through a bounded thread pool (see get_character).
+        Requests stay paced by the rate limiter, and a name that fails (i.e. not found) does not abort the others.
+
+        :param character_names: list of character names
+        :param workers: number of lookups running at once. Default = 4
+        :param progress: callback called as progress(done, total, bulk_result) after each name. Default = None
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds per name (a name that runs out records DeadlineExceeded). Default = None
+        :return: list of BulkResult (with .item, .data and .error) in the order of character_names
+        :rtype: list
+        '''
+
+        fetcher = BulkFetcher(workers)
+        return fetcher.run(lambda name: self.get_character(name, fields=fields, timeout=timeout), character_names, progress)
 
     def print_character_info(self, character_name, manual_select=False):
         '''
@@ -187,39 +386,95 @@ class Anilist:
         self.character.displayCharacterInfo(character_name, manual_select)
 
     # Manga =====================================================================================================================
-    def get_manga_id(self, manga_name, manual_select=False) -> int:
+    def get_manga_id(self, manga_name, manual_select=False, timeout=None, deadline=None) -> int:
         '''
         Displays all character data.
         Auto formats the displayed version of the data.
 
         :param character_name: The manga's name
         :manual_select: prompts the user the top three results to select in the terminal
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: the id of the manga
         :rtype: int
         '''
-        return self.manga.getMangaID(manga_name, manual_select)
+        with deadline_scope(timeout, deadline):
+            return self.manga.getMangaID(manga_name, manual_select)
 
-    def get_manga(self, manga_name, manual_select=False) -> dict:
+    def get_manga(self, manga_name, manual_select=False, fields=None, timeout=None, deadline=None) -> dict:
         '''
         Retrieve manga info in the form of a dictionary.
 
         :param manga_name: The name of the manga
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: parsed dict containing the manga's data
         :manual_select: prompts the user the top three results to select in the terminal
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'chapters']). All keys by default.
         :rtype: dict
         '''
 
-        return self.manga.getManga(manga_name, manual_select)
+        with deadline_scope(timeout, deadline):
+            return self.manga.getManga(manga_name, manual_select, fields)
 
-    def get_manga_with_id(self, manga_id) -> dict:
+    def get_manga_with_id(self, manga_id, fields=None, timeout=None, deadline=None) -> dict:
         '''
         Retrieve manga info in the form of a dictionary with the manga's ID on Anilist.
 
         :param manga_id: The id of the manga
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'chapters']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: parsed dict containing the manga's data
         :rtype: dict
         '''
-        return self.manga.getMangaWithID(manga_id)
+        with deadline_scope(timeout, deadline):
+            return self.manga.getMangaWithID(manga_id, fields)
+
+    def get_manga_with_ids(self, manga_ids, batch_size=25, fields=None, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve the info of many manga at once using their IDs (one request per batch_size IDs).
+
+        :param manga_ids: list of manga IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: list of parsed dicts in the order of manga_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        with deadline_scope(timeout, deadline):
+            return self.manga.getMangaWithIDs(manga_ids, batch_size, fields)
+
+    def iter_manga_search(self, manga_name, page_size=50):
+        '''
+        Iterates over every search result of a manga name, page after page. Pages are only requested as the
+        results are consumed (the next one is prefetched in the background), so breaking out of the loop stops the search.
+
+        :param manga_name: The name of the manga
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: generator of search entries (dicts containing the ID, title and image of each result)
+        :rtype: generator
+        '''
+
+        return self.manga.iterMangaSearch(manga_name, page_size)
+
+    def get_manga_bulk(self, manga_names, workers=4, progress=None, fields=None, timeout=None) -> list:
+        '''
+        Retrieve the info of many manga by name through a bounded thread pool (see get_manga).
+        Requests stay paced by the rate limiter, and a name that fails (i.e. not found) does not abort the others.
+
+        :param manga_names: list of manga names
+        :param workers: number of lookups running at once. Default = 4
+        :param progress: callback called as progress(done, total, bulk_result) after each name. Default = None
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds per name (a name that runs out records DeadlineExceeded). Default = None
+        :return: list of BulkResult (with .item, .data and .error) in the order of manga_names
+        :rtype: list
+        '''
+
+        fetcher = BulkFetcher(workers)
+        return fetcher.run(lambda name: self.get_manga(name, fields=fields, timeout=timeout), manga_names, progress)
 
     def print_manga_info(self, manga_name, manual_select=False):
         '''
@@ -232,13 +487,16 @@ class Anilist:
 
         self.manga.displayMangaInfo(manga_name, manual_select)
 
-    def get_user_activity(self, page:int , perpage:int) -> list:
+    def get_user_activity(self, page:int , perpage:int, timeout=None, deadline=None) -> list:
         '''
         Retrieve user activity info in the form of a json object.
         Retrieve json object will be reformatted in a easily accessable json obj.
         :param page: the page of user activity
         :param perpage: how many items per page
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
         :return: parsed list containing the user activity
         :rtype: list
         '''
-        return self.user.GetUserActivity(page, perpage)
\ No newline at end of file
+        with deadline_scope(timeout, deadline):
+            return self.user.GetUserActivity(page, perpage)
\ No newline at end of file
@@ -1,136 +1,176 @@
 import time
 import requests
-from retrieve_data import ExtractInfo
-from retrieve_id import ExtractID
+from .retrieve_data import ExtractInfo
+from .retrieve_id import ExtractID
+from .databases.title_resolver import TitleResolver
+
+# parsers of every key of the anime dict, in display order (QSData.FIELD_PATHS lists the GraphQL fields each key needs)
+ANIME_PARSERS = {
+    'name_romaji':     lambda lvl: lvl['title']['romaji'],
+    'name_english':    lambda lvl: lvl['title']['english'],
+    'starting_time':   lambda lvl: f"{lvl['startDate']['month']}/{lvl['startDate']['day']}/{lvl['startDate']['year']}",
+    'ending_time':     lambda lvl: f"{lvl['endDate']['month']}/{lvl['endDate']['day']}/{lvl['endDate']['year']}",
+    'cover_image':     lambda lvl: lvl['coverImage']['large'],
+    'banner_image':    lambda lvl: lvl['bannerImage'],
+    'airing_format':   lambda lvl: lvl['format'],
+    'airing_status':   lambda lvl: lvl['status'],
+    'airing_episodes': lambda lvl: lvl['episodes'],
+    'season':          lambda lvl: lvl['season'],
+    'desc':            lambda lvl: lvl['description'],
+    'average_score':   lambda lvl: lvl['averageScore'],
+    'genres':          lambda lvl: lvl['genres'],
+    'next_airing_ep':  lambda lvl: lvl['nextAiringEpisode'],
+}
+
 
 class Anime:
-    def __init__(self, access_info, activated=True):
+    def __init__(self, access_info, activated=True, fused_search=True, local_resolution=True, id_cache=None):
         self.extractInfo = ExtractInfo(access_info, activated)
         self.extractID = ExtractID(access_info, activated)
+        self.fused_search = fused_search # resolve the name and retrieve the info with a single request
+        self.title_resolver = TitleResolver() if local_resolution else None # resolve known titles without the search API
+        self.id_cache = id_cache # IDCache of previously searched names (None to disable)
 
 
-    def getAnime(self, anime_name, manual_select=False) -> dict:
+    def getAnime(self, anime_name, manual_select=False, fields=None) -> dict:
         '''
         Retrieve anime info in the form of a json object.
         Retrieve json object will be reformatted in a easily accessable json obj.
 
         :param anime_name: The name of the anime
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'average_score']). All keys by default.
         :return: parsed dict containing the anime's data
         :rtype: dict
         '''
 
+        if manual_select == False:
+            anime_id = self._cachedID(anime_name)
+            if anime_id is not None:
+                return self.getAnimeWithID(anime_id, fields)
+
+        if manual_select == False and self.fused_search == True:
+            data = self.extractID.anime_with_info(anime_name, fields=fields)
+            try:
+                media_lvl = data['data']['Page']['media'][0]
+            except IndexError:
+                self._storeID(anime_name, None)
+                raise IndexError('Anime Not Found')
+            self._storeID(anime_name, media_lvl['id'])
+            return self.parseAnimeInfo(media_lvl, fields)
+
         anime_id = self.getAnimeID(anime_name, manual_select)
         if anime_id == -1:
             return None
 
-        data = self.extractInfo.anime(anime_id)
-        media_lvl = data['data']['Media']
+        data = self.extractInfo.anime(anime_id, fields)
+        return self.parseAnimeInfo(data['data']['Media'], fields)
 
-        name_romaji = media_lvl['title']['romaji']
-        name_english = media_lvl['title']['english']
+        
+    def getAnimeWithID(self, anime_id, fields=None) -> dict:
+        '''
+        Retrieve anime info in the form of a json object.
+        Retrieve json object will be reformatted in a easily accessable json obj.
 
-        start_year = media_lvl['startDate']['year']
-        start_month = media_lvl['startDate']['month']
-        start_day = media_lvl['startDate']['day']
+        :param anime_name: The name of the anime
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'average_score']). All keys by default.
+        :return: parsed dict containing the anime's data
+        :rtype: dict
+        '''
 
-        end_year = media_lvl['endDate']['year']
-        end_month = media_lvl['endDate']['month']
-        end_day = media_lvl['endDate']['day']
+        data = self.extractInfo.anime(anime_id, fields)
+        return self.parseAnimeInfo(data['data']['Media'], fields)
 
-        starting_time = f'{start_month}/{start_day}/{start_year}'
-        ending_time = f'{end_month}/{end_day}/{end_year}'
 
-        cover_image = media_lvl['coverImage']['large']
-        banner_image = media_lvl['bannerImage']
+    def getAnimeWithIDs(self, anime_ids, batch_size=25, fields=None) -> list:
+        '''
+        Retrieve the info of many anime at once using their IDs.
+        IDs are packed into aliased queries of batch_size IDs, so only len(anime_ids) / batch_size requests are made.
+
+        :param anime_ids: list of anime IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :return: list of parsed dicts in the order of anime_ids (None for IDs that were not found)
+        :rtype: list
+        '''
 
-        airing_format = media_lvl['format']
-        airing_status = media_lvl['status']
-        airing_episodes = media_lvl['episodes']
-        season = media_lvl['season']
+        data = self.extractInfo.batch('anime', anime_ids, batch_size, fields)
+        return [self.parseAnimeInfo(media_lvl, fields) if media_lvl is not None else None for media_lvl in data]
 
-        desc = media_lvl['description']
 
-        average_score = media_lvl['averageScore']
-        genres = media_lvl['genres']
+    def iterAnimeSearch(self, anime_name, page_size=50):
+        '''
+        Lazily walks every page of the search results of an anime name (see ExtractID.iter_search).
 
-        next_airing_ep = media_lvl['nextAiringEpisode']
+        :param anime_name: The name of the anime
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: generator of search entries (dicts containing the ID, title and image of each result)
+        :rtype: generator
+        '''
 
-        anime_dict = {"name_romaji": name_romaji,
-                    "name_english": name_english,
-                    "starting_time": starting_time,
-                    "ending_time": ending_time,
-                    "cover_image": cover_image,
-                    "banner_image": banner_image,
-                    "airing_format": airing_format,
-                    "airing_status": airing_status,
-                    "airing_episodes": airing_episodes,
-                    "season": season,
-                    "desc": desc,
-                    "average_score": average_score,
-                    "genres": genres,
-                    "next_airing_ep": next_airing_ep,}
+        return self.extractID.iter_search('anime', anime_name, page_size)
 
-        return anime_dict
 
-        
-    def getAnimeWithID(self, anime_id) -> dict:
+    @staticmethod
+    def parseAnimeInfo(media_lvl, fields=None) -> dict:
         '''
-        Retrieve anime info in the form of a json object.
-        Retrieve json object will be reformatted in a easily accessable json obj.
+        Reformats the Media level of an anime info query into an easily accessable dict.
 
-        :param anime_name: The name of the anime
+        :param media_lvl: the 'Media' obj of the json returned by ExtractInfo.anime
+        :param fields: only return these keys (the query must have been built with the same fields). All keys by default.
         :return: parsed dict containing the anime's data
         :rtype: dict
         '''
 
-        data = self.extractInfo.anime(anime_id)
-        media_lvl = data['data']['Media']
+        if fields is None:
+            return {key: parser(media_lvl) for key, parser in ANIME_PARSERS.items()}
 
-        name_romaji = media_lvl['title']['romaji']
-        name_english = media_lvl['title']['english']
+        for field in fields:
+            if field not in ANIME_PARSERS:
+                raise KeyError(f'Incorrect anime field -> {field}')
+        return {key: parser(media_lvl) for key, parser in ANIME_PARSERS.items() if key in fields}
 
-        start_year = media_lvl['startDate']['year']
-        start_month = media_lvl['startDate']['month']
-        start_day = media_lvl['startDate']['day']
 
-        end_year = media_lvl['endDate']['year']
-        end_month = media_lvl['endDate']['month']
-        end_day = media_lvl['endDate']['day']
+    @staticmethod
+    def selectFields(anime_dict, fields=None) -> dict:
+        '''
+        Keeps the requested keys of an already parsed anime dict (i.e. a record of the local database).
 
-        starting_time = f'{start_month}/{start_day}/{start_year}'
-        ending_time = f'{end_month}/{end_day}/{end_year}'
+        :param anime_dict: parsed dict containing the anime's data
+        :param fields: keys to keep. All keys by default.
+        :return: parsed dict containing only the requested keys
+        :rtype: dict
+        '''
 
-        cover_image = media_lvl['coverImage']['large']
-        banner_image = media_lvl['bannerImage']
+        if fields is None:
+            return anime_dict
 
-        airing_format = media_lvl['format']
-        airing_status = media_lvl['status']
-        airing_episodes = media_lvl['episodes']
-        season = media_lvl['season']
+        for field in fields:
+            if field not in ANIME_PARSERS:
+                raise KeyError(f'Incorrect anime field -> {field}')
+        return {key: value for key, value in anime_dict.items() if key in fields}
 
-        desc = media_lvl['description']
 
-        average_score = media_lvl['averageScore']
-        genres = media_lvl['genres']
+    def _cachedID(self, anime_name):
+        '''
+        Resolves an anime name without the search API: titles of the bundled database (see TitleResolver),
+        then names searched before (see IDCache). None if the name has to be searched on Anilist.
+        '''
+        if self.title_resolver is not None:
+            anime_id = self.title_resolver.resolve(anime_name)
+            if anime_id is not None:
+                return anime_id
 
-        next_airing_ep = media_lvl['nextAiringEpisode']
+        if self.id_cache is None:
+            return None
+        anime_id = self.id_cache.get('anime', anime_name)
+        if anime_id == self.id_cache.NOT_FOUND:
+            raise IndexError('Anime Not Found')
+        return anime_id
 
-        anime_dict = {"name_romaji": name_romaji,
-                    "name_english": name_english,
-                    "starting_time": starting_time,
-                    "ending_time": ending_time,
-                    "cover_image": cover_image,
-                    "banner_image": banner_image,
-                    "airing_format": airing_format,
-                    "airing_status": airing_status,
-                    "airing_episodes": airing_episodes,
-                    "season": season,
-                    "desc": desc,
-                    "average_score": average_score,
-                    "genres": genres,
-                    "next_airing_ep": next_airing_ep,}
 
-        return anime_dict
+    def _storeID(self, anime_name, anime_id):
+        if self.id_cache is not None:
+            self.id_cache.set('anime', anime_name, anime_id)
 
 
     def getAnimeID(self, anime_name, manual_select=False):
@@ -144,6 +184,11 @@ class Anime:
 
         # if manual select is turned off ============================================================================
         if manual_select == False:
+            # titles of the bundled database and names searched before are resolved locally
+            anime_id = self._cachedID(anime_name)
+            if anime_id is not None:
+                return anime_id
+
             anime_list = []
             data = self.extractID.anime(anime_name)
             for i in range(len(data['data']['Page']['media'])):
@@ -154,7 +199,9 @@ class Anime:
             try:
                 anime_ID = data['data']['Page']['media'][0]['id']
             except IndexError:
+                self._storeID(anime_name, None)
                 raise IndexError('Anime Not Found')
+            self._storeID(anime_name, anime_ID)
 
             return anime_ID
 
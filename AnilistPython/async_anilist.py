@@ -0,0 +1,571 @@
+import asyncio
+import contextvars
+
+from .anime import Anime
+from .manga import Manga
+from .character import Character
+from .deep_search import DeepSearch
+from .query_strings import QSData
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .async_request_handler import AsyncRequestHandler
+from .deadline import deadline_scope
+from .health_monitor import HealthMonitor, CircuitOpenError
+from .databases.database_anime_retrieval import DatabaseSearcher
+from .databases.search_engine import SearchEngine
+from .databases.title_resolver import TitleResolver
+from .databases.id_cache import IDCache
+from .databases.sqlite_cache import SQLiteCache
+
+qsObj = QSData()
+
+
+class AsyncAnilist:
+    """
+        Asyncio version of the Anilist driver API (requires aiohttp).
+        Offers the same retrieve operations as Anilist, but every network call is awaited instead of
+        blocking the event loop, so many lookups can run concurrently (i.e. with asyncio.gather).
+        Terminal based functions (manual_select, print_*_info) are not available on this class.
+    """
+    def __init__(self, cid = None, csecret = None, credentials = None, activated = True, pool_size = 100, keep_alive = True, timeout = 30, rate_limit = 90, max_retries = 5, cache = False, persistent_cache = False, health_monitor = False, local_resolution = True, id_cache = False):
+        """
+        :param cid: Client ID
+        :param csecret: Client Secret
+        :param credentials: If provided, a JWT token for auth requests
+        :param: activated: Bot Support - ensures that the program is activated. Default = True
+        :param pool_size: Max number of simultaneous connections to Anilist. Default = 100
+        :param keep_alive: Reuse connections between requests. Default = True
+        :param timeout: Per-request timeout in seconds. Default = 30
+        :param rate_limit: Max requests per minute sent to Anilist (None disables pacing and retries). Default = 90
+        :param max_retries: Number of retries for rate limited (429) and 5xx responses. Default = 5
+        :param cache: Keep responses in an in-memory LRU/TTL cache. True or a ResponseCache instance to enable. Default = False
+        :param persistent_cache: Keep responses in the local sqlite database across restarts. True or an SQLiteCache instance to enable. Default = False
+        :param health_monitor: Watch the health of Anilist and answer anime lookups from the local database while it is down. True or a HealthMonitor instance to enable. Default = False
+        :param local_resolution: Resolve anime titles found in the bundled database to their ID locally instead of searching Anilist. Default = True
+        :param id_cache: Keep the IDs that names resolved to (and names that were not found) in the local sqlite database, so repeated lookups skip the search. True or an IDCache instance to enable. Default = False
+        """
+        self.rate_limiter = RateLimiter(rate_limit, max_retries=max_retries) if rate_limit is not None else None
+        self.cache = (ResponseCache() if cache == True else cache) or None
+        self.persistent_cache = (SQLiteCache() if persistent_cache == True else persistent_cache) or None
+        self.health_monitor = (HealthMonitor() if health_monitor == True else health_monitor) or None
+        self.id_cache = (IDCache() if id_cache == True else id_cache) or None
+        self.request_handler = AsyncRequestHandler(pool_size=pool_size, keep_alive=keep_alive, timeout=timeout,
+                                                   rate_limiter=self.rate_limiter, cache=self.cache,
+                                                   persistent_cache=self.persistent_cache, health_monitor=self.health_monitor)
+        self.access = {'header': {'Content-Type': 'application/json',
+                                    'User-Agent': 'AnilistPython (github.com/ReZeroE/AnilistPython)',
+                                    'Accept': 'application/json'},
+                         'authurl': 'https://anilist.co/api',
+                         'apiurl': 'https://graphql.anilist.co',
+                         'cid': cid,
+                         'csecret': csecret,
+                         'token': credentials}
+        self.activated = activated
+        self.title_resolver = TitleResolver() if local_resolution else None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        '''
+        Closes the underlying connection pool. Should be awaited before the event loop shuts down.
+        '''
+        await self.request_handler.close()
+
+    async def _post(self, query, variables, headers=None, entity=None):
+        if self.activated == False:
+            raise Exception("Current function status is False.")
+
+        return await self.request_handler.post_query(self.access['apiurl'],
+                                                     headers if headers is not None else self.access['header'],
+                                                     query, variables, entity=entity)
+
+    async def _resolve_title(self, anime_name):
+        '''
+        Resolves an anime title with the bundled database (see TitleResolver). None if unknown, ambiguous or disabled.
+        '''
+        if self.title_resolver is None:
+            return None
+        # the title maps are loaded from disk on first use, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.title_resolver.resolve, anime_name)
+
+    async def _cached_id(self, category, name, not_found_msg):
+        '''
+        Resolves a name searched before without the search API (see IDCache). None if it has to be searched on Anilist.
+        '''
+        if self.id_cache is None:
+            return None
+        # the ID cache queries sqlite, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        entity_id = await loop.run_in_executor(None, self.id_cache.get, category, name)
+        if entity_id == self.id_cache.NOT_FOUND:
+            raise IndexError(not_found_msg)
+        return entity_id
+
+    async def _store_id(self, category, name, entity_id):
+        if self.id_cache is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.id_cache.set, category, name, entity_id)
+
+    async def _search_id(self, query, term, page_key, category, not_found_msg):
+        '''
+        Runs a Page search and returns the ID of the top result.
+        '''
+        entity_id = await self._cached_id(category, term, not_found_msg)
+        if entity_id is not None:
+            return entity_id
+
+        data = await self._post(query, {"query": term, "page": 1, "perpage": 3}, entity='search')
+        try:
+            entity_id = data['data']['Page'][page_key][0]['id']
+        except IndexError:
+            await self._store_id(category, term, None)
+            raise IndexError(not_found_msg)
+        await self._store_id(category, term, entity_id)
+        return entity_id
+
+    async def _batch(self, category, ids, batch_size, fields=None):
+        '''
+        Retrieves many entities with aliased queries (see QSData.batchInfoQS). Chunks are sent concurrently.
+        '''
+        if self.activated == False:
+            raise Exception("Current function status is False.")
+
+        found = {}
+
+        # entities kept in the persistent cache are not requested again (only complete entities are cached)
+        entity_cache = self.request_handler.persistent_cache if fields is None else None
+        if entity_cache is not None:
+            def get_entities(entity_ids):
+                entities = {}
+                for entity_id in entity_ids:
+                    entity = entity_cache.get_entity(category, entity_id)
+                    if entity is not None:
+                        entities[entity_id] = entity
+                return entities
+
+            # one trip to the executor for the whole batch, sqlite must not run on the event loop
+            found.update(await self.request_handler._cache_call(entity_cache, get_entities, set(ids)))
+
+        unique_ids = [entity_id for entity_id in dict.fromkeys(ids) if entity_id not in found]
+        chunks = [unique_ids[start:start + batch_size] for start in range(0, len(unique_ids), batch_size)]
+
+        async def fetch_chunk(chunk):
+            id_val = {f"id{i}": chunk_id for i, chunk_id in enumerate(chunk)}
+            # Anilist answers 404 when any ID of the chunk is missing, the other items are still in 'data'
+            extracted_data = await self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                                                   qsObj.batchInfoQS(category, len(chunk), fields), id_val,
+                                                                   entity=category, accept_status=(200, 404))
+            try:
+                chunk_data = extracted_data['data'] or {}
+            except (TypeError, KeyError):
+                raise Exception("Data post unsuccessful. (invalid batch response)")
+            return {chunk_id: chunk_data.get(f"item{i}") for i, chunk_id in enumerate(chunk)}
+
+        fetched = {}
+        for chunk_result in await asyncio.gather(*[fetch_chunk(chunk) for chunk in chunks]):
+            fetched.update(chunk_result)
+        found.update(fetched)
+
+        if entity_cache is not None:
+            def set_entities(entities):
+                for entity_id, entity in entities.items():
+                    if entity is not None:
+                        entity_cache.set_entity(category, entity_id, entity)
+
+            await self.request_handler._cache_call(entity_cache, set_entities, fetched)
+        return [found[entity_id] for entity_id in ids]
+
+    async def _iter_search(self, query, term, page_key, page_size):
+        '''
+        Async generator walking every page of a search. The next page is requested in a background task while the
+        caller consumes the current one; the task is cancelled when the caller stops iterating.
+        '''
+        page_size = max(1, min(page_size, 50))
+        page = 1
+        task = asyncio.ensure_future(self._post(query, {"query": term, "page": page, "perpage": page_size}, entity='search'))
+        try:
+            while task is not None:
+                data = await task
+                try:
+                    page_lvl = data['data']['Page']
+                except (TypeError, KeyError):
+                    raise Exception("Data post unsuccessful. (invalid search page)")
+
+                # prefetch the next page before handing out the results of this one
+                task = None
+                if page_lvl['pageInfo']['hasNextPage'] and len(page_lvl[page_key]) > 0:
+                    page += 1
+                    task = asyncio.ensure_future(self._post(query, {"query": term, "page": page, "perpage": page_size}, entity='search'))
+
+                for entry in page_lvl[page_key]:
+                    yield entry
+        finally:
+            if task is not None:
+                task.cancel()
+
+    # ANIME =====================================================================================================================
+    async def get_anime_id(self, anime_name, timeout=None, deadline=None) -> int:
+        '''
+        Retrieves the anime ID on Anilist.
+
+        :param anime_name: The name of the anime
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: The anime's ID on Anilist.
+        :rtype: int
+        '''
+        with deadline_scope(timeout, deadline):
+            anime_id = await self._resolve_title(anime_name)
+            if anime_id is not None:
+                return anime_id
+            return await self._search_id(qsObj.animeIDQS, anime_name, 'media', 'anime', 'Anime Not Found')
+
+    async def get_anime(self, anime_name, deepsearch=False, fields=None, timeout=None, deadline=None) -> dict:
+        '''
+        Retrieve the anime info in the form of a dictionary.
+
+        :param anime_name: the name of the anime
+        :param deepsearch: deepsearch control value. False by default.
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'average_score']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: parsed dict containing the anime's data
+        :rtype: dict
+        '''
+        with deadline_scope(timeout, deadline):
+            # Anilist is unavailable, search the local database (see HealthMonitor)
+            if self.health_monitor is not None and not self.health_monitor.online:
+                return await self._get_anime_offline(anime_name, fields)
+
+            try:
+                if deepsearch == True:
+                    # the translator is blocking, keep it off the event loop
+                    loop = asyncio.get_running_loop()
+                    anime_name = await loop.run_in_executor(None, contextvars.copy_context().run, DeepSearch().deep_search_name_conversion, anime_name)
+
+                # titles of the bundled database and names searched before only need the info request
+                anime_id = await self._resolve_title(anime_name)
+                if anime_id is None:
+                    anime_id = await self._cached_id('anime', anime_name, 'Anime Not Found')
+                if anime_id is not None:
+                    return await self.get_anime_with_id(anime_id, fields)
+
+                data = await self._post(qsObj.searchInfoQS('anime', fields), {"query": anime_name, "page": 1, "perpage": 1}, entity='search')
+            except CircuitOpenError:
+                return await self._get_anime_offline(anime_name, fields)
+
+            try:
+                media_lvl = data['data']['Page']['media'][0]
+            except IndexError:
+                await self._store_id('anime', anime_name, None)
+                raise IndexError('Anime Not Found')
+            await self._store_id('anime', anime_name, media_lvl['id'])
+            return Anime.parseAnimeInfo(media_lvl, fields)
+
+    async def get_anime_from_database(self, anime_name) -> list:
+        '''
+        Retrieve the anime info in the form of a dictionary (from the local database).
+
+        :param anime_name: the name of the anime
+        :return: a list of dictionaries containing all the search results.
+        :rtype: list
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, SearchEngine().search_anime_database, anime_name)
+
+    async def _get_anime_offline(self, anime_name, fields=None) -> dict:
+        '''
+        Local database fallback of get_anime while Anilist is unavailable.
+        '''
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(None, SearchEngine().search_anime_database, anime_name)
+        if len(results) == 0:
+            raise IndexError('Anime Not Found')
+        return Anime.selectFields(results[0], fields)
+
+    async def get_anime_with_id(self, anime_id, fields=None, timeout=None, deadline=None) -> dict:
+        '''
+        Retrieve anime info in the form of a dictionary using the anime's ID.
+
+        :param anime_id: The ID of the anime on Anilist
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'average_score']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :rtype: dict
+        '''
+        with deadline_scope(timeout, deadline):
+            try:
+                data = await self._post(qsObj.infoQS('anime', fields), {"id": anime_id}, entity='anime')
+            except CircuitOpenError:
+                # Anilist is unavailable, fall back to the local database
+                loop = asyncio.get_running_loop()
+                record = await loop.run_in_executor(None, SearchEngine().get_anime_record, anime_id)
+                if record is None:
+                    raise
+                return Anime.selectFields(record, fields)
+            return Anime.parseAnimeInfo(data['data']['Media'], fields)
+
+    async def get_anime_with_ids(self, anime_ids, batch_size=25, fields=None, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve the info of many anime at once using their IDs (one request per batch_size IDs).
+
+        :param anime_ids: list of anime IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: list of parsed dicts in the order of anime_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        with deadline_scope(timeout, deadline):
+            try:
+                data = await self._batch('anime', anime_ids, batch_size, fields)
+            except CircuitOpenError:
+                # Anilist is unavailable, fall back to the local database
+                loop = asyncio.get_running_loop()
+                records = await loop.run_in_executor(None, SearchEngine().get_anime_records, anime_ids)
+                return [Anime.selectFields(record, fields) if record is not None else None for record in records]
+            return [Anime.parseAnimeInfo(media_lvl, fields) if media_lvl is not None else None for media_lvl in data]
+
+    def iter_anime_search(self, anime_name, page_size=50):
+        '''
+        Iterates over every search result of an anime name, page after page (use with async for).
+        Pages are only requested as the results are consumed. When breaking out of the loop early, wrap the generator
+        in contextlib.aclosing (or await its aclose()) so the prefetched page is cancelled right away.
+
+        :param anime_name: The name of the anime
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: async generator of search entries (dicts containing the ID, title and image of each result)
+        :rtype: async_generator
+        '''
+        return self._iter_search(qsObj.animeIDQS, anime_name, 'media', page_size)
+
+    async def search_anime(self, genre=None, year=None, score=None, id_only=False, score_bounds='(]', genre_mode='and',
+                           exclude_genre=None, exclude_year=None, order_by='id', offset=0, limit=None) -> list:
+        '''
+        Searches anime with genre, season, and/or year. Returns a list of anime within the given restrictions.
+        (Accesses local database only)
+
+        :param genre: The genre of the anime in str or list of str (i.e. 'Action' or ['Action', 'Romance'])
+        :param year: The year of the anime in str or list of str (i.e. '2012' or ['2012', '2013'])
+        :param score: The score of the anime, exact or as a range (i.e. '50', '50-60', '72.5-80', range(50, 60) or (72.5, None))
+        :param id_only: Only retrieve the ID of the anime. False by default.
+        :param score_bounds: Whether a score range includes its bounds: '(]' excludes the min and includes the max (default), '[]', '[)' or '()'
+        :param genre_mode: 'and' to match anime with every genre (default), 'or' to match anime with any of them
+        :param exclude_genre: Genre(s) the anime must not have, str or list of str (i.e. 'Ecchi' or ['Ecchi', 'Horror'])
+        :param exclude_year: Year(s) the anime must not be released in, str or list of str
+        :param order_by: 'id' (default), or 'score' or 'year' to retrieve the highest first (i.e. the best 10 with order_by='score', limit=10).
+                         'popularity' raises ValueError until the local records hold it
+        :param offset: Number of anime to skip, for paging. Default = 0
+        :param limit: Max number of anime to retrieve. Retrieve all by default.
+
+        :return: a list of parsed dict containing the anime's data
+        :rtype: list
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: DatabaseSearcher().anime_mix_search(
+            genre=genre, year=year, score=score, id_only=id_only, score_bounds=score_bounds,
+            genre_mode=genre_mode, exclude_genre=exclude_genre, exclude_year=exclude_year,
+            order_by=order_by, offset=offset, limit=limit))
+
+    # CHARACTER =================================================================================================================
+    async def get_character_id(self, character_name, timeout=None, deadline=None) -> int:
+        '''
+        Retrieves the character ID on Anilist.
+
+        :param character_name: The character of the anime
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: The character's ID on Anilist.
+        :rtype: int
+        '''
+        with deadline_scope(timeout, deadline):
+            return await self._search_id(qsObj.characterIDQS, character_name, 'characters', 'character', 'Character Not Found')
+
+    async def get_character(self, character_name, fields=None, timeout=None, deadline=None) -> dict:
+        '''
+        Retrieve the character info in the form of a dictionary.
+
+        :param character_name: the name of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['first_name', 'image']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: parsed dict containing the character's data
+        :rtype: dict
+        '''
+        with deadline_scope(timeout, deadline):
+            character_id = await self._cached_id('character', character_name, 'Character Not Found')
+            if character_id is not None:
+                return await self.get_character_with_id(character_id, fields)
+
+            data = await self._post(qsObj.searchInfoQS('character', fields), {"query": character_name, "page": 1, "perpage": 1}, entity='search')
+            try:
+                character_lvl = data['data']['Page']['characters'][0]
+            except IndexError:
+                await self._store_id('character', character_name, None)
+                raise IndexError('Character Not Found')
+            await self._store_id('character', character_name, character_lvl['id'])
+            return Character.parseCharacterInfo(character_lvl, fields)
+
+    async def get_character_with_id(self, character_id, fields=None, timeout=None, deadline=None) -> dict:
+        '''
+        Retrieve character info in the form of a dictionary with the character's ID on Anilist.
+
+        :param character_id: The ID of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['first_name', 'image']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: parsed dict containing the character's data
+        :rtype: dict
+        '''
+        with deadline_scope(timeout, deadline):
+            data = await self._post(qsObj.infoQS('character', fields), {"id": character_id}, entity='character')
+            return Character.parseCharacterInfo(data['data']['Character'], fields)
+
+    async def get_character_with_ids(self, character_ids, batch_size=25, fields=None, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve the info of many characters at once using their IDs (one request per batch_size IDs).
+
+        :param character_ids: list of character IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: list of parsed dicts in the order of character_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        with deadline_scope(timeout, deadline):
+            data = await self._batch('character', character_ids, batch_size, fields)
+            return [Character.parseCharacterInfo(character_lvl, fields) if character_lvl is not None else None for character_lvl in data]
+
+    def iter_character_search(self, character_name, page_size=50):
+        '''
+        Iterates over every search result of a character name, page after page (use with async for).
+        Pages are only requested as the results are consumed. When breaking out of the loop early, wrap the generator
+        in contextlib.aclosing (or await its aclose()) so the prefetched page is cancelled right away.
+
+        :param character_name: The name of the character
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: async generator of search entries (dicts containing the ID, name and image of each result)
+        :rtype: async_generator
+        '''
+        return self._iter_search(qsObj.characterIDQS, character_name, 'characters', page_size)
+
+    # Manga =====================================================================================================================
+    async def get_manga_id(self, manga_name, timeout=None, deadline=None) -> int:
+        '''
+        Retrieves the manga ID on Anilist.
+
+        :param manga_name: The manga's name
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: the id of the manga
+        :rtype: int
+        '''
+        with deadline_scope(timeout, deadline):
+            return await self._search_id(qsObj.mangaIDQS, manga_name, 'media', 'manga', 'Manga Not Found')
+
+    async def get_manga(self, manga_name, fields=None, timeout=None, deadline=None) -> dict:
+        '''
+        Retrieve manga info in the form of a dictionary.
+
+        :param manga_name: The name of the manga
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'chapters']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: parsed dict containing the manga's data
+        :rtype: dict
+        '''
+        with deadline_scope(timeout, deadline):
+            manga_id = await self._cached_id('manga', manga_name, 'Manga Not Found')
+            if manga_id is not None:
+                return await self.get_manga_with_id(manga_id, fields)
+
+            data = await self._post(qsObj.searchInfoQS('manga', fields), {"query": manga_name, "page": 1, "perpage": 1}, entity='search')
+            try:
+                media_lvl = data['data']['Page']['media'][0]
+            except IndexError:
+                await self._store_id('manga', manga_name, None)
+                raise IndexError('Manga Not Found')
+            await self._store_id('manga', manga_name, media_lvl['id'])
+            return Manga.parseMangaInfo(media_lvl, fields)
+
+    async def get_manga_with_id(self, manga_id, fields=None, timeout=None, deadline=None) -> dict:
+        '''
+        Retrieve manga info in the form of a dictionary with the manga's ID on Anilist.
+
+        :param manga_id: The id of the manga
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'chapters']). All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: parsed dict containing the manga's data
+        :rtype: dict
+        '''
+        with deadline_scope(timeout, deadline):
+            data = await self._post(qsObj.infoQS('manga', fields), {"id": manga_id}, entity='manga')
+            return Manga.parseMangaInfo(data['data']['Media'], fields)
+
+    async def get_manga_with_ids(self, manga_ids, batch_size=25, fields=None, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve the info of many manga at once using their IDs (one request per batch_size IDs).
+
+        :param manga_ids: list of manga IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: list of parsed dicts in the order of manga_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        with deadline_scope(timeout, deadline):
+            data = await self._batch('manga', manga_ids, batch_size, fields)
+            return [Manga.parseMangaInfo(media_lvl, fields) if media_lvl is not None else None for media_lvl in data]
+
+    def iter_manga_search(self, manga_name, page_size=50):
+        '''
+        Iterates over every search result of a manga name, page after page (use with async for).
+        Pages are only requested as the results are consumed. When breaking out of the loop early, wrap the generator
+        in contextlib.aclosing (or await its aclose()) so the prefetched page is cancelled right away.
+
+        :param manga_name: The name of the manga
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: async generator of search entries (dicts containing the ID, title and image of each result)
+        :rtype: async_generator
+        '''
+        return self._iter_search(qsObj.mangaIDQS, manga_name, 'media', page_size)
+
+    # USER ======================================================================================================================
+    async def get_user_activity(self, page:int , perpage:int, timeout=None, deadline=None) -> list:
+        '''
+        Retrieve user activity info in the form of a json object.
+        :param page: the page of user activity
+        :param perpage: how many items per page
+        :param timeout: max seconds for the whole lookup, every request included (raises DeadlineExceeded). Default = None
+        :param deadline: Deadline shared with other calls (see deadline_scope). Default = None
+        :return: parsed list containing the user activity
+        :rtype: list
+        '''
+        with deadline_scope(timeout, deadline):
+            token = self.access['token']
+            if not token:
+                return None
+
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json"
+            }
+            extracted_user = await self._post(qsObj.user_get_idQS, {}, headers)
+            id_val = {"id": extracted_user["data"]["Viewer"]["id"], "page": page, "perPage": perpage}
+            activity = await self._post(qsObj.user_activyQS, id_val, headers)
+
+            activity_data = activity["data"]
+            if len(activity_data) > 0:
+                return activity_data
+            else:
+                return None
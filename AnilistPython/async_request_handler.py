@@ -0,0 +1,188 @@
+import time
+import asyncio
+from .response_cache import ResponseCache
+from .single_flight import AsyncSingleFlight
+from .deadline import DeadlineExceeded, current_deadline, request_timeout
+from .health_monitor import CircuitOpenError
+from . import json_decoder
+
+
+class AsyncRequestHandler:
+    '''
+    Non-blocking counterpart of RequestHandler used by AsyncAnilist.
+    Requires aiohttp (pip install aiohttp). All lookups made on one event loop share a single connection pool.
+    Requests are paced by the rate limiter without blocking the loop, and 429/5xx responses are retried with backoff.
+    Responses of post_query are served from the in-memory cache, then from the persistent cache, when they are set,
+    and identical queries awaited at the same time by several tasks share a single request.
+    '''
+    def __init__(self, pool_size=100, keep_alive=True, timeout=30, rate_limiter=None, cache=None, persistent_cache=None, health_monitor=None):
+        '''
+        :param pool_size: Max number of simultaneous connections to Anilist. Default = 100
+        :param keep_alive: Reuse connections between requests. Default = True
+        :param timeout: Per-request timeout in seconds (None to wait forever). Default = 30
+        :param rate_limiter: RateLimiter shared by every request (None to send requests unpaced and without retries)
+        :param cache: ResponseCache used by post_query (None to disable caching)
+        :param persistent_cache: SQLiteCache checked after the in-memory cache (None to disable)
+        :param health_monitor: HealthMonitor fed with the outcome of every request, fails fast while its circuit is open (None to disable)
+        '''
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.persistent_cache = persistent_cache
+        self.health_monitor = health_monitor
+        self.single_flight = AsyncSingleFlight()
+
+        self._session = None
+        self._lock = None
+
+    async def _get_session(self):
+        '''
+        Lazily builds the aiohttp session. It has to be created from within a running event loop.
+        '''
+        if self._session is None or self._session.closed:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    try:
+                        import aiohttp
+                    except ModuleNotFoundError:
+                        raise ModuleNotFoundError('AsyncAnilist requires aiohttp. Please run "pip install aiohttp".')
+
+                    connector = aiohttp.TCPConnector(limit=self.pool_size, force_close=not self.keep_alive)
+                    self._session = aiohttp.ClientSession(connector=connector,
+                                                          timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def post(self, url, headers=None, json=None, timeout=None):
+        '''
+        Sends a POST request through the connection pool.
+        Inside a deadline_scope, the timeout of each attempt is capped by the time left, and DeadlineExceeded is raised
+        instead of waiting (for the rate limiter, a backoff or the response) past the deadline.
+
+        :param url: the url of the endpoint
+        :param headers: request headers
+        :param json: the json body of the request
+        :param timeout: overrides the handler's default timeout for this request only
+        :return: the status code and the raw body of the response
+        :rtype: tuple
+        '''
+        session = await self._get_session()
+        import aiohttp
+        if timeout is None:
+            timeout = self.timeout
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve()
+                deadline = current_deadline()
+                if deadline is not None and delay > 0 and delay >= deadline.remaining():
+                    raise DeadlineExceeded(f'Deadline of {deadline.timeout}s exceeded while waiting for the rate limiter ({delay:.1f}s).')
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            if self.health_monitor is not None and not self.health_monitor.allow_request():
+                raise CircuitOpenError(f'Anilist is unavailable ({self.health_monitor.reason}).')
+
+            start = time.monotonic()
+            try:
+                async with session.post(url, headers=headers, json=json,
+                                        timeout=aiohttp.ClientTimeout(total=request_timeout(timeout))) as resp:
+                    status, body, resp_headers = resp.status, await resp.read(), resp.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if self.health_monitor is not None:
+                    self.health_monitor.record(time.monotonic() - start, False)
+                deadline = current_deadline()
+                if isinstance(e, asyncio.TimeoutError) and deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f'Deadline of {deadline.timeout}s exceeded while waiting for Anilist.') from e
+                raise
+
+            if self.health_monitor is not None:
+                self.health_monitor.record(time.monotonic() - start, status < 500)
+
+            if self.rate_limiter is None:
+                return status, body
+
+            self.rate_limiter.update(resp_headers)
+            if not self.rate_limiter.should_retry(status, attempt):
+                return status, body
+
+            self.rate_limiter.backoff(attempt, resp_headers)
+            attempt += 1
+
+    async def post_query(self, url, headers, query, variables, entity=None, accept_status=(200,)):
+        '''
+        Posts a GraphQL query and decodes the json response straight from its raw bytes (see json_decoder).
+        Mirrors RequestHandler.post_query - authenticated requests are never cached.
+
+        :param url: the url of the endpoint
+        :param headers: request headers
+        :param query: GraphQL query string (see QSData)
+        :param variables: the variables of the query
+        :param entity: entity type of the response, picks the cache TTL ('anime', 'manga', 'character', 'search', ...)
+        :param accept_status: status codes that are not an error (None to accept any). Default = (200,)
+        :return: dict or None if the response is not valid json
+        :rtype: dict or NoneType
+        '''
+        caches = []
+        if 'Authorization' not in headers:
+            caches = [cache for cache in (self.cache, self.persistent_cache) if cache is not None]
+
+        body = None
+        for level, cache in enumerate(caches):
+            body = await self._cache_call(cache, cache.get, query, variables)
+            if body is not None:
+                # promote persistent hits to the in-memory cache
+                for upper_cache in caches[:level]:
+                    await self._cache_call(upper_cache, upper_cache.set, query, variables, body, entity)
+                break
+
+        if body is None:
+            flight_key = (url, headers.get('Authorization')) + ResponseCache.make_key(query, variables)
+            send = lambda: self.post(url, headers=headers, json={'query': query, 'variables': variables})
+            deadline = current_deadline()
+            try:
+                status, body = await self.single_flight.do(flight_key, send, timeout=deadline.remaining() if deadline is not None else None)
+            except DeadlineExceeded:
+                # without a deadline of its own, this task only failed because the shared request was cut short
+                # by the deadline of another task
+                if deadline is not None:
+                    raise
+                status, body = await send()
+
+            if accept_status is not None and status not in accept_status:
+                raise Exception(f"Data post unsuccessful. ({status})")
+
+            if status == 200:
+                for cache in caches:
+                    await self._cache_call(cache, cache.set, query, variables, body, entity)
+
+        try:
+            extracted_data = json_decoder.loads(body)
+        except ValueError:
+            return None
+        except TypeError:
+            return None
+        else:
+            return extracted_data
+
+    async def _cache_call(self, cache, method, *args):
+        '''
+        Runs a method of cache. The persistent cache queries sqlite, its calls are sent to the default executor
+        so they never block the event loop (the in-memory cache is fast enough to be called in place).
+        '''
+        if cache is self.persistent_cache:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, method, *args)
+        return method(*args)
+
+    async def close(self):
+        '''
+        Closes every pooled connection.
+        '''
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class BulkResult:
+    '''
+    Outcome of one item of a bulk lookup.
+
+    :ivar item: the name (or ID) that was looked up
+    :ivar data: the parsed dict of the item, None if the lookup failed
+    :ivar error: the exception raised by the lookup, None if it succeeded
+    '''
+    def __init__(self, item, data=None, error=None):
+        self.item = item
+        self.data = data
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        if self.error is not None:
+            return f'BulkResult({self.item!r}, error={self.error!r})'
+        return f'BulkResult({self.item!r}, data={self.data!r})'
+
+
+class BulkFetcher:
+    '''
+    Runs many lookups through a bounded thread pool. Results keep the order of the input, and a failing item is
+    recorded in its BulkResult instead of aborting the whole batch.
+    Every request still goes through the shared request handler, so the rate limiter paces the workers.
+    '''
+    def __init__(self, workers=4):
+        '''
+        :param workers: number of lookups running at once. Default = 4
+        '''
+        if workers < 1:
+            raise ValueError(f'Incorrect number of workers -> {workers}')
+        self.workers = workers
+
+    def run(self, fn, items, progress=None) -> list:
+        '''
+        :param fn: function called with each item (i.e. Anilist.get_anime)
+        :param items: the names or IDs to look up
+        :param progress: callback called as progress(done, total, bulk_result) each time an item completes.
+                         It runs on the calling thread.
+        :return: list of BulkResult in the order of items
+        :rtype: list
+        '''
+        items = list(items)
+        total = len(items)
+        results = [None] * total
+        done = 0
+
+        # only a few items are queued ahead of the workers, so huge inputs do not create one future per item upfront
+        queue_size = self.workers * 2
+        pending = {}
+        next_index = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while next_index < total or pending:
+                while next_index < total and len(pending) < queue_size:
+                    pending[executor.submit(fn, items[next_index])] = next_index
+                    next_index += 1
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = pending.pop(future)
+                    try:
+                        results[index] = BulkResult(items[index], data=future.result())
+                    except Exception as e:
+                        results[index] = BulkResult(items[index], error=e)
+
+                    done += 1
+                    if progress is not None:
+                        progress(done, total, results[index])
+
+        return results
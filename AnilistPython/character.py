@@ -1,73 +1,137 @@
 import time
 import requests
-from retrieve_data import ExtractInfo
-from retrieve_id import ExtractID
+from .retrieve_data import ExtractInfo
+from .retrieve_id import ExtractID
+
+# parsers of every key of the character dict, in display order (QSData.FIELD_PATHS lists the GraphQL fields each key needs)
+CHARACTER_PARSERS = {
+    'first_name':  lambda lvl: lvl['name']['first'],
+    'last_name':   lambda lvl: lvl['name']['last'],
+    'native_name': lambda lvl: lvl['name']['native'],
+    'desc':        lambda lvl: lvl['description'],
+    'image':       lambda lvl: lvl['image']['large'],
+}
+
 
 class Character:
-    def __init__(self, access_info, activated):
+    def __init__(self, access_info, activated, fused_search=True, id_cache=None):
         self.extractInfo = ExtractInfo(access_info, activated)
         self.extractID = ExtractID(access_info, activated)
+        self.fused_search = fused_search # resolve the name and retrieve the info with a single request
+        self.id_cache = id_cache # IDCache of previously searched names (None to disable)
 
 
-    def getCharacter(self, character_name, manual_select=False) -> dict:
+    def getCharacter(self, character_name, manual_select=False, fields=None) -> dict:
         '''
         Retrieve character info in the form of a json object.
         Retrieve json object will be reformatted in a easily accessable json obj.
 
         :param character_name: The name of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['first_name', 'image']). All keys by default.
         :return: parsed dict containing the character's data
         :rtype: dict
         '''
 
+        if manual_select == False:
+            character_id = self._cachedID(character_name)
+            if character_id is not None:
+                return self.getCharacterWithID(character_id, fields)
+
+        if manual_select == False and self.fused_search == True:
+            data = self.extractID.character_with_info(character_name, fields=fields)
+            try:
+                character_lvl = data['data']['Page']['characters'][0]
+            except IndexError:
+                self._storeID(character_name, None)
+                raise IndexError('Character Not Found')
+            self._storeID(character_name, character_lvl['id'])
+            return self.parseCharacterInfo(character_lvl, fields)
+
         character_id = self.getCharacterID(character_name, manual_select)
         if character_id == -1:
             return None
 
-        data = self.extractInfo.character(character_id)
-        character_lvl = data['data']['Character']
+        data = self.extractInfo.character(character_id, fields)
+        return self.parseCharacterInfo(data['data']['Character'], fields)
 
-        first_name = character_lvl['name']['first']
-        last_name = character_lvl['name']['last']
-        native_name = character_lvl['name']['native']
 
-        desc = character_lvl['description']
-        image = character_lvl['image']['large']
+    def getCharacterWithID(self, character_id, fields=None) -> dict:
+        '''
+        Retrieve character info in the form of a json object.
+        Retrieve json object will be reformatted in a easily accessable json obj.
 
-        character_dict = {"first_name": first_name,
-                        "last_name": last_name,
-                        "native_name": native_name,
-                        "desc": desc,
-                        "image": image,}
+        :param character_name: The name of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['first_name', 'image']). All keys by default.
+        :return: parsed dict containing the character's data
+        :rtype: dict
+        '''
+        data = self.extractInfo.character(character_id, fields)
+        return self.parseCharacterInfo(data['data']['Character'], fields)
 
-        return character_dict
 
+    def getCharacterWithIDs(self, character_ids, batch_size=25, fields=None) -> list:
+        '''
+        Retrieve the info of many characters at once using their IDs.
+        IDs are packed into aliased queries of batch_size IDs, so only len(character_ids) / batch_size requests are made.
+
+        :param character_ids: list of character IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :return: list of parsed dicts in the order of character_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        data = self.extractInfo.batch('character', character_ids, batch_size, fields)
+        return [self.parseCharacterInfo(character_lvl, fields) if character_lvl is not None else None for character_lvl in data]
 
-    def getCharacterWithID(self, character_id) -> dict:
+
+    def iterCharacterSearch(self, character_name, page_size=50):
         '''
-        Retrieve character info in the form of a json object.
-        Retrieve json object will be reformatted in a easily accessable json obj.
+        Lazily walks every page of the search results of a character name (see ExtractID.iter_search).
 
         :param character_name: The name of the character
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: generator of search entries (dicts containing the ID, name and image of each result)
+        :rtype: generator
+        '''
+
+        return self.extractID.iter_search('character', character_name, page_size)
+
+
+    @staticmethod
+    def parseCharacterInfo(character_lvl, fields=None) -> dict:
+        '''
+        Reformats the Character level of a character info query into an easily accessable dict.
+
+        :param character_lvl: the 'Character' obj of the json returned by ExtractInfo.character
+        :param fields: only return these keys (the query must have been built with the same fields). All keys by default.
         :return: parsed dict containing the character's data
         :rtype: dict
         '''
-        data = self.extractInfo.character(character_id)
-        character_lvl = data['data']['Character']
 
-        first_name = character_lvl['name']['first']
-        last_name = character_lvl['name']['last']
-        native_name = character_lvl['name']['native']
+        if fields is None:
+            return {key: parser(character_lvl) for key, parser in CHARACTER_PARSERS.items()}
 
-        desc = character_lvl['description']
-        image = character_lvl['image']['large']
+        for field in fields:
+            if field not in CHARACTER_PARSERS:
+                raise KeyError(f'Incorrect character field -> {field}')
+        return {key: parser(character_lvl) for key, parser in CHARACTER_PARSERS.items() if key in fields}
 
-        character_dict = {"first_name": first_name,
-                        "last_name": last_name,
-                        "native_name": native_name,
-                        "desc": desc,
-                        "image": image,}
 
-        return character_dict
+    def _cachedID(self, character_name):
+        '''
+        Resolves a character name searched before without the search API (see IDCache). None if it has to be searched on Anilist.
+        '''
+        if self.id_cache is None:
+            return None
+        character_id = self.id_cache.get('character', character_name)
+        if character_id == self.id_cache.NOT_FOUND:
+            raise IndexError('Character Not Found')
+        return character_id
+
+
+    def _storeID(self, character_name, character_id):
+        if self.id_cache is not None:
+            self.id_cache.set('character', character_name, character_id)
 
 
     def getCharacterID(self, character_name, manual_select=False):
@@ -81,6 +145,11 @@ class Character:
 
         # if manual select is turned off ============================================================================
         if manual_select == False: 
+            # names searched before are resolved locally
+            character_id = self._cachedID(character_name)
+            if character_id is not None:
+                return character_id
+
             character_list = []
             data = self.extractID.character(character_name)
             for i in range(len(data['data']['Page']['characters'])):
@@ -91,7 +160,9 @@ class Character:
             try:
                 character_ID = data['data']['Page']['characters'][0]['id']
             except IndexError:
+                self._storeID(character_name, None)
                 raise IndexError('Character Not Found')
+            self._storeID(character_name, character_ID)
 
             return character_ID
 
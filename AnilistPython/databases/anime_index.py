@@ -0,0 +1,264 @@
+import os
+import json
+import sqlite3
+import threading
+
+from .title_resolver import normalize_title
+from .index_registry import file_stamp
+from .record_store import load_record_store, get_records
+from .. import json_decoder
+
+
+class AnimeIndex:
+    '''
+    Indexed SQLite copy of the anime database files (anime_by_genre/year/score/tag.json and the anime records),
+    stored in anime_index.sqlite3 next to the json files. Lookups by genre, year, score or title are
+    answered with indexed queries instead of loading whole json files.
+    The index is built from the json files the first time it is opened (see build), rebuilt when one of them
+    changes, and can be rebuilt by hand with python -m AnilistPython.databases.anime_index
+    '''
+    SCHEMA_VERSION = 2
+    SOURCES = ['anime_by_genre.json', 'anime_by_year.json', 'anime_by_score.json', 'anime_by_tag.json',
+               'anime_by_id.json', 'anime_by_id_cache.json']
+
+    # order_by of query -> ORDER BY clause (NULLs sort last in descending order)
+    ORDER_BY = {'id': 'id', 'score': 'score DESC, id', 'year': 'year DESC, id'}
+
+    def __init__(self, path=None, storage_dir=None):
+        '''
+        :param path: path of the sqlite database. Default = anime_index.sqlite3 in storage_dir
+        :param storage_dir: directory of the json files the index is built from. Default = databases/anime_database_files
+        '''
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.storage_dir = storage_dir if storage_dir is not None else os.path.join(dir_path, 'anime_database_files')
+        # a file of its own: the bundled anime_database.sqlite3 placeholder is tracked, a build must not rewrite it
+        self.path = path if path is not None else os.path.join(self.storage_dir, 'anime_index.sqlite3')
+
+        self._local = threading.local()
+        self._genres = None
+        self._years = None
+
+        if not self.is_built():
+            self.build()
+
+    def _connect(self) -> sqlite3.Connection:
+        '''
+        sqlite connections can not be shared between threads, every thread opens its own.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @classmethod
+    def source_paths(cls, storage_dir) -> list:
+        '''
+        :param storage_dir: directory of the json files
+        :return: paths of the json files the index is built from
+        :rtype: list
+        '''
+        return [os.path.join(storage_dir, filename) for filename in cls.SOURCES]
+
+    def is_built(self) -> bool:
+        '''
+        :return: True if the index tables exist and were built with the current schema from the current json files
+        :rtype: bool
+        '''
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'anime_index_meta'").fetchone() is None:
+            return False
+        meta = dict(conn.execute('SELECT key, value FROM anime_index_meta'))
+        return (meta.get('schema_version') == str(self.SCHEMA_VERSION)
+                and meta.get('sources') == json.dumps(file_stamp(self.source_paths(self.storage_dir))))
+
+    def _load_json(self, filename):
+        with open(os.path.join(self.storage_dir, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def build(self) -> int:
+        '''
+        (Re)builds the index from the json files in a single transaction, so readers never see a partial index.
+
+        :return: number of indexed anime
+        :rtype: int
+        '''
+        sources = json.dumps(file_stamp(self.source_paths(self.storage_dir)))
+        genre_dict = self._load_json('anime_by_genre.json')
+        year_dict = self._load_json('anime_by_year.json')
+        score_dict = self._load_json('anime_by_score.json')
+        tag_dict = self._load_json('anime_by_tag.json')
+        records = load_record_store(self.storage_dir).items()
+
+        anime = {}
+        for year, ids in year_dict.items():
+            for anime_id in ids:
+                anime[int(anime_id)] = [None if year == 'None' else int(year), None, None, None]
+        for score, ids in score_dict.items():
+            for anime_id in ids:
+                anime.setdefault(int(anime_id), [None, None, None, None])[1] = int(score)
+        for anime_id, record in records:
+            anime.setdefault(int(anime_id), [None, None, None, None])[2:] = [record.get('popularity'), json_decoder.dumps(record)]
+
+        conn = self._connect()
+        with conn:
+            # sqlite3 does not open a transaction for DDL statements by itself
+            conn.execute('BEGIN IMMEDIATE')
+            for table in ('anime_index_meta', 'anime', 'anime_genres', 'anime_titles'):
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+
+            conn.execute('''CREATE TABLE anime (
+                                id INTEGER PRIMARY KEY,
+                                year INTEGER,
+                                score INTEGER,
+                                popularity INTEGER,
+                                record BLOB)''')
+            conn.execute('CREATE INDEX idx_anime_year ON anime (year)')
+            conn.execute('CREATE INDEX idx_anime_score ON anime (score)')
+            conn.execute('''CREATE TABLE anime_genres (
+                                genre TEXT NOT NULL,
+                                id INTEGER NOT NULL,
+                                PRIMARY KEY (genre, id)) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE anime_titles (
+                                title TEXT NOT NULL,
+                                id INTEGER NOT NULL)''')
+            conn.execute('CREATE INDEX idx_anime_titles_title ON anime_titles (title)')
+            conn.execute('CREATE TABLE anime_index_meta (key TEXT PRIMARY KEY, value TEXT)')
+
+            conn.executemany('INSERT INTO anime (id, year, score, popularity, record) VALUES (?, ?, ?, ?, ?)',
+                             ((anime_id, *columns) for anime_id, columns in anime.items()))
+            conn.executemany('INSERT OR IGNORE INTO anime_genres (genre, id) VALUES (?, ?)',
+                             ((genre, int(anime_id)) for genre, ids in genre_dict.items() for anime_id in ids))
+            conn.executemany('INSERT INTO anime_titles (title, id) VALUES (?, ?)',
+                             ((normalize_title(title), int(anime_id)) for tags, anime_id in tag_dict.items()
+                              for title in set(tags.split('|=|'))))
+            conn.executemany('INSERT INTO anime_index_meta (key, value) VALUES (?, ?)',
+                             [('schema_version', str(self.SCHEMA_VERSION)), ('sources', sources)])
+
+        self._genres = None
+        self._years = None
+        return len(anime)
+
+    def genres(self) -> set:
+        '''
+        :return: the genres of the index (lower case, i.e. 'sci-fi')
+        :rtype: set
+        '''
+        if self._genres is None:
+            self._genres = {row[0] for row in self._connect().execute('SELECT DISTINCT genre FROM anime_genres')}
+        return self._genres
+
+    def years(self) -> set:
+        '''
+        :return: the release years of the index (None for anime without a start date)
+        :rtype: set
+        '''
+        if self._years is None:
+            self._years = {row[0] for row in self._connect().execute('SELECT DISTINCT year FROM anime')}
+        return self._years
+
+    def query(self, genres=None, years=None, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True,
+              genre_mode='and', exclude_genres=None, exclude_years=None, order_by='id', offset=0, limit=None, id_only=False) -> list:
+        '''
+        Runs an indexed search. Every given restriction must match (sqlite picks the most selective index).
+        The page is cut with LIMIT / OFFSET, so only its records are read and decoded.
+
+        :param genres: list of genres the anime must all have (lower case)
+        :param years: list of release years the anime must be in one of (None matches anime without a start date)
+        :param min_score: lower bound of the average score (-1 for unscored anime, floats allowed)
+        :param max_score: upper bound of the average score (floats allowed)
+        :param min_inclusive: include anime scored exactly min_score. Default = False
+        :param max_inclusive: include anime scored exactly max_score. Default = True
+        :param genre_mode: 'and' to match anime with every genre (default), 'or' to match anime with any of them
+        :param exclude_genres: list of genres the anime must not have
+        :param exclude_years: list of release years the anime must not be in
+        :param order_by: 'id' (default), or 'score' or 'year' to retrieve the highest first (ties by ID)
+        :param offset: number of results to skip. Default = 0
+        :param limit: max number of results (None for all of them). Default = None
+        :param id_only: only retrieve the IDs of the anime. False by default.
+        :return: list of anime IDs (str) or anime records. Anime without a stored record get a partial record
+                 (see load_partial_records), so both modes find the same anime.
+        :rtype: list
+        '''
+        if order_by == 'popularity':
+            raise ValueError('Incorrect order -> popularity. The local anime records hold no popularity to sort by yet.')
+        if order_by not in self.ORDER_BY:
+            raise KeyError(f'Incorrect order -> {order_by}')
+
+        clauses = []
+        params = []
+        if genres and genre_mode == 'and':
+            for genre in genres:
+                clauses.append('id IN (SELECT id FROM anime_genres WHERE genre = ?)')
+                params.append(genre)
+        elif genres:
+            clauses.append(f'id IN (SELECT id FROM anime_genres WHERE genre IN ({", ".join("?" * len(genres))}))')
+            params += genres
+        if exclude_genres:
+            clauses.append(f'id NOT IN (SELECT id FROM anime_genres WHERE genre IN ({", ".join("?" * len(exclude_genres))}))')
+            params += exclude_genres
+
+        if years:
+            clauses.append(self._year_clause(years, params))
+        if exclude_years:
+            clauses.append(f'NOT {self._year_clause(exclude_years, params)}')
+
+        if min_score is not None:
+            clauses.append('score >= ?' if min_inclusive else 'score > ?')
+            params.append(min_score)
+        if max_score is not None:
+            clauses.append('score <= ?' if max_inclusive else 'score < ?')
+            params.append(max_score)
+
+        where = ' AND '.join(clauses) if clauses else '1'
+        page = f'ORDER BY {self.ORDER_BY[order_by]} LIMIT ? OFFSET ?'
+        params += [-1 if limit is None else limit, offset]
+        conn = self._connect()
+        if id_only:
+            return [str(row[0]) for row in conn.execute(f'SELECT id FROM anime WHERE {where} {page}', params)]
+        rows = conn.execute(f'SELECT id, record FROM anime WHERE {where} {page}', params).fetchall()
+        records = [json_decoder.loads(record) if record is not None else None for _, record in rows]
+        missing = [i for i, record in enumerate(records) if record is None]
+        if missing:
+            for i, record in zip(missing, get_records([rows[i][0] for i in missing], self.storage_dir)):
+                records[i] = record
+        return records
+
+    @staticmethod
+    def _year_clause(years, params) -> str:
+        known = [year for year in years if year is not None]
+        year_clauses = []
+        if known:
+            year_clauses.append(f'year IN ({", ".join("?" * len(known))})')
+            params += known
+        if None in years:
+            year_clauses.append('year IS NULL')
+        # year is NULL for anime without a start date, make sure the clause is never NULL (NOT NULL is not true)
+        return '(' + ' OR '.join(year_clauses) + ' AND year IS NOT NULL' * (None not in years) + ')'
+
+    def title_ids(self, title) -> list:
+        '''
+        :param title: an english or romaji title (matched after normalize_title)
+        :return: the IDs of the anime with this title
+        :rtype: list
+        '''
+        return [row[0] for row in self._connect().execute('SELECT DISTINCT id FROM anime_titles WHERE title = ?',
+                                                          (normalize_title(title),))]
+
+    def close(self):
+        '''
+        Closes the connection of the calling thread.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+if __name__ == '__main__':
+    import time
+    start = time.time()
+    index = AnimeIndex()
+    print(f'Indexed {index.build()} anime into {index.path} in {time.time() - start:.2f}s')
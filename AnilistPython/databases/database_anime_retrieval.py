@@ -1,9 +1,31 @@
 import os
 import sys
 import json
+import heapq
+import sqlite3
+
+from .anime_index import AnimeIndex
+from .local_catalog import LocalCatalog
+from .postings_index import PostingsIndex, bisect_scores
+from .index_registry import index_registry
+from .record_store import get_records
+
+# indexes anime_mix_search can run on, the json files are searched directly otherwise
+INDEX_BACKENDS = {'postings': PostingsIndex, 'sqlite': AnimeIndex, 'catalog': LocalCatalog}
+
+# score_bounds of anime_mix_search -> (min score included, max score included)
+SCORE_BOUNDS = {'(]': (False, True), '[]': (True, True), '[)': (True, False), '()': (False, False)}
+
+# order_by of anime_mix_search, every order but 'id' retrieves the highest first
+ORDER_BY = ('id', 'score', 'year')
 
 class DatabaseSearcher:
-    def __init__(self):
+    def __init__(self, backend='postings'):
+        '''
+        :param backend: 'postings' to search the mmap-ed postings arrays (see PostingsIndex), 'sqlite' to search the
+                        indexed database (see AnimeIndex), 'catalog' to filter the in-memory columns (see LocalCatalog),
+                        'json' to search the json files. Default = 'postings'
+        '''
         self.dir_path = os.path.dirname(os.path.realpath(__file__))
         self.storage_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anime_database_files')
 
@@ -12,164 +34,281 @@ class DatabaseSearcher:
         self.score_dict_dir = os.path.join(self.storage_dir, "anime_by_score.json")
         self.year_dict_dir = os.path.join(self.storage_dir, "anime_by_year.json")
 
+        self.index = None
+        if backend in INDEX_BACKENDS:
+            try:
+                self.index = self.load_index(backend)
+            except (sqlite3.Error, OSError, ValueError):
+                pass # the index can not be created (i.e. read-only install), search the json files instead
+        elif backend != 'json':
+            raise KeyError(f'Incorrect database backend -> {backend}')
+
 
 
-    def anime_mix_search(self, retrieve_count=None, genre=None, year=None, score=None, id_only=False) -> list:
+    def anime_mix_search(self, retrieve_count=None, genre=None, year=None, score=None, id_only=False, score_bounds='(]',
+                         genre_mode='and', exclude_genre=None, exclude_year=None, order_by='id', offset=0, limit=None) -> list:
         '''
-        Search anime with the given retriction/parameters.
+        Search anime with the given retriction/parameters. Results are ordered by ID unless order_by is given.
 
-        :param retrieve_count: Max number of anime records to be retrieved. Retrieve all (-1) by default.
+        :param retrieve_count: Max number of anime records to be retrieved (same as limit). Retrieve all (-1) by default.
         :param genre: The genre of the anime in str or list of str (i.e. 'Action' or ['Action', 'Romance'])
         :param year: The year of the anime in str or list of str (i.e. '2012' or ['2012', '2013'])
-        :param score: The score of the anime in str as in range (i.e. '50' or '50-60')
+        :param score: The score of the anime, exact or as a range (i.e. '50', '50-60', '72.5-80', range(50, 60) or (72.5, None))
         :param id_only: Only retrieve the ID of the anime. False by default.
-
-        :return: a list of dictionaries containing the anime within the given restrictions.
+        :param score_bounds: Whether a score range includes its bounds: '(]' excludes the min and includes the max (default), '[]', '[)' or '()'
+        :param genre_mode: 'and' to search anime with every genre (default), 'or' to search anime with any of them
+        :param exclude_genre: Leave out anime of this genre or of any of these genres (i.e. 'Hentai' or ['Ecchi', 'Hentai'])
+        :param exclude_year: Leave out anime released in this year or in any of these years (i.e. 2012 or [2012, 'None'])
+        :param order_by: 'id' (default), or 'score' or 'year' to retrieve the highest first (ties ordered by ID).
+                         'popularity' raises ValueError: no local record holds it, the order would be the ID order.
+        :param offset: Number of anime to skip, for paging. Default = 0
+        :param limit: Max number of anime to retrieve. Retrieve all (None or -1) by default.
+
+        :return: a list of dictionaries containing the anime within the given restrictions (the IDs with id_only).
+                 The same anime are found in both modes: anime without a stored record (most of the bundled database)
+                 get a partial record with 'partial': True, see load_partial_records.
         :rtype: list
         '''
-        if genre == None and year == None and score == None:
+        if genre == None and year == None and score == None and exclude_genre == None and exclude_year == None:
             print('Warning -> You have not specified any restrictions (parameters) for this anime search.')
             print("Please use .getAnime(anime_name) if you wish to retrieve an anime's data without any retrictive parameters")
             sys.exit(1)
 
-        options_list = []
+        if genre_mode not in ('and', 'or'):
+            raise KeyError(f'Incorrect genre mode -> {genre_mode}')
+        if order_by == 'popularity':
+            raise ValueError('Incorrect order -> popularity. The local anime records hold no popularity to sort by yet.')
+        if order_by not in ORDER_BY:
+            raise KeyError(f'Incorrect order -> {order_by}')
+
+        if limit is None:
+            limit = retrieve_count
+        if limit is not None and (not isinstance(limit, int) or limit < -1):
+            raise KeyError(f'Incorrect limit -> {limit}')
+        if not isinstance(offset, int) or offset < 0:
+            raise KeyError(f'Incorrect offset -> {offset}')
+        if limit == -1:
+            limit = None
+
+        if self.index is not None:
+            known_genres, known_years = self.index.genres(), self.index.years()
+        else:
+            known_genres = set(self.load_json(self.genre_dict_dir))
+            known_years = {None if y == 'None' else int(y) for y in self.load_json(self.year_dict_dir)}
 
-        # Genre Restriction
-        genre_option_list = []
-        if isinstance(genre, str):
-            genre_dict = self.load_json(self.genre_dict_dir)
-            if genre == 'scifi': genre = 'sci-fi'
-            try:
-                genre_option_list = genre_dict[genre.strip().lower()]
-            except KeyError:
-                raise KeyError(f'Incorrect genre category -> {genre.strip().lower()}. For the full genre list, please visit <https://github.com/ReZeroE/AnilistPython>.')
+        genres = self.parse_genres(genre, known_genres)
+        years = self.parse_years(year, known_years)
+        exclude_genres = self.parse_genres(exclude_genre, known_genres)
+        exclude_years = self.parse_years(exclude_year, known_years)
 
-        elif isinstance(genre, list):
-            genre_dict = self.load_json(self.genre_dict_dir)
+        # Avg Score Striction
+        min_score, max_score, min_inclusive, max_inclusive = None, None, False, True
+        if score != None:
+            min_score, max_score, min_inclusive, max_inclusive = self.parse_score(score, score_bounds)
+
+        query = dict(genres=genres, years=years, min_score=min_score, max_score=max_score, min_inclusive=min_inclusive,
+                     max_inclusive=max_inclusive, genre_mode=genre_mode, exclude_genres=exclude_genres,
+                     exclude_years=exclude_years, order_by=order_by, offset=offset, limit=limit, id_only=id_only)
+        if self.index is not None:
+            return self.index.query(**query)
+        return self.json_mix_search(**query)
+
+    def json_mix_search(self, genres=None, years=None, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True,
+                        genre_mode='and', exclude_genres=None, exclude_years=None, order_by='id', offset=0, limit=None, id_only=False) -> list:
+        '''
+        anime_mix_search on the json files (same parameters as PostingsIndex.query).
+        The ID list of each restriction is known before intersecting, the smallest one is intersected first.
+        With a limit, the page is selected with a heap of offset + limit anime instead of sorting the whole result.
+        '''
+        genre_dict = self.load_json(self.genre_dict_dir)
+        year_dict = self.load_json(self.year_dict_dir)
+        scores, offsets, score_ids = self.load_score_index()
+
+        option_lists = []
+        if genres:
+            if genre_mode == 'and':
+                option_lists += [genre_dict[g] for g in genres]
+            else:
+                option_lists.append(list(set().union(*(genre_dict[g] for g in genres))))
+        if years:
+            option_lists.append([anime_id for y in years for anime_id in year_dict[str(y)]])
+        if min_score is not None or max_score is not None:
+            start, stop = bisect_scores(scores, min_score, max_score, min_inclusive, max_inclusive)
+            option_lists.append(score_ids[offsets[start]:offsets[stop]])
+
+        # smallest list first, every intersection can only shrink the result
+        option_lists.sort(key=len)
+        resulting_set = set(option_lists[0]) if option_lists else set(score_ids)
+        for option_list in option_lists[1:]:
+            if not resulting_set:
+                break
+            resulting_set.intersection_update(option_list)
+
+        for g in exclude_genres or []:
+            resulting_set.difference_update(genre_dict[g])
+        for y in exclude_years or []:
+            resulting_set.difference_update(year_dict[str(y)])
+
+        if order_by == 'id':
+            sort_key = int
+        else:
+            keys = self.load_sort_keys(order_by)
+            sort_key = lambda anime_id: (-keys.get(anime_id, float('-inf')), int(anime_id))
+        if limit is None:
+            resulting_list = sorted(resulting_set, key=sort_key)[offset:]
+        else:
+            resulting_list = heapq.nsmallest(offset + limit, resulting_set, key=sort_key)[offset:]
 
-            first = True
-            for g in genre:
-                if g == 'scifi': g = 'sci-fi'
-                try:
-                    temp_list = genre_dict[g.strip().lower()]
-                except KeyError:
-                    raise KeyError(f'Incorrect genre category -> {g.strip().lower()}. For the full genre list, please visit <https://github.com/ReZeroE/AnilistPython>.')
-
-                if first:
-                    genre_option_list = temp_list
-                    first = False
-                else:
-                    genre_option_list = list(set(temp_list) & set(genre_option_list))
-        elif genre != None:
+        if id_only:
+            return resulting_list
+        return get_records(resulting_list, self.storage_dir)
+
+    def parse_genres(self, genre, known_genres) -> list:
+        '''
+        :param genre: genre restriction of anime_mix_search (str or list of str)
+        :param known_genres: the genres of the database
+        :return: the lower case genres (None without restriction)
+        :rtype: list
+        '''
+        if genre == None:
+            return None
+        if not isinstance(genre, (str, list)):
             print("Error -> paramter genre needs to be a str or list. (i.e. 'Action' or ['Action', 'Romance'])")
             sys.exit(1)
 
+        genres = []
+        for g in ([genre] if isinstance(genre, str) else genre):
+            if g == 'scifi': g = 'sci-fi'
+            if g.strip().lower() not in known_genres:
+                raise KeyError(f'Incorrect genre category -> {g.strip().lower()}. For the full genre list, please visit <https://github.com/ReZeroE/AnilistPython>.')
+            genres.append(g.strip().lower())
+        return list(dict.fromkeys(genres))
 
-        # Year Retriction
-        temp_list = []
-        year_option_list = []
-        if isinstance(year, int):
-            year = str(year)
-        if isinstance(year, str):
-            year_dict = self.load_json(self.year_dict_dir)
-            year_option_list += year_dict[year]
-        elif isinstance(year, list):
-            if len(year) > 0 and isinstance(year[0], int):
-                year = [str(y) for y in year]
-
-            year_dict = self.load_json(self.year_dict_dir)
-            for y in year:
-
-                try:
-                    temp_list = year_dict[y]
-                    year_option_list += year_dict[y]
-                except KeyError:
-                    raise KeyError(f'Incorrect year value entered -> {y}')
-
-
-        elif year != None:
+    def parse_years(self, year, known_years) -> list:
+        '''
+        :param year: year restriction of anime_mix_search (int, str or list of them)
+        :param known_years: the release years of the database (None for anime without a start date)
+        :return: the years as int (None for anime without a start date, None without restriction)
+        :rtype: list
+        '''
+        if year == None:
+            return None
+        if not isinstance(year, (int, str, list)):
             print("Error -> paramter year needs to be a str or list. (i.e. '2012' or ['2012', '2013'])")
             sys.exit(1)
 
+        years = []
+        for y in (year if isinstance(year, list) else [year]):
+            y = str(y)
+            try:
+                y = None if y == 'None' else int(y)
+            except ValueError:
+                raise KeyError(f'Incorrect year value entered -> {y}')
+            if y not in known_years:
+                raise KeyError(f'Incorrect year value entered -> {y}')
+            years.append(y)
+        return list(dict.fromkeys(years))
+
+    def parse_score(self, score, score_bounds='(]') -> tuple:
+        '''
+        Parses the score restriction of anime_mix_search. An exact score is the range [score, score].
 
-        # Avg Score Striction
-        score_option_list = []
-        if isinstance(score, int):
+        :param score: exact score (i.e. 75 or '75'), or range as 'min-max', range(min, max) or (min, max) (None for an open end)
+        :param score_bounds: '(]', '[]', '[)' or '()' (ignored for exact scores)
+        :return: (min score, max score, min inclusive, max inclusive)
+        :rtype: tuple
+        '''
+        if score_bounds not in SCORE_BOUNDS:
+            raise KeyError(f'Incorrect score bounds -> {score_bounds}')
+        min_inclusive, max_inclusive = SCORE_BOUNDS[score_bounds]
+
+        if isinstance(score, (int, float)) and not isinstance(score, bool):
             score = str(score)
         if isinstance(score, str):
-            score_dict = self.load_json(self.score_dict_dir)
-
-            if score.find('-') != -1:
-                min_score = score.split('-')[0]
-                max_score = score.split('-')[1]
-
+            # '-1' is the score of unscored anime, the range separator comes after the min score
+            separator = score.find('-', 1)
+            if separator != -1:
                 try:
-                    min_score = int(min_score)
-                    max_score = int(max_score)
+                    return float(score[:separator]), float(score[separator + 1:]), min_inclusive, max_inclusive
                 except Exception:
                     print(f'parameter score incorrect.')
                     raise Exception
+            try:
+                exact_score = float(score)
+                if not -1 <= exact_score <= 100:
+                    raise ValueError
+            except Exception:
+                print(f'Parameter score incorrect -> only value 0-100 are accepted')
+                raise Exception
+            return exact_score, exact_score, True, True
+        if isinstance(score, range):
+            return score.start, score.stop, min_inclusive, max_inclusive
+        if isinstance(score, (tuple, list)) and len(score) == 2:
+            return score[0], score[1], min_inclusive, max_inclusive
+
+        print("Error -> paramter score needs to be a number, str, range or (min, max) tuple. (i.e. 75, '50-60', range(50, 60) or (72.5, None))")
+        sys.exit(1)
+
+    def load_score_index(self) -> tuple:
+        '''
+        Sorted score index of the json search: the sorted scores, the offset of each score's anime in the
+        concatenated ID list, and that list. A score range is then two binary searches and one slice.
+        Built once per process (see IndexRegistry).
 
-                for key, val in score_dict.items():
-                    if int(key) > max_score:
-                        break
-
-                    if int(key) > min_score:
-                        score_option_list += val
-            else:
-                try:
-                    score_option_list += score_dict[score]
-                except Exception:
-                    print(f'Parameter score incorrect -> only value 0-100 are accepted')
-                    raise Exception
-        elif isinstance(score, range):
-
-            min_score = score.start
-            max_score = score.stop
-
-            score_dict = self.load_json(self.score_dict_dir)
-            for key, val in score_dict.items():
-                if int(key) > max_score:
-                    break
-
-                if int(key) > min_score:
-                    score_option_list += val
-
-
-
-        resulting_list = []
-        if genre != None and year != None and score != None:
-            resulting_list = list(set(genre_option_list) & set(year_option_list) & set(score_option_list))
-
-        elif genre != None and year != None:
-            resulting_list = list(set(genre_option_list) & set(year_option_list))
-        elif genre != None and score != None:
-            resulting_list = list(set(genre_option_list) & set(score_option_list))
-        elif year != None and score != None:
-            resulting_list = list(set(year_option_list) & set(score_option_list))
-
-        elif genre != None:
-            resulting_list = genre_option_list
-        elif year != None:
-            resulting_list = year_option_list
-        elif score != None:
-            resulting_list = score_option_list
-            
-        
-        return_list = []
-
-        if id_only == False:
-            id_dict = self.load_json(self.id_dict_dir)
-            for anime_id in resulting_list:
-                return_list.append(id_dict[anime_id])
-        else:
-            return resulting_list
+        :return: (scores, offsets, IDs)
+        :rtype: tuple
+        '''
+        def build_score_index():
+            score_dict = self.read_json(self.score_dict_dir)
+            scores = sorted(score_dict, key=float)
+            offsets = [0]
+            score_ids = []
+            for score in scores:
+                score_ids += score_dict[score]
+                offsets.append(len(score_ids))
+            return [float(score) for score in scores], offsets, score_ids
+        return index_registry.get(('score_index', self.score_dict_dir), build_score_index, [self.score_dict_dir])
+
+    def load_sort_keys(self, order_by) -> dict:
+        '''
+        Sort keys of an ordered json search, built once per process (see IndexRegistry).
 
-        return return_list
+        :param order_by: 'score' or 'year'
+        :return: dict of {anime ID (str): score or year}, anime without a value are left out
+        :rtype: dict
+        '''
+        def build_sort_keys():
+            if order_by == 'score':
+                return {anime_id: float(score) for score, ids in self.read_json(self.score_dict_dir).items() for anime_id in ids}
+            return {anime_id: int(year) for year, ids in self.read_json(self.year_dict_dir).items() if year != 'None' for anime_id in ids}
+        sources = {'score': [self.score_dict_dir], 'year': [self.year_dict_dir]}[order_by]
+        return index_registry.get(('sort_keys', order_by, self.storage_dir), build_sort_keys, sources)
+
+    def load_catalog(self) -> LocalCatalog:
+        '''
+        :return: the columnar catalog of the local database, shared by the process (see IndexRegistry)
+        :rtype: LocalCatalog
+        '''
+        return self.load_index('catalog')
 
+    def load_index(self, backend):
+        '''
+        Opens an index once per process (see IndexRegistry), again when its json files change.
 
+        :param backend: 'postings', 'sqlite' or 'catalog'
+        :rtype: PostingsIndex, AnimeIndex or LocalCatalog
+        '''
+        index_class = INDEX_BACKENDS[backend]
+        return index_registry.get(('index', backend, self.storage_dir),
+                                  lambda: index_class(storage_dir=self.storage_dir), index_class.source_paths(self.storage_dir))
 
     def load_json(self, filename):
+        '''
+        Loads a json file once per process (see IndexRegistry), again when it changes. The dict is shared, do not modify it.
+        '''
+        return index_registry.get(('json', filename), lambda: self.read_json(filename), [filename])
+
+    def read_json(self, filename):
         with open(filename, "r", encoding="utf-8") as f:
             data = json.load(f)
         return data
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+
+from ..anime import Anime
+from ..query_strings import QSData
+from .. import json_decoder
+
+qsObj = QSData()
+
+
+class SyncInProgressError(RuntimeError):
+    '''
+    Raised when a sync is started on a storage directory another sync is running on (see DeltaSync.run).
+    '''
+    pass
+
+
+class DeltaSync:
+    '''
+    Incremental sync of the local anime database (anime_database_files) with Anilist.
+    Anime are listed most recently updated first (Media sorted by UPDATED_AT_DESC, IDs and update times only) down to
+    the high-water mark of the previous sync. Only the anime changed since are retrieved, batch_size per request,
+    and patched into the genre, year, score and tag json indexes and into the records (their other entries are kept
+    as they are). The records are patched where they are read from: anime_by_id.json when the full database is
+    shipped, anime_by_id_cache.json otherwise (see RECORD_FILES).
+    The indexes built from the json files (PostingsIndex, AnimeIndex, RecordStore, LocalCatalog) are rebuilt on
+    their next use since their sources changed.
+
+    The json indexes are loaded once per run and patched in memory, they are written every flush_every batches and
+    when the run stops. Progress is saved in anime_sync_state.json after every page and every write of the indexes,
+    so an interrupted sync (crash, Ctrl+C, max_pages reached) resumes where it stopped: the batches patched since
+    the last write are retrieved again, applying a batch twice gives the same result.
+    Only one sync may run on a storage directory at a time (see LOCK_FILE).
+    '''
+    STATE_FILE = 'anime_sync_state.json'
+    # created exclusively for the length of a run, left behind by a killed process (remove it by hand then)
+    LOCK_FILE = 'anime_sync.lock'
+    # the bundled database is a snapshot of 2023-01-15, anime updated before are assumed to be up to date
+    DEFAULT_HIGH_WATER_MARK = 1673740800
+    # the full database, then the cached records (same order as RecordStore.SOURCES). A sync never creates
+    # anime_by_id.json, it would pass a few cached records off as the full database.
+    RECORD_FILES = ['anime_by_id.json', 'anime_by_id_cache.json']
+
+    def __init__(self, access_info, storage_dir=None, page_size=50, batch_size=25, flush_every=20):
+        '''
+        :param access_info: the access dict of an Anilist instance (api url, headers and request handler)
+        :param storage_dir: directory of the json files to patch. Default = databases/anime_database_files
+        :param page_size: number of updated anime listed per request (max 50). Default = 50
+        :param batch_size: number of anime retrieved per request. Default = 25
+        :param flush_every: number of batches patched in memory between two writes of the json indexes. Default = 20
+        '''
+        self.access = access_info
+        self.request_handler = access_info['request_handler']
+        self.storage_dir = storage_dir if storage_dir is not None else os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anime_database_files')
+        self.state_path = os.path.join(self.storage_dir, self.STATE_FILE)
+        self.lock_path = os.path.join(self.storage_dir, self.LOCK_FILE)
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+
+        self._indexes = None # {filename: index dict} loaded by apply, written by flush
+        self._records_file = None # the file of RECORD_FILES the records are patched into
+
+    # STATE =====================================================================================================================
+    def load_state(self) -> dict:
+        '''
+        :return: the sync state: {'high_water_mark': updatedAt of the last complete sync, 'run': progress of an unfinished sync or None}
+        :rtype: dict
+        '''
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'high_water_mark': self.DEFAULT_HIGH_WATER_MARK, 'run': None}
+
+    def save_state(self, state):
+        self._write_json(self.state_path, state)
+
+    def reset(self, since=None):
+        '''
+        Drops an unfinished sync and sets the high-water mark.
+
+        :param since: unix time from which to sync the next time. Default = DEFAULT_HIGH_WATER_MARK
+        '''
+        self.save_state({'high_water_mark': self.DEFAULT_HIGH_WATER_MARK if since is None else since, 'run': None})
+
+    # SYNC ======================================================================================================================
+    def run(self, max_pages=None, since=None) -> dict:
+        '''
+        Runs (or resumes) a sync.
+
+        :param max_pages: stop after listing this many pages, the next run resumes from there (None to finish the sync)
+        :param since: unix time to sync from instead of the stored high-water mark (ignored when resuming)
+        :return: {'complete': whether the sync finished, 'pending': anime left to retrieve, 'updated': anime patched,
+                  'removed': anime removed (no longer on Anilist), 'high_water_mark': the stored mark}
+        :rtype: dict
+        :raises SyncInProgressError: if another sync is running on the storage directory
+        '''
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise SyncInProgressError(f'Another sync is running on {self.storage_dir} (remove {self.lock_path} if it was killed).')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return self._run(max_pages, since)
+        finally:
+            self._indexes = None
+            self._records_file = None
+            os.remove(self.lock_path)
+
+    def _run(self, max_pages, since) -> dict:
+        state = self.load_state()
+        if state.get('run') is None:
+            state['run'] = {'since': state['high_water_mark'] if since is None else since,
+                            'until': None, 'page': 1, 'listed': False, 'pending': [], 'updated': 0, 'removed': 0}
+        run = state['run']
+
+        pages = 0
+        while not run['listed']:
+            if max_pages is not None and pages >= max_pages:
+                return self._summary(state, complete=False)
+            self._list_page(run)
+            self.save_state(state)
+            pages += 1
+
+        patched = 0 # anime of run['pending'] patched in memory since the last write
+        try:
+            while patched < len(run['pending']):
+                chunk = run['pending'][patched:patched + self.batch_size]
+                records = self.fetch_records(chunk)
+                self.apply(records)
+                run['updated'] += sum(record is not None for record in records.values())
+                run['removed'] += sum(record is None for record in records.values())
+                patched += len(chunk)
+                if patched >= self.flush_every * self.batch_size:
+                    self._checkpoint(state, patched)
+                    patched = 0
+        finally:
+            # an error or Ctrl+C keeps the batches already patched
+            if patched:
+                self._checkpoint(state, patched)
+
+        state['run'] = None
+        if run['until'] is not None:
+            state['high_water_mark'] = max(run['until'], run['since'])
+        self.save_state(state)
+        return self._summary(state, complete=True, run=run)
+
+    def _checkpoint(self, state, patched):
+        # the indexes first: a crash in between only retrieves the batches again
+        self.flush()
+        del state['run']['pending'][:patched]
+        self.save_state(state)
+
+    def _list_page(self, run):
+        '''
+        Lists a page of updated anime into run['pending'], marks the run as listed once the high-water mark is reached.
+        Anime updated exactly at the mark are retrieved again (the mark may have been saved in the middle of their second).
+        '''
+        data = self._post(qsObj.animeUpdatesQS, {'page': run['page'], 'perpage': self.page_size})
+        try:
+            page = data['data']['Page']
+            media_list = page['media']
+        except (TypeError, KeyError):
+            raise Exception('Data post unsuccessful. (invalid updates page)')
+
+        pending = set(run['pending'])
+        for media in media_list:
+            if media.get('updatedAt') is None:
+                # no update time to compare with the mark, it neither ends the listing nor needs a patch
+                continue
+            if media['updatedAt'] < run['since']:
+                run['listed'] = True
+                break
+            # the first anime of the first page is the most recent update, it becomes the next high-water mark
+            if run['until'] is None or media['updatedAt'] > run['until']:
+                run['until'] = media['updatedAt']
+            if media['id'] not in pending:
+                pending.add(media['id'])
+                run['pending'].append(media['id'])
+
+        if not page['pageInfo']['hasNextPage'] or len(media_list) == 0:
+            run['listed'] = True
+        run['page'] += 1
+
+    def fetch_records(self, anime_ids) -> dict:
+        '''
+        Retrieves the current records of anime with one aliased request. The response caches are bypassed.
+
+        :param anime_ids: list of anime IDs on Anilist
+        :return: dict of {anime ID (str): (anime record, media obj), or None for anime that are no longer on Anilist}
+        :rtype: dict
+        '''
+        id_val = {f'id{i}': anime_id for i, anime_id in enumerate(anime_ids)}
+        # Anilist answers 404 when any ID of the batch is missing, the other items are still in 'data'
+        data = self._post(qsObj.batchInfoQS('anime', len(anime_ids)), id_val, accept_status=(200, 404))
+        try:
+            batch_data = data['data'] or {}
+        except (TypeError, KeyError):
+            raise Exception('Data post unsuccessful. (invalid batch response)')
+
+        records = {}
+        for i, anime_id in enumerate(anime_ids):
+            media_lvl = batch_data.get(f'item{i}')
+            records[str(anime_id)] = (Anime.parseAnimeInfo(media_lvl), media_lvl) if media_lvl is not None else None
+        return records
+
+    def _post(self, query, variables, accept_status=(200,)):
+        # straight to the network: cached pages or entities would hide the updates
+        response = self.request_handler.post(self.access['apiurl'], headers=self.access['header'],
+                                             json={'query': query, 'variables': variables})
+        if response.status_code not in accept_status:
+            raise Exception(f'Data post unsuccessful. ({response.status_code})')
+        return json_decoder.loads(response.content)
+
+    # PATCHING ==================================================================================================================
+    def apply(self, records) -> int:
+        '''
+        Patches the json indexes with the given anime: their old entries are removed from every index,
+        then the new ones are added (anime mapped to None are only removed).
+        The indexes are loaded on the first call and patched in memory, flush writes them.
+
+        :param records: dict of {anime ID (str): (anime record, media obj) or None} (see fetch_records)
+        :return: number of patched anime
+        :rtype: int
+        '''
+        changed = set(records)
+        current = {anime_id: entry for anime_id, entry in records.items() if entry is not None}
+        indexes = self._load_indexes()
+
+        # genres, years and scores: {key: [anime IDs]}
+        bucket_keys = {'anime_by_genre.json': lambda record, media: [genre.lower() for genre in media['genres'] or []],
+                       'anime_by_year.json': lambda record, media: [str((media['startDate'] or {}).get('year'))],
+                       'anime_by_score.json': lambda record, media: [str(media['averageScore'] if media['averageScore'] is not None else -1)]}
+        for filename, keys_of in bucket_keys.items():
+            index_dict = indexes[filename]
+            for key, anime_ids in index_dict.items():
+                if not changed.isdisjoint(anime_ids):
+                    index_dict[key] = [anime_id for anime_id in anime_ids if anime_id not in changed]
+            for anime_id, (record, media) in current.items():
+                for key in keys_of(record, media):
+                    index_dict.setdefault(key, []).append(anime_id)
+
+        # titles: {'english|=|romaji' or 'romaji': anime ID}
+        tag_dict = indexes['anime_by_tag.json']
+        for tags in [tags for tags, anime_id in tag_dict.items() if anime_id in changed]:
+            del tag_dict[tags]
+        for anime_id, (record, media) in current.items():
+            titles = [title for title in (record['name_english'], record['name_romaji']) if title]
+            if titles:
+                tag_dict['|=|'.join(dict.fromkeys(titles))] = anime_id
+
+        # records: {anime ID: record}
+        id_dict = indexes[self._records_file]
+        # cached records carry their position in the cache (cache_pos): a synced anime keeps its own, new ones are appended
+        cached = self._records_file == 'anime_by_id_cache.json'
+        positions = {anime_id: record['cache_pos'] for anime_id, record in id_dict.items() if cached and isinstance(record, dict) and 'cache_pos' in record}
+        next_pos = max(positions.values(), default=0) + 1
+        for anime_id in changed:
+            id_dict.pop(anime_id, None)
+        for anime_id, (record, media) in current.items():
+            if cached:
+                if anime_id not in positions:
+                    positions[anime_id] = next_pos
+                    next_pos += 1
+                record = dict(record, cache_pos=positions[anime_id])
+            id_dict[anime_id] = record
+        return len(changed)
+
+    def _load_indexes(self) -> dict:
+        if self._indexes is None:
+            filenames = ['anime_by_genre.json', 'anime_by_year.json', 'anime_by_score.json', 'anime_by_tag.json']
+            indexes = {filename: self._read_json(filename) for filename in filenames}
+            self._records_file = next((filename for filename in self.RECORD_FILES if os.path.isfile(os.path.join(self.storage_dir, filename))), self.RECORD_FILES[-1])
+            indexes[self._records_file] = self._read_json(self._records_file)
+            self._indexes = indexes
+        return self._indexes
+
+    def flush(self):
+        '''
+        Writes the json indexes patched by apply (nothing if apply was not called).
+        '''
+        for filename, index_dict in (self._indexes or {}).items():
+            self._write_json(os.path.join(self.storage_dir, filename), index_dict)
+
+    def _read_json(self, filename):
+        with open(os.path.join(self.storage_dir, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path, data):
+        # written next to the file and renamed, an interrupted write never leaves a truncated index
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _summary(state, complete, run=None) -> dict:
+        run = run if run is not None else state['run']
+        return {'complete': complete,
+                'pending': len(run['pending']) if not complete else 0,
+                'updated': run['updated'],
+                'removed': run['removed'],
+                'high_water_mark': state['high_water_mark']}
+
+
+if __name__ == '__main__':
+    from .. import Anilist
+    max_pages = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print(DeltaSync(Anilist().access).run(max_pages=max_pages))
@@ -0,0 +1,149 @@
+import time
+import sqlite3
+import threading
+
+from .sqlite_cache import DEFAULT_CACHE_PATH
+from .title_resolver import normalize_title
+
+
+class IDCache:
+    '''
+    Persistent cache of name -> Anilist ID resolutions for anime, manga and characters, stored in anilist_cache.sqlite3
+    (shared with SQLiteCache).
+    Names are canonicalized with normalize_title, so 'code geass', 'Code Geass!' and 'ＣＯＤＥ　ＧＥＡＳＳ' share one entry
+    and only the first of them is searched on Anilist. Names that were not found are cached too, with a short TTL,
+    so a typo repeated in a loop does not hit the API every time.
+    '''
+    NOT_FOUND = 0 # returned for cached negative results (Anilist IDs start at 1)
+    DEFAULT_TTL = 30 * 24 * 3600
+    DEFAULT_NEGATIVE_TTL = 10 * 60
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        '''
+        :param path: path of the sqlite database. Default = databases/anilist_cache.sqlite3
+        :param ttl: seconds a resolved ID is kept. Default = 30 days
+        :param negative_ttl: seconds a not found result is kept. Default = 10 minutes
+        '''
+        self.path = path if path is not None else DEFAULT_CACHE_PATH
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._setup()
+
+    def _setup(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS name_ids (
+                                category TEXT NOT NULL,
+                                name TEXT NOT NULL,
+                                anilist_id INTEGER,
+                                expires_at REAL NOT NULL,
+                                PRIMARY KEY (category, name))''')
+
+    def _connect(self) -> sqlite3.Connection:
+        '''
+        sqlite connections can not be shared between threads, every thread opens its own.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, category, name):
+        '''
+        :param category: 'anime', 'manga' or 'character'
+        :param name: the name as typed by the user
+        :return: the cached ID, IDCache.NOT_FOUND for a cached not found result, or None on a miss
+        :rtype: int or NoneType
+        '''
+        key = normalize_title(name)
+        if not key:
+            return None
+
+        row = self._connect().execute('SELECT anilist_id, expires_at FROM name_ids WHERE category = ? AND name = ?',
+                                      (category, key)).fetchone()
+        hit = row is not None and row[1] > time.time()
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not hit:
+            return None
+        return row[0] if row[0] is not None else self.NOT_FOUND
+
+    def set(self, category, name, anilist_id):
+        '''
+        :param category: 'anime', 'manga' or 'character'
+        :param name: the name as typed by the user
+        :param anilist_id: the ID the name resolved to, or None if nothing was found
+        '''
+        key = normalize_title(name)
+        if not key:
+            return
+
+        ttl = self.ttl if anilist_id is not None else self.negative_ttl
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO name_ids (category, name, anilist_id, expires_at) VALUES (?, ?, ?, ?)',
+                         (category, key, anilist_id, time.time() + ttl))
+
+    def invalidate(self, category=None, name=None) -> int:
+        '''
+        Removes cached resolutions. Without arguments the whole cache is cleared.
+
+        :param category: only remove names of this category
+        :param name: only remove this name (requires category)
+        :return: number of removed entries
+        :rtype: int
+        '''
+        conn = self._connect()
+        with conn:
+            if name is not None:
+                if category is None:
+                    raise ValueError('IDCache can only invalidate a name together with its category.')
+                return conn.execute('DELETE FROM name_ids WHERE category = ? AND name = ?', (category, normalize_title(name))).rowcount
+            if category is not None:
+                return conn.execute('DELETE FROM name_ids WHERE category = ?', (category,)).rowcount
+            return conn.execute('DELETE FROM name_ids').rowcount
+
+    def evict(self) -> int:
+        '''
+        Removes expired entries.
+
+        :return: number of removed entries
+        :rtype: int
+        '''
+        conn = self._connect()
+        with conn:
+            return conn.execute('DELETE FROM name_ids WHERE expires_at <= ?', (time.time(),)).rowcount
+
+    def stats(self) -> dict:
+        '''
+        :return: dict with the number of resolved and not found entries, and the hits/misses of this process
+        :rtype: dict
+        '''
+        resolved, not_found = self._connect().execute(
+            'SELECT COUNT(anilist_id), COUNT(*) - COUNT(anilist_id) FROM name_ids WHERE expires_at > ?', (time.time(),)).fetchone()
+        with self._lock:
+            return {'resolved': resolved,
+                    'not_found': not_found,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+    def close(self):
+        '''
+        Closes the connection of the calling thread.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
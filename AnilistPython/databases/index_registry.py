@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+
+
+def file_stamp(paths) -> tuple:
+    '''
+    :param paths: list of file paths
+    :return: the (mtime in ns, size) of each file, None for missing files
+    :rtype: tuple
+    '''
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+class IndexRegistry:
+    '''
+    Process-wide cache of the loaded local indexes (parsed json files, title maps, PostingsIndex / AnimeIndex objects).
+    Each index is loaded once on first use and shared by every DatabaseSearcher, SearchEngine and TitleResolver of
+    the process. The files an index was loaded from are stat-ed on every lookup, and the index is loaded again when
+    one of their mtimes or sizes changed. Indexes that were not used for idle_timeout seconds are dropped so their
+    memory can be freed. Safe to share across threads: an index is loaded by one thread while the others wait for it.
+    '''
+    def __init__(self, idle_timeout=300.0):
+        '''
+        :param idle_timeout: seconds after which an unused index is dropped (None to keep indexes forever). Default = 300
+        '''
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._entries = {} # key -> (stamp, index, last use)
+        self._loading = {} # key -> lock held while the index is loaded
+        self._last_sweep = time.monotonic()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, key, loader, paths=()):
+        '''
+        :param key: hashable key of the index (i.e. ('json', path))
+        :param loader: called without arguments to load the index
+        :param paths: the files the index is loaded from, it is loaded again when one of them changes
+        :return: the shared index. It must not be modified by the caller.
+        '''
+        stamp = file_stamp(paths)
+        now = time.monotonic()
+        self._sweep(now)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries[key] = (stamp, entry[1], now)
+                self.hits += 1
+                return entry[1]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # another thread may have loaded it while this one was waiting
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == stamp:
+                    self.hits += 1
+                    return entry[1]
+
+            index = loader()
+            with self._lock:
+                self._entries[key] = (stamp, index, time.monotonic())
+                self.loads += 1
+            return index
+
+    def _sweep(self, now):
+        if self.idle_timeout is None or now - self._last_sweep < self.idle_timeout / 4:
+            return
+        self._last_sweep = now
+        self.evict_idle()
+
+    def evict_idle(self) -> int:
+        '''
+        Drops the indexes that were not used for idle_timeout seconds.
+
+        :return: number of dropped indexes
+        :rtype: int
+        '''
+        if self.idle_timeout is None:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, (_, _, last_use) in self._entries.items() if now - last_use > self.idle_timeout]
+            # the per-key locks are kept, a loader may still hold one
+            for key in idle:
+                del self._entries[key]
+            self.evictions += len(idle)
+        return len(idle)
+
+    def invalidate(self, key=None) -> int:
+        '''
+        Drops an index (or all of them without a key), it is loaded again on its next use.
+
+        :param key: the key of the index to drop
+        :return: number of dropped indexes
+        :rtype: int
+        '''
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    def stats(self) -> dict:
+        '''
+        :return: dict with the number of loaded indexes and the hits/loads/evictions of the registry
+        :rtype: dict
+        '''
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'hits': self.hits,
+                    'loads': self.loads,
+                    'evictions': self.evictions}
+
+
+# registry shared by the whole process
+index_registry = IndexRegistry()
@@ -0,0 +1,271 @@
+import os
+import json
+
+import numpy as np
+
+from .postings_index import page_ids
+from .record_store import RecordStore, load_record_store, get_records
+
+
+class LocalCatalog:
+    '''
+    The bundled anime catalog as a table of numpy columns (one row per anime, ordered by ID) instead of per-anime dicts:
+    id, year, score, episodes, popularity, format and status, plus one bitset per genre (a bit per row).
+    Filters are computed as boolean masks over whole columns (see mask), and the masks are aggregated with
+    count / mean. A row takes about 20 bytes, the record dicts take several KB each.
+
+    Missing values: year 0 (no start date), score -1 (unscored), episodes and popularity -1, format and status -1
+    (codes index the formats / statuses lists). Episodes, popularity, format and status come from the anime records
+    (see RecordStore), year, score and genres from anime_by_year/score/genre.json.
+    '''
+    SOURCES = ['anime_by_genre.json', 'anime_by_year.json', 'anime_by_score.json']
+    COLUMNS = ('id', 'year', 'score', 'episodes', 'popularity', 'format', 'status')
+
+    def __init__(self, storage_dir=None):
+        '''
+        :param storage_dir: directory of the json files the catalog is built from. Default = databases/anime_database_files
+        '''
+        if storage_dir is None:
+            storage_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anime_database_files')
+        self.storage_dir = storage_dir
+        self._build()
+
+    @classmethod
+    def source_paths(cls, storage_dir) -> list:
+        '''
+        :param storage_dir: directory of the json files
+        :return: paths of the json files the catalog is built from, and of the anime records
+        :rtype: list
+        '''
+        return [os.path.join(storage_dir, filename) for filename in cls.SOURCES] + RecordStore.source_paths(storage_dir)
+
+    def _load_json(self, filename):
+        with open(os.path.join(self.storage_dir, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _build(self):
+        genre_dict = self._load_json('anime_by_genre.json')
+        year_dict = self._load_json('anime_by_year.json')
+        score_dict = self._load_json('anime_by_score.json')
+
+        ids = set()
+        for index_dict in (genre_dict, year_dict, score_dict):
+            for anime_ids in index_dict.values():
+                ids.update(int(anime_id) for anime_id in anime_ids)
+        self.id = np.array(sorted(ids), dtype=np.uint32)
+        n = len(self.id)
+
+        self.year = np.zeros(n, dtype=np.int16)
+        for year, anime_ids in year_dict.items():
+            if year != 'None':
+                self.year[self.rows(anime_ids)] = int(year)
+        self.score = np.full(n, -1, dtype=np.int8)
+        for score, anime_ids in score_dict.items():
+            self.score[self.rows(anime_ids)] = int(score)
+
+        self.genre_bitsets = {}
+        for genre in sorted(genre_dict):
+            genre_rows = np.zeros(n, dtype=bool)
+            genre_rows[self.rows(genre_dict[genre])] = True
+            self.genre_bitsets[genre] = np.packbits(genre_rows)
+
+        # the columns only known from the anime records
+        self.episodes = np.full(n, -1, dtype=np.int32)
+        self.popularity = np.full(n, -1, dtype=np.int32)
+        self.format = np.full(n, -1, dtype=np.int8)
+        self.status = np.full(n, -1, dtype=np.int8)
+        self.has_record = np.zeros(n, dtype=bool)
+        self.formats = []
+        self.statuses = []
+        for anime_id, record in load_record_store(self.storage_dir).items():
+            row = self.rows([anime_id])[0]
+            if row < 0:
+                continue
+            self.has_record[row] = True
+            if record.get('airing_episodes') is not None:
+                self.episodes[row] = record['airing_episodes']
+            if record.get('popularity') is not None:
+                self.popularity[row] = record['popularity']
+            self.format[row] = self._code(self.formats, record.get('airing_format'))
+            self.status[row] = self._code(self.statuses, record.get('airing_status'))
+
+    @staticmethod
+    def _code(categories, value) -> int:
+        if value is None:
+            return -1
+        if value not in categories:
+            categories.append(value)
+        return categories.index(value)
+
+    def rows(self, anime_ids) -> np.ndarray:
+        '''
+        :param anime_ids: IDs of the anime on Anilist (int or str)
+        :return: the row of each anime, -1 for anime that are not in the catalog
+        :rtype: numpy.ndarray
+        '''
+        anime_ids = np.array([int(anime_id) for anime_id in anime_ids], dtype=np.int64)
+        rows = np.searchsorted(self.id, anime_ids)
+        found = rows < len(self.id)
+        found[found] = self.id[rows[found]] == anime_ids[found]
+        return np.where(found, rows, -1)
+
+    def __len__(self):
+        return len(self.id)
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        :return: memory taken by the columns and bitsets, in bytes
+        :rtype: int
+        '''
+        columns = [self.id, self.year, self.score, self.episodes, self.popularity, self.format, self.status, self.has_record]
+        return sum(column.nbytes for column in columns) + sum(bitset.nbytes for bitset in self.genre_bitsets.values())
+
+    def genre_mask(self, genre) -> np.ndarray:
+        '''
+        :param genre: the genre (lower case, i.e. 'sci-fi')
+        :return: boolean mask of the anime with this genre (all False for unknown genres)
+        :rtype: numpy.ndarray
+        '''
+        bitset = self.genre_bitsets.get(genre)
+        if bitset is None:
+            return np.zeros(len(self), dtype=bool)
+        return np.unpackbits(bitset, count=len(self)).view(bool)
+
+    def year_mask(self, years) -> np.ndarray:
+        '''
+        :param years: list of release years (None for anime without a start date)
+        :return: boolean mask of the anime released in one of the years
+        :rtype: numpy.ndarray
+        '''
+        return np.isin(self.year, [0 if year is None else int(year) for year in years])
+
+    def genres(self) -> set:
+        '''
+        :return: the genres of the catalog (lower case, i.e. 'sci-fi')
+        :rtype: set
+        '''
+        return set(self.genre_bitsets)
+
+    def years(self) -> set:
+        '''
+        :return: the release years of the catalog (None for anime without a start date)
+        :rtype: set
+        '''
+        return {None if year == 0 else year for year in np.unique(self.year).tolist()}
+
+    def mask(self, genres=None, years=None, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True,
+             genre_mode='and', exclude_genres=None, exclude_years=None, formats=None, statuses=None) -> np.ndarray:
+        '''
+        Boolean mask of the anime matching every given restriction (same restrictions as PostingsIndex.query).
+
+        :param formats: list of airing formats the anime must be in one of (i.e. ['TV', 'MOVIE'])
+        :param statuses: list of airing statuses the anime must be in one of (i.e. ['FINISHED'])
+        :return: boolean mask over the rows of the catalog
+        :rtype: numpy.ndarray
+        '''
+        mask = np.ones(len(self), dtype=bool)
+        if genres:
+            genre_masks = [self.genre_mask(genre) for genre in genres]
+            mask &= np.logical_and.reduce(genre_masks) if genre_mode == 'and' else np.logical_or.reduce(genre_masks)
+        if years:
+            mask &= self.year_mask(years)
+        if min_score is not None:
+            mask &= self.score >= min_score if min_inclusive else self.score > min_score
+        if max_score is not None:
+            mask &= self.score <= max_score if max_inclusive else self.score < max_score
+        for genre in exclude_genres or []:
+            mask &= ~self.genre_mask(genre)
+        if exclude_years:
+            mask &= ~self.year_mask(exclude_years)
+        if formats:
+            mask &= np.isin(self.format, [self.formats.index(f) for f in formats if f in self.formats])
+        if statuses:
+            mask &= np.isin(self.status, [self.statuses.index(s) for s in statuses if s in self.statuses])
+        return mask
+
+    def sort_keys(self, order_by) -> np.ndarray:
+        '''
+        :param order_by: 'score' or 'year'
+        :return: sort key of every row, -inf for anime without a value (score -1 is kept, it ranks last anyway)
+        :rtype: numpy.ndarray
+        '''
+        if order_by == 'score':
+            return self.score.astype(np.float64)
+        if order_by == 'year':
+            return np.where(self.year == 0, -np.inf, self.year)
+        if order_by == 'popularity':
+            # the popularity column is only filled from the anime records, ranking by it would be the ID order
+            raise ValueError('Incorrect order -> popularity. The local anime records hold no popularity to sort by yet.')
+        raise KeyError(f'Incorrect order -> {order_by}')
+
+    def query(self, genres=None, years=None, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True,
+              genre_mode='and', exclude_genres=None, exclude_years=None, order_by='id', offset=0, limit=None, id_only=False) -> list:
+        '''
+        Same search as PostingsIndex.query, answered with a boolean mask over the columns.
+
+        :return: list of anime IDs (str) or anime records. Anime without a stored record get a partial record
+                 (see load_partial_records), so both modes find the same anime.
+        :rtype: list
+        '''
+        mask = self.mask(genres, years, min_score, max_score, min_inclusive, max_inclusive, genre_mode, exclude_genres, exclude_years)
+        # rows are ordered by ID, so ties of the page are ordered by ID too
+        rows = page_ids(np.flatnonzero(mask), None if order_by == 'id' else self.sort_keys(order_by), offset, limit)
+
+        anime_ids = self.id[rows].tolist()
+        if id_only:
+            return [str(anime_id) for anime_id in anime_ids]
+        return get_records(anime_ids, self.storage_dir)
+
+    def _groups(self, by):
+        if by == 'genre':
+            return [(genre, self.genre_mask(genre)) for genre in self.genre_bitsets]
+        if by in ('format', 'status'):
+            categories = self.formats if by == 'format' else self.statuses
+            return [(value, getattr(self, by) == code) for code, value in enumerate(categories)]
+        if by in ('year', 'score'):
+            column = getattr(self, by)
+            return [(None if by == 'year' and value == 0 else value, column == value) for value in np.unique(column).tolist()]
+        raise KeyError(f'Incorrect catalog group -> {by}')
+
+    def count(self, mask=None, by=None):
+        '''
+        :param mask: boolean mask of the anime to count (i.e. from mask). All anime by default.
+        :param by: 'genre', 'year', 'score', 'format' or 'status' to count per group. Default = None
+        :return: the number of anime, or dict of {group: number of anime}
+        :rtype: int or dict
+        '''
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        if by is None:
+            return int(np.count_nonzero(mask))
+        return {group: int(np.count_nonzero(mask & group_mask)) for group, group_mask in self._groups(by)}
+
+    def mean(self, column, mask=None, by=None):
+        '''
+        :param column: 'year', 'score', 'episodes' or 'popularity' (anime without a value are left out)
+        :param mask: boolean mask of the anime to average (i.e. from mask). All anime by default.
+        :param by: 'genre', 'year', 'score', 'format' or 'status' to average per group. Default = None
+        :return: the average, or dict of {group: average} (None when no anime has a value)
+        :rtype: float or dict
+        '''
+        if column not in ('year', 'score', 'episodes', 'popularity'):
+            raise KeyError(f'Incorrect catalog column -> {column}')
+        values = getattr(self, column)
+        valid = values > 0 if column == 'year' else values >= 0
+        if mask is not None:
+            valid = valid & mask
+
+        def average(rows):
+            total = np.count_nonzero(rows)
+            return float(values[rows].astype(np.float64).mean()) if total else None
+        if by is None:
+            return average(valid)
+        return {group: average(valid & group_mask) for group, group_mask in self._groups(by)}
+
+
+if __name__ == '__main__':
+    import time
+    start = time.time()
+    catalog = LocalCatalog()
+    print(f'Loaded {len(catalog)} anime ({catalog.nbytes / 1024:.0f} KB) in {time.time() - start:.2f}s')
@@ -0,0 +1,391 @@
+import os
+import json
+import mmap
+import struct
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from .record_store import get_records
+
+
+def bisect_scores(scores, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True) -> tuple:
+    '''
+    Binary searches a score range in a sorted list of scores.
+
+    :param scores: sorted list of scores
+    :param min_score: lower bound of the range (None for no bound, floats allowed)
+    :param max_score: upper bound of the range (None for no bound, floats allowed)
+    :param min_inclusive: include the scores equal to min_score. Default = False
+    :param max_inclusive: include the scores equal to max_score. Default = True
+    :return: (start, stop) positions of the range in scores
+    :rtype: tuple
+    '''
+    start = 0
+    if min_score is not None:
+        start = bisect_left(scores, min_score) if min_inclusive else bisect_right(scores, min_score)
+    stop = len(scores)
+    if max_score is not None:
+        stop = bisect_right(scores, max_score) if max_inclusive else bisect_left(scores, max_score)
+    return start, max(start, stop)
+
+
+def page_ids(ids, keys=None, offset=0, limit=None) -> np.ndarray:
+    '''
+    Cuts a page out of a search result, best anime first. Only the offset + limit best anime are sorted:
+    they are selected with np.partition (linear time), the rest of the result is never ordered.
+
+    :param ids: sorted anime IDs (numpy array)
+    :param keys: sort key of every anime indexed by anime ID, highest first (None to keep the ID order)
+    :param offset: number of anime to skip. Default = 0
+    :param limit: max number of anime in the page (None for all of them). Default = None
+    :return: the IDs of the page, ties ordered by ID
+    :rtype: numpy.ndarray
+    '''
+    stop = len(ids) if limit is None else min(len(ids), offset + limit)
+    if offset >= stop:
+        return ids[:0]
+    if keys is None:
+        return ids[offset:stop]
+
+    values = keys[ids]
+    if stop < len(ids):
+        # keep every anime at least as good as the stop-th best one, the ties are then cut by ID
+        threshold = -np.partition(-values, stop - 1)[stop - 1]
+        selected = values >= threshold
+        ids, values = ids[selected], values[selected]
+    order = np.lexsort((ids, -values))
+    return ids[order[offset:stop]]
+
+
+class Predicate:
+    '''
+    One restriction of a PostingsIndex query: the anime must be in one of the postings arrays (in none of them when negated).
+    '''
+    def __init__(self, label, buckets, negate=False, disjoint=True):
+        '''
+        :param label: description of the restriction (i.e. 'genre=action')
+        :param buckets: sorted postings arrays
+        :param negate: leave out the anime of the buckets instead. Default = False
+        :param disjoint: no anime is in two of the buckets (true for years and scores, not for genres). Default = True
+        '''
+        self.label = label
+        self.buckets = [bucket for bucket in buckets if len(bucket) > 0]
+        self.estimate = sum(len(bucket) for bucket in self.buckets) # exact for disjoint buckets, an upper bound otherwise
+        self.negate = negate
+        self.disjoint = disjoint
+
+    def materialize(self) -> np.ndarray:
+        '''
+        :return: the sorted IDs of every bucket
+        :rtype: numpy.ndarray
+        '''
+        if not self.buckets:
+            return np.empty(0, dtype='<u4')
+        if len(self.buckets) == 1:
+            return self.buckets[0]
+        merged = np.concatenate(self.buckets)
+        return np.sort(merged) if self.disjoint else np.unique(merged)
+
+    def apply(self, ids) -> np.ndarray:
+        '''
+        :param ids: sorted candidate IDs
+        :return: the sorted candidates that pass the restriction
+        :rtype: numpy.ndarray
+        '''
+        if len(ids) * len(self.buckets) > self.estimate:
+            # many candidates: merge the buckets once and intersect
+            if self.negate:
+                return np.setdiff1d(ids, self.materialize(), assume_unique=True)
+            return np.intersect1d(ids, self.materialize(), assume_unique=True)
+
+        # few candidates: binary search each of them in the buckets
+        found = np.zeros(len(ids), dtype=bool)
+        for bucket in self.buckets:
+            positions = np.searchsorted(bucket, ids)
+            np.minimum(positions, len(bucket) - 1, out=positions)
+            found |= bucket[positions] == ids
+        return ids[~found] if self.negate else ids[found]
+
+    def __repr__(self):
+        return f'Predicate({"NOT " if self.negate else ""}{self.label}, estimate={self.estimate})'
+
+
+class PostingsIndex:
+    '''
+    Compiled binary form of the genre, year and score indexes (anime_by_genre/year/score.json), opened with mmap.
+    Every genre, year and score bucket is a sorted array of little-endian uint32 anime IDs. The arrays are read
+    straight from the mapped file (no parsing, no copy) and intersected as packed integer arrays with numpy.
+    The score buckets are stored back to back in score order, so a score range is two binary searches on the
+    sorted scores and one slice of the concatenated IDs (see score_range).
+    The pages of the file live in the OS page cache, so every worker process of the host shares the same memory.
+
+    File layout: magic, version, directory size, json directory {kind: {key: [offset, count]}},
+    padding to 4 bytes, then the uint32 arrays (offsets and counts are in IDs, not bytes).
+    The file is compiled from the json files on first use (into their directory), and again whenever one of them is newer.
+    '''
+    MAGIC = b'ALPI'
+    VERSION = 2
+    HEADER = struct.Struct('<4sII') # magic, version, directory size
+    SOURCES = {'genre': 'anime_by_genre.json', 'year': 'anime_by_year.json', 'score': 'anime_by_score.json'}
+
+    def __init__(self, path=None, storage_dir=None):
+        '''
+        :param path: path of the compiled postings file. Default = anime_postings.bin in storage_dir
+        :param storage_dir: directory of the json files the postings are compiled from. Default = databases/anime_database_files
+        '''
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.storage_dir = storage_dir if storage_dir is not None else os.path.join(dir_path, 'anime_database_files')
+        self.path = path if path is not None else os.path.join(self.storage_dir, 'anime_postings.bin')
+
+        self._all_ids = None
+        self._sort_keys = {}
+        if self.is_stale() or not self._open():
+            self.build()
+            if not self._open():
+                raise ValueError(f'Incorrect postings file -> {self.path}')
+
+    @classmethod
+    def source_paths(cls, storage_dir) -> list:
+        '''
+        :param storage_dir: directory of the json files
+        :return: paths of the json files the postings are compiled from, and of the anime records
+        :rtype: list
+        '''
+        filenames = list(cls.SOURCES.values()) + ['anime_by_id.json', 'anime_by_id_cache.json']
+        return [os.path.join(storage_dir, filename) for filename in filenames]
+
+    def is_stale(self) -> bool:
+        '''
+        :return: True if the compiled file is missing or older than one of its json files
+        :rtype: bool
+        '''
+        if not os.path.isfile(self.path):
+            return True
+        built_at = os.path.getmtime(self.path)
+        return any(os.path.getmtime(os.path.join(self.storage_dir, filename)) > built_at for filename in self.SOURCES.values())
+
+    def build(self) -> int:
+        '''
+        Compiles the json indexes into the postings file. The file is written next to its final path and
+        then renamed, so processes that have the old file mapped keep reading a consistent copy.
+
+        :return: number of postings arrays
+        :rtype: int
+        '''
+        directory = {}
+        arrays = []
+        offset = 0
+        for kind, filename in self.SOURCES.items():
+            with open(os.path.join(self.storage_dir, filename), 'r', encoding='utf-8') as f:
+                index_dict = json.load(f)
+
+            directory[kind] = {}
+            keys = sorted(index_dict, key=float) if kind == 'score' else index_dict
+            for key in keys:
+                ids = index_dict[key]
+                postings = np.unique(np.array(ids, dtype='<u4')) # sorted and deduplicated
+                directory[kind][key] = [offset, len(postings)]
+                arrays.append(postings)
+                offset += len(postings)
+
+        directory_bytes = json.dumps(directory, separators=(',', ':')).encode('utf-8')
+        directory_bytes += b' ' * (-(self.HEADER.size + len(directory_bytes)) % 4)
+
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(directory_bytes)))
+            f.write(directory_bytes)
+            for postings in arrays:
+                f.write(postings.tobytes())
+        os.replace(tmp_path, self.path)
+        return len(arrays)
+
+    def _open(self) -> bool:
+        '''
+        Maps the postings file. False if it was written by another version (it has to be compiled again).
+        '''
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, directory_size = self.HEADER.unpack_from(mm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            mm.close()
+            return False
+
+        self._mm = mm
+        self._directory = json.loads(mm[self.HEADER.size:self.HEADER.size + directory_size])
+        self._data_offset = self.HEADER.size + directory_size
+        self._years = {None if year == 'None' else int(year) for year in self._directory['year']}
+
+        # sorted scores, with the offset of each score bucket in the concatenated score postings
+        buckets = sorted((float(score), offset, count) for score, (offset, count) in self._directory['score'].items())
+        start = buckets[0][1]
+        self._scores = [score for score, _, _ in buckets]
+        self._score_offsets = [offset - start for _, offset, _ in buckets] + [buckets[-1][1] + buckets[-1][2] - start]
+        self._score_ids = np.frombuffer(mm, dtype='<u4', count=self._score_offsets[-1], offset=self._data_offset + start * 4)
+        return True
+
+    def postings(self, kind, key) -> np.ndarray:
+        '''
+        :param kind: 'genre', 'year' or 'score'
+        :param key: the genre, year or score as in the json files (i.e. 'sci-fi', '2012', '75')
+        :return: read-only view of the sorted anime IDs of the bucket (empty if the key is unknown)
+        :rtype: numpy.ndarray
+        '''
+        offset, count = self._directory[kind].get(key, (0, 0))
+        return np.frombuffer(self._mm, dtype='<u4', count=count, offset=self._data_offset + offset * 4)
+
+    def genres(self) -> set:
+        '''
+        :return: the genres of the index (lower case, i.e. 'sci-fi')
+        :rtype: set
+        '''
+        return set(self._directory['genre'])
+
+    def years(self) -> set:
+        '''
+        :return: the release years of the index (None for anime without a start date)
+        :rtype: set
+        '''
+        return self._years
+
+    def score_range(self, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True) -> np.ndarray:
+        '''
+        :param min_score: lower bound of the average score (None for no bound, floats allowed)
+        :param max_score: upper bound of the average score (None for no bound, floats allowed)
+        :param min_inclusive: include anime scored exactly min_score. Default = False
+        :param max_inclusive: include anime scored exactly max_score. Default = True
+        :return: read-only view of the IDs of the anime in the range, ordered by score (not by ID)
+        :rtype: numpy.ndarray
+        '''
+        start, stop = bisect_scores(self._scores, min_score, max_score, min_inclusive, max_inclusive)
+        return self._score_ids[self._score_offsets[start]:self._score_offsets[stop]]
+
+    def all_ids(self) -> np.ndarray:
+        '''
+        :return: the sorted IDs of every anime of the index
+        :rtype: numpy.ndarray
+        '''
+        if self._all_ids is None:
+            self._all_ids = np.sort(self._score_ids)
+        return self._all_ids
+
+    def sort_keys(self, order_by) -> np.ndarray:
+        '''
+        Sort keys of an ordered search, computed once per index: the average score (-1 for unscored anime), the
+        release year of every anime, -inf for anime without a start date.
+
+        :param order_by: 'score' or 'year'
+        :return: array of the keys indexed by anime ID
+        :rtype: numpy.ndarray
+        '''
+        keys = self._sort_keys.get(order_by)
+        if keys is not None:
+            return keys
+
+        all_ids = self.all_ids()
+        keys = np.full(int(all_ids[-1]) + 1 if len(all_ids) else 0, -np.inf)
+        if order_by == 'score':
+            for i, score in enumerate(self._scores):
+                keys[self._score_ids[self._score_offsets[i]:self._score_offsets[i + 1]]] = score
+        elif order_by == 'year':
+            for year in self._directory['year']:
+                if year != 'None':
+                    keys[self.postings('year', year)] = int(year)
+        elif order_by == 'popularity':
+            raise ValueError('Incorrect order -> popularity. The local anime records hold no popularity to sort by yet.')
+        else:
+            raise KeyError(f'Incorrect order -> {order_by}')
+
+        self._sort_keys[order_by] = keys
+        return keys
+
+    def plan(self, genres=None, years=None, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True,
+             genre_mode='and', exclude_genres=None, exclude_years=None) -> list:
+        '''
+        Turns the restrictions of a query (see query) into predicates, ordered by selectivity as estimated from the
+        sizes of their postings arrays: the restriction with the fewest matches first, exclusions last (the ones
+        leaving out the most anime first). Nothing is read besides the directory and the score offsets.
+
+        :return: list of Predicate in execution order
+        :rtype: list
+        '''
+        # a repeated key would be read twice, and the buckets of different years are assumed disjoint
+        genres, years, exclude_genres, exclude_years = [list(dict.fromkeys(keys)) if keys else keys
+                                                         for keys in (genres, years, exclude_genres, exclude_years)]
+        predicates = []
+        if genres:
+            if genre_mode == 'and':
+                predicates += [Predicate(f'genre={genre}', [self.postings('genre', genre)]) for genre in genres]
+            else:
+                predicates.append(Predicate(f'genre in {genres}', [self.postings('genre', genre) for genre in genres], disjoint=False))
+        if years:
+            predicates.append(Predicate(f'year in {years}', [self.postings('year', str(year)) for year in years]))
+        if min_score is not None or max_score is not None:
+            start, stop = bisect_scores(self._scores, min_score, max_score, min_inclusive, max_inclusive)
+            buckets = [self._score_ids[self._score_offsets[i]:self._score_offsets[i + 1]] for i in range(start, stop)]
+            predicates.append(Predicate(f'score in {self._scores[start:stop][:1] + self._scores[start:stop][-1:]}', buckets))
+        if exclude_genres:
+            predicates.append(Predicate(f'genre in {exclude_genres}', [self.postings('genre', genre) for genre in exclude_genres],
+                                        negate=True, disjoint=False))
+        if exclude_years:
+            predicates.append(Predicate(f'year in {exclude_years}', [self.postings('year', str(year)) for year in exclude_years], negate=True))
+
+        return (sorted((p for p in predicates if not p.negate), key=lambda p: p.estimate)
+                + sorted((p for p in predicates if p.negate), key=lambda p: -p.estimate))
+
+    def query(self, genres=None, years=None, min_score=None, max_score=None, min_inclusive=False, max_inclusive=True,
+              genre_mode='and', exclude_genres=None, exclude_years=None, order_by='id', offset=0, limit=None, id_only=False) -> list:
+        '''
+        Same search as AnimeIndex.query, answered by intersecting the postings arrays in the order of plan:
+        the most selective array is the starting set, every following restriction only checks the remaining
+        candidates, and the search stops as soon as nothing is left.
+        The page is cut out of the IDs (see page_ids) and only its records are read from the RecordStore.
+
+        :param genres: list of genres the anime must all have (lower case)
+        :param years: list of release years the anime must be in one of (None matches anime without a start date)
+        :param min_score: lower bound of the average score (-1 for unscored anime, floats allowed)
+        :param max_score: upper bound of the average score (floats allowed)
+        :param min_inclusive: include anime scored exactly min_score. Default = False
+        :param max_inclusive: include anime scored exactly max_score. Default = True
+        :param genre_mode: 'and' to match anime with every genre (default), 'or' to match anime with any of them
+        :param exclude_genres: list of genres the anime must not have
+        :param exclude_years: list of release years the anime must not be in
+        :param order_by: 'id' (default), or 'score' or 'year' to retrieve the highest first (ties by ID)
+        :param offset: number of results to skip. Default = 0
+        :param limit: max number of results (None for all of them). Default = None
+        :param id_only: only retrieve the IDs of the anime. False by default.
+        :return: list of anime IDs (str) or anime records. Anime without a stored record get a partial record
+                 (see load_partial_records), so both modes find the same anime.
+        :rtype: list
+        '''
+        plan = self.plan(genres, years, min_score, max_score, min_inclusive, max_inclusive, genre_mode, exclude_genres, exclude_years)
+        if plan and not plan[0].negate:
+            result = plan.pop(0).materialize()
+        else:
+            result = self.all_ids() # only exclusions
+
+        for predicate in plan:
+            if len(result) == 0:
+                break
+            result = predicate.apply(result)
+
+        page = page_ids(result, None if order_by == 'id' else self.sort_keys(order_by), offset, limit)
+
+        if id_only:
+            return [str(anime_id) for anime_id in page.tolist()]
+        return get_records(page.tolist(), self.storage_dir)
+
+    def close(self):
+        '''
+        Unmaps the postings file (raises BufferError while arrays returned by postings() are still referenced).
+        '''
+        self._mm.close()
+
+
+if __name__ == '__main__':
+    import time
+    start = time.time()
+    index = PostingsIndex()
+    print(f'Compiled {index.build()} postings arrays into {index.path} in {time.time() - start:.2f}s')
@@ -0,0 +1,331 @@
+import os
+import sys
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from .index_registry import index_registry
+from ..query_strings import QSData
+from .. import json_decoder
+
+
+class RecordStore:
+    '''
+    Anime records (same keys as Anilist.get_anime) stored one per line in anime_records.jsonl, with a binary
+    ID -> offset index in anime_records.idx, next to the json files they are built from. Both files are opened with mmap: a lookup is a binary search in the
+    sorted IDs and a slice of the records file, so only the requested records are read and parsed (the full
+    anime_by_id.json is never loaded). Every call returns freshly parsed records, they can be modified by the caller.
+
+    Index layout: magic, version, number of records, metadata size, json metadata {'source': path (file name for
+    the json files of storage_dir, so a copied directory keeps following its own files)},
+    padding to 8 bytes, the sorted uint32 IDs, padding to 8 bytes, then count + 1 uint64 offsets in the
+    records file (the record of IDs[i] spans offsets[i]:offsets[i + 1]).
+    The store is built from anime_by_id.json (anime_by_id_cache.json when the full database is not shipped) on
+    first use, and again whenever that file is newer. A store built from a full dump with
+    python -m AnilistPython.databases.record_store <dump.json> is kept until the dump itself changes.
+    '''
+    MAGIC = b'ALRS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sIII') # magic, version, number of records, metadata size
+    SOURCES = ['anime_by_id.json', 'anime_by_id_cache.json']
+
+    def __init__(self, path=None, storage_dir=None):
+        '''
+        :param path: path of the records file, the index is stored next to it (.idx). Default = anime_records.jsonl in storage_dir
+        :param storage_dir: directory of the json files the store is built from. Default = databases/anime_database_files
+        '''
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.storage_dir = storage_dir if storage_dir is not None else os.path.join(dir_path, 'anime_database_files')
+        self.path = path if path is not None else self.default_path(self.storage_dir)
+        self.index_path = os.path.splitext(self.path)[0] + '.idx'
+
+        self._mm = None
+        self._index_mm = None
+        opened = self._open()
+        if not opened or self.is_stale():
+            # a store built from a dump is rebuilt from that dump
+            source = self.source if opened and self.source not in self.source_paths(self.storage_dir) else None
+            self.close()
+            self.build(source)
+            if not self._open():
+                raise ValueError(f'Incorrect record store -> {self.index_path}')
+
+    @staticmethod
+    def default_path(storage_dir) -> str:
+        '''
+        :param storage_dir: directory of the json files
+        :return: path of the records file of the store built from them
+        :rtype: str
+        '''
+        return os.path.join(storage_dir, 'anime_records.jsonl')
+
+    @classmethod
+    def source_paths(cls, storage_dir) -> list:
+        '''
+        :param storage_dir: directory of the json files
+        :return: paths of the json files the store can be built from
+        :rtype: list
+        '''
+        return [os.path.realpath(os.path.join(storage_dir, filename)) for filename in cls.SOURCES]
+
+    def default_source(self) -> str:
+        '''
+        :return: the full database if it is shipped, the cached records otherwise
+        :rtype: str
+        '''
+        for source in self.source_paths(self.storage_dir):
+            if os.path.isfile(source):
+                return source
+        raise FileNotFoundError(f'No anime records in {self.storage_dir}')
+
+    def is_stale(self) -> bool:
+        '''
+        :return: True if the file the store was built from changed since, or a fuller default source appeared
+        :rtype: bool
+        '''
+        built_at = os.path.getmtime(self.index_path)
+        source = self.source
+        if source in self.source_paths(self.storage_dir):
+            # built from the default source: rebuild when anime_by_id.json replaces the cached records
+            source = self.default_source()
+            if source != self.source:
+                return True
+        return os.path.isfile(source) and os.path.getmtime(source) > built_at
+
+    def build(self, source=None) -> int:
+        '''
+        Writes the store from a json dump of {anime ID: anime record} (the format of anime_by_id.json).
+        Both files are written next to their final paths and then renamed, so processes that have the old
+        store mapped keep reading a consistent copy.
+
+        :param source: path of the dump. Default = anime_by_id.json, or anime_by_id_cache.json when it is not shipped
+        :return: number of stored records
+        :rtype: int
+        '''
+        source = os.path.realpath(source) if source is not None else self.default_source()
+        with open(source, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+
+        # anime IDs only (the cache holds a 'placeholder' key)
+        ids = sorted(int(anime_id) for anime_id in records if anime_id.isdigit())
+        offsets = [0]
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            for anime_id in ids:
+                line = json_decoder.dumps(records[str(anime_id)]) + b'\n'
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+
+        default_source = source in self.source_paths(self.storage_dir)
+        metadata = json.dumps({'source': os.path.basename(source) if default_source else source}).encode('utf-8')
+        metadata += b' ' * (-(self.HEADER.size + len(metadata)) % 8)
+        ids_bytes = np.array(ids, dtype='<u4').tobytes()
+        ids_bytes += b'\0' * (-len(ids_bytes) % 8)
+
+        tmp_index_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_index_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(ids), len(metadata)))
+            f.write(metadata)
+            f.write(ids_bytes)
+            f.write(np.array(offsets, dtype='<u8').tobytes())
+
+        # the records first: a new index never points into an old records file
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_index_path, self.index_path)
+        return len(ids)
+
+    def _open(self) -> bool:
+        '''
+        Maps the store. False if it is missing or was written by another version (it has to be built again).
+        '''
+        if not os.path.isfile(self.index_path) or not os.path.isfile(self.path):
+            return False
+
+        with open(self.index_path, 'rb') as f:
+            index_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, metadata_size = self.HEADER.unpack_from(index_mm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            index_mm.close()
+            return False
+
+        ids_offset = self.HEADER.size + metadata_size
+        offsets_offset = ids_offset + count * 4 + (-count * 4) % 8
+        self._index_mm = index_mm
+        source = json.loads(index_mm[self.HEADER.size:ids_offset])['source']
+        self.source = source if os.path.isabs(source) else os.path.realpath(os.path.join(self.storage_dir, source))
+        self._ids = np.frombuffer(index_mm, dtype='<u4', count=count, offset=ids_offset)
+        self._offsets = np.frombuffer(index_mm, dtype='<u8', count=count + 1, offset=offsets_offset)
+
+        # mmap can not map an empty file
+        if self._offsets[-1] > 0:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def ids(self) -> np.ndarray:
+        '''
+        :return: read-only view of the sorted IDs of the stored anime
+        :rtype: numpy.ndarray
+        '''
+        return self._ids
+
+    def _positions(self, anime_ids) -> np.ndarray:
+        '''
+        :return: the position of each ID in the index, -1 for IDs that are not stored
+        '''
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        positions = np.searchsorted(self._ids, anime_ids)
+        found = positions < len(self._ids)
+        found[found] = self._ids[positions[found]] == anime_ids[found]
+        return np.where(found, positions, -1)
+
+    def _read(self, position) -> dict:
+        return json_decoder.loads(self._mm[int(self._offsets[position]):int(self._offsets[position + 1])])
+
+    def get(self, anime_id):
+        '''
+        :param anime_id: the ID of the anime on Anilist (int or str)
+        :return: the anime record, or None if it is not stored
+        :rtype: dict or NoneType
+        '''
+        position = self._positions([int(anime_id)])[0]
+        return self._read(position) if position >= 0 else None
+
+    def get_many(self, anime_ids) -> list:
+        '''
+        :param anime_ids: IDs of the anime on Anilist (int or str)
+        :return: the anime records in the order of anime_ids, None for IDs that are not stored
+        :rtype: list
+        '''
+        if len(anime_ids) == 0:
+            return []
+        positions = self._positions([int(anime_id) for anime_id in anime_ids])
+        return [self._read(position) if position >= 0 else None for position in positions.tolist()]
+
+    def stored(self, anime_ids) -> list:
+        '''
+        :param anime_ids: IDs of the anime on Anilist (str)
+        :return: the IDs of anime_ids that have a stored record, in their order
+        :rtype: list
+        '''
+        if len(anime_ids) == 0:
+            return []
+        positions = self._positions([int(anime_id) for anime_id in anime_ids])
+        return [anime_id for anime_id, position in zip(anime_ids, positions.tolist()) if position >= 0]
+
+    def items(self):
+        '''
+        Iterates over every stored record, ordered by ID.
+
+        :return: generator of (anime ID (str), anime record)
+        :rtype: generator
+        '''
+        for position, anime_id in enumerate(self._ids.tolist()):
+            yield str(anime_id), self._read(position)
+
+    def __contains__(self, anime_id):
+        return self._positions([int(anime_id)])[0] >= 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def close(self):
+        '''
+        Unmaps the store (raises BufferError while arrays returned by ids() are still referenced).
+        '''
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._index_mm is not None:
+            self._ids = self._offsets = None
+            self._index_mm.close()
+            self._index_mm = None
+
+
+def load_record_store(storage_dir=None) -> RecordStore:
+    '''
+    Opens the record store once per process (see IndexRegistry), again when it is rebuilt.
+
+    :param storage_dir: directory of the json files. Default = databases/anime_database_files
+    :rtype: RecordStore
+    '''
+    if storage_dir is None:
+        storage_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anime_database_files')
+    # opening the store rebuilds it when a source changed, the index is watched too for stores built from a dump
+    index_path = os.path.splitext(RecordStore.default_path(storage_dir))[0] + '.idx'
+    return index_registry.get(('record_store', storage_dir), lambda: RecordStore(storage_dir=storage_dir),
+                              RecordStore.source_paths(storage_dir) + [index_path])
+
+
+def load_partial_records(storage_dir=None) -> dict:
+    '''
+    Records rebuilt from the json indexes alone, for the anime of the indexes that have no stored record (the
+    bundled database only ships a few full records). A partial record has the keys of a stored record, filled
+    from anime_by_tag/score/genre.json: name_romaji and name_english, average_score and genres, the other keys are
+    None. It also holds the anime 'id', its release 'year' (not in stored records) and 'partial': True.
+    Loaded once per process (see IndexRegistry), do not modify the dict.
+
+    :param storage_dir: directory of the json files. Default = databases/anime_database_files
+    :return: dict of {anime ID (str): partial record}
+    :rtype: dict
+    '''
+    if storage_dir is None:
+        storage_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anime_database_files')
+    filenames = ['anime_by_genre.json', 'anime_by_year.json', 'anime_by_score.json', 'anime_by_tag.json']
+    paths = [os.path.join(storage_dir, filename) for filename in filenames]
+
+    def build():
+        genre_dict, year_dict, score_dict, tag_dict = [json.load(open(path, 'r', encoding='utf-8')) for path in paths]
+        records = {}
+        def record(anime_id):
+            if anime_id not in records:
+                records[anime_id] = dict(dict.fromkeys(QSData.FIELD_PATHS['anime']), genres=[], id=int(anime_id), year=None, partial=True)
+            return records[anime_id]
+
+        for genre, anime_ids in genre_dict.items():
+            # the indexes are keyed by lower case genres (i.e. 'sci-fi' -> 'Sci-Fi', 'slice of life' -> 'Slice of Life')
+            name = genre.title().replace(' Of ', ' of ')
+            for anime_id in anime_ids:
+                record(anime_id)['genres'].append(name)
+        for year, anime_ids in year_dict.items():
+            for anime_id in anime_ids:
+                record(anime_id)['year'] = int(year) if year != 'None' else None
+        for score, anime_ids in score_dict.items():
+            for anime_id in anime_ids:
+                record(anime_id)['average_score'] = int(score) if score != '-1' else None
+        for tags, anime_id in tag_dict.items():
+            # 'english|=|romaji', or a single title when both are the same
+            titles = tags.split('|=|')
+            record(anime_id).update(name_english=titles[0], name_romaji=titles[-1])
+        return records
+    return index_registry.get(('partial_records', storage_dir), build, paths)
+
+
+def get_records(anime_ids, storage_dir=None) -> list:
+    '''
+    The records of the anime found by a search: the stored record of each anime, or its partial record (see
+    load_partial_records) when it has none, so a search finds the same anime with or without id_only.
+
+    :param anime_ids: IDs of the anime on Anilist (int or str)
+    :param storage_dir: directory of the json files. Default = databases/anime_database_files
+    :return: the records in the order of anime_ids, None for anime that are not in the database
+    :rtype: list
+    '''
+    records = load_record_store(storage_dir).get_many(anime_ids)
+    if None in records:
+        partial_records = load_partial_records(storage_dir)
+        for i, anime_id in enumerate(anime_ids):
+            partial = partial_records.get(str(anime_id)) if records[i] is None else None
+            if partial is not None:
+                records[i] = dict(partial, genres=list(partial['genres']))
+    return records
+
+
+if __name__ == '__main__':
+    import time
+    start = time.time()
+    store = RecordStore()
+    count = store.build(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f'Stored {count} anime records into {store.path} in {time.time() - start:.2f}s')
@@ -4,6 +4,10 @@ import numpy as np
 import time
 import json
 import os
+import copy
+
+from .index_registry import index_registry
+from .record_store import load_record_store
 
 
 class SearchEngine:
@@ -19,7 +23,7 @@ class SearchEngine:
         self.cache_size = 500
 
     def search_anime_database(self, anime_name, accuracy_threshold=0.7, full_record_override=False):
-        tag_dict = self.load_json(self.tag_dict_dir)
+        tag_dict = self.load_index(self.tag_dict_dir)
 
         resulting_dict = dict()
         caching_dict = self.load_json(self.tag_cache_dict_dir)
@@ -28,7 +32,6 @@ class SearchEngine:
         ini_len = len(resulting_dict)
 
         # searches the cached database
-        import copy
         temp_caching_dict = copy.deepcopy(caching_dict)
         if full_record_override == False:
             for anime_tag, anime_id in temp_caching_dict.items():
@@ -93,12 +96,46 @@ class SearchEngine:
             json.dump(caching_dict, wf, indent=4)
 
         
-        resulting_list = []
-        id_dict = self.load_json(self.id_dict_dir)
-        for anime_id, acc in resulting_dict.items():
-            resulting_list.append(id_dict[anime_id])
+        # only the matched records are read from the record store
+        return [record for record in self.get_anime_records(list(resulting_dict)) if record is not None]
+
+    def load_id_dict(self) -> dict:
+        '''
+        Loads the anime records by ID. Falls back to the cached records when the full database is not present.
+        The dict is shared by the process (see IndexRegistry), do not modify it.
+        Loads every record, use get_anime_record / get_anime_records to read a few of them.
+
+        :return: dict of {anime ID (str): anime record}
+        :rtype: dict
+        '''
+        if os.path.isfile(self.id_dict_dir):
+            return self.load_index(self.id_dict_dir)
+
+        def load_cached_records():
+            id_dict = self.load_json(self.id_cache_dict_dir)
+            id_dict.pop('placeholder', None)
+            return id_dict
+        return index_registry.get(('records', self.id_cache_dict_dir), load_cached_records, [self.id_cache_dict_dir])
+
+    def get_anime_record(self, anime_id):
+        '''
+        Retrieves an anime record (same keys as Anilist.get_anime) from the local database.
 
-        return resulting_list
+        :param anime_id: the ID of the anime on Anilist
+        :return: the anime record or None if it is not in the local database
+        :rtype: dict or NoneType
+        '''
+        return load_record_store(self.storage_dir).get(anime_id)
+
+    def get_anime_records(self, anime_ids) -> list:
+        '''
+        Retrieves anime records from the local database, only these records are read (see RecordStore).
+
+        :param anime_ids: list of anime IDs on Anilist
+        :return: the anime records in the order of anime_ids (None for IDs that are not in the local database)
+        :rtype: list
+        '''
+        return load_record_store(self.storage_dir).get_many(anime_ids)
 
     def levenshtein_ratio(self, s, t, ratio_calc = False):
         '''
@@ -141,6 +178,12 @@ class SearchEngine:
         else:
             return "The strings are {} edits away".format(distance[row][col])
 
+    def load_index(self, filename):
+        '''
+        Loads a json file once per process (see IndexRegistry), again when it changes. The dict is shared, do not modify it.
+        '''
+        return index_registry.get(('json', filename), lambda: self.load_json(filename), [filename])
+
     def load_json(self, filename):
         with open(filename, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -0,0 +1,219 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from ..response_cache import ResponseCache
+from .. import json_decoder
+
+
+# created on first use and gitignored, unlike the tracked anime_database.sqlite3 placeholder
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anilist_cache.sqlite3')
+
+
+class SQLiteCache(ResponseCache):
+    '''
+    Persistent cache of Anilist GraphQL responses and parsed entities stored in anilist_cache.sqlite3.
+    Uses the same keys and TTLs as ResponseCache, so it can be plugged into the request handler as-is, but survives
+    restarts: a new process starts warm. The database runs in WAL mode so several worker processes on the same host
+    can read and write it at once. Once the cache grows past max_bytes, the least recently used entries are evicted.
+    '''
+    ACCESS_RESOLUTION = 60 # seconds between two updates of an entry's last access time
+    EVICTION_INTERVAL = 32 # number of writes between two size checks
+
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024, ttl=None):
+        '''
+        :param path: path of the sqlite database. Default = databases/anilist_cache.sqlite3
+        :param max_bytes: Max total size of the cached payloads. Default = 64MB
+        :param ttl: dict of {entity type: seconds} overriding ResponseCache.DEFAULT_TTL
+        '''
+        super().__init__(ttl=ttl)
+        self.path = path if path is not None else DEFAULT_CACHE_PATH
+        self.max_bytes = max_bytes
+
+        self._local = threading.local()
+        self._write_count = 0
+        self._setup()
+
+    def _setup(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries (
+                                key TEXT PRIMARY KEY,
+                                entity TEXT,
+                                body BLOB NOT NULL,
+                                size INTEGER NOT NULL,
+                                expires_at REAL NOT NULL,
+                                accessed_at REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        '''
+        sqlite connections can not be shared between threads, every thread opens its own.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _hash_key(key) -> str:
+        return hashlib.sha1('\x00'.join(key).encode('utf-8')).hexdigest()
+
+    def _get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT body, expires_at, accessed_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+
+        with self._lock:
+            if row is None or row[1] <= now:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if row is None:
+            return None
+        if row[1] <= now:
+            with conn:
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            return None
+
+        if now - row[2] > self.ACCESS_RESOLUTION:
+            with conn:
+                conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def _set(self, key, entity, body, ttl):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entries (key, entity, body, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, entity, body, len(body), now + ttl, now))
+
+        with self._lock:
+            self._write_count += 1
+            check_size = self._write_count % self.EVICTION_INTERVAL == 1
+        if check_size:
+            self.evict()
+
+    def get(self, query, variables):
+        '''
+        :param query: GraphQL query string
+        :param variables: the variables of the query
+        :return: the cached raw response body or None on a miss
+        :rtype: bytes or NoneType
+        '''
+        return self._get(self._hash_key(self.make_key(query, variables)))
+
+    def set(self, query, variables, body, entity=None):
+        '''
+        :param query: GraphQL query string
+        :param variables: the variables of the query
+        :param body: the raw response body
+        :param entity: entity type used to pick the TTL
+        '''
+        ttl = self.get_ttl(entity, body)
+        if ttl > 0:
+            self._set(self._hash_key(self.make_key(query, variables)), entity, bytes(body), ttl)
+
+    def get_entity(self, category, entity_id):
+        '''
+        Retrieves a single decoded entity (a Media or Character obj), cached independently of the query it came from.
+        Used by the batched lookups so that only the IDs missing from the cache are requested.
+
+        :param category: 'anime', 'manga' or 'character'
+        :param entity_id: the ID of the entity on Anilist
+        :return: the entity dict or None on a miss
+        :rtype: dict or NoneType
+        '''
+        data = self._get(f'entity:{category}:{entity_id}')
+        return json_decoder.loads(data) if data is not None else None
+
+    def set_entity(self, category, entity_id, entity_dict):
+        '''
+        Stores a single decoded entity (a Media or Character obj).
+
+        :param category: 'anime', 'manga' or 'character'
+        :param entity_id: the ID of the entity on Anilist
+        :param entity_dict: the entity dict
+        '''
+        body = json_decoder.dumps(entity_dict)
+        ttl = self.get_ttl(category, body)
+        if ttl > 0:
+            self._set(f'entity:{category}:{entity_id}', category, body, ttl)
+
+    def evict(self) -> int:
+        '''
+        Removes expired entries, then the least recently used ones until the cache fits in max_bytes.
+
+        :return: number of removed entries
+        :rtype: int
+        '''
+        conn = self._connect()
+        with conn:
+            removed = conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),)).rowcount
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+
+            if total > self.max_bytes:
+                # drop down to 90% of the cap so the next few writes do not trigger another eviction
+                to_free = total - int(self.max_bytes * 0.9)
+                freed = 0
+                keys = []
+                for key, size in conn.execute('SELECT key, size FROM cache_entries ORDER BY accessed_at'):
+                    keys.append((key,))
+                    freed += size
+                    if freed >= to_free:
+                        break
+                conn.executemany('DELETE FROM cache_entries WHERE key = ?', keys)
+                removed += len(keys)
+
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def invalidate(self, query=None, variables=None, entity=None) -> int:
+        '''
+        Removes cached entries. Without arguments the whole cache is cleared.
+        Filtering on the query alone is not possible here (keys are hashed): pass variables too, or use entity.
+
+        :param query: only remove this exact request (requires variables)
+        :param variables: the variables of the request to remove
+        :param entity: only remove entries of this entity type
+        :return: number of removed entries
+        :rtype: int
+        '''
+        conn = self._connect()
+        with conn:
+            if query is not None and variables is not None:
+                return conn.execute('DELETE FROM cache_entries WHERE key = ?', (self._hash_key(self.make_key(query, variables)),)).rowcount
+            if query is not None:
+                raise ValueError('SQLiteCache can only invalidate a query together with its variables.')
+            if entity is not None:
+                return conn.execute('DELETE FROM cache_entries WHERE entity = ?', (entity,)).rowcount
+            return conn.execute('DELETE FROM cache_entries').rowcount
+
+    def stats(self) -> dict:
+        '''
+        :return: dict with the number of entries, their total size, and the hits/misses/evictions of this process
+        :rtype: dict
+        '''
+        entries, total = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+        with self._lock:
+            return {'entries': entries,
+                    'bytes': total,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
+
+    def close(self):
+        '''
+        Closes the connection of the calling thread.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,66 @@
+import os
+import json
+import unicodedata
+
+from .index_registry import index_registry
+
+
+def normalize_title(title) -> str:
+    '''
+    Canonical form of a title used for matching: Unicode NFKC, casefolded, punctuation and whitespace folded.
+    i.e. 'Code Geass!' -> 'code geass', 'Ｒｅ：ＺＥＲＯ' -> 're zero', "Kino's Journey" -> 'kinos journey'
+
+    :param title: the title or name to normalize
+    :rtype: str
+    '''
+    title = unicodedata.normalize('NFKC', title).casefold()
+    title = title.replace("'", '').replace('\u2019', '') # Kino's -> kinos
+    title = ''.join(' ' if unicodedata.category(char)[0] in 'PSZ' else char for char in title)
+    return ' '.join(title.split())
+
+
+class TitleResolver:
+    '''
+    Resolves anime titles to their Anilist IDs with the bundled anime_by_tag.json ("english|=|romaji" -> ID) without
+    calling the search API. A title resolves when it matches exactly, or after normalization, a single anime;
+    unknown and ambiguous titles (i.e. 'Berserk', shared by several anime) return None so the caller can search Anilist.
+    The title maps are built once per process and shared by every resolver (see IndexRegistry).
+    '''
+    def __init__(self, tag_path=None):
+        '''
+        :param tag_path: path of the title -> ID json file. Default = anime_database_files/anime_by_tag.json
+        '''
+        if tag_path is None:
+            tag_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'anime_database_files', 'anime_by_tag.json')
+        self.tag_path = tag_path
+
+    def _build_maps(self):
+        with open(self.tag_path, 'r', encoding='utf-8') as f:
+            tag_dict = json.load(f)
+
+        exact = {}
+        normalized = {}
+        for tags, anime_id in tag_dict.items():
+            for title in tags.split('|=|'):
+                exact.setdefault(title, set()).add(int(anime_id))
+                normalized.setdefault(normalize_title(title), set()).add(int(anime_id))
+        return exact, normalized
+
+    def _load_maps(self):
+        return index_registry.get(('title_maps', self.tag_path), self._build_maps, [self.tag_path])
+
+    def resolve(self, title):
+        '''
+        :param title: the title of the anime (english or romaji)
+        :return: the anime's ID on Anilist, or None if the title is unknown or ambiguous
+        :rtype: int or NoneType
+        '''
+        exact, normalized = self._load_maps()
+
+        ids = exact.get(title.strip())
+        if ids is None:
+            ids = normalized.get(normalize_title(title))
+
+        if ids is None or len(ids) != 1:
+            return None
+        return next(iter(ids))
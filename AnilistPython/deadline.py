@@ -0,0 +1,98 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(TimeoutError):
+    '''
+    Raised when a lookup runs out of its time budget (see Deadline).
+    '''
+    pass
+
+
+class Deadline:
+    '''
+    Absolute time budget shared by every request of a compound lookup (i.e. get_anime: search, then info).
+    Each request only gets the time that is left, so the whole lookup has a hard upper bound on latency.
+    '''
+    def __init__(self, timeout):
+        '''
+        :param timeout: budget in seconds, starting now
+        '''
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        '''
+        :return: seconds left before the deadline (0 once it has passed)
+        :rtype: float
+        '''
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, operation='request'):
+        '''
+        :param operation: what was about to run, used in the error message
+        :raises DeadlineExceeded: if the deadline has passed
+        '''
+        if self.expired():
+            raise DeadlineExceeded(f'Deadline of {self.timeout}s exceeded before {operation}.')
+
+    def __repr__(self):
+        return f'Deadline(timeout={self.timeout}, remaining={self.remaining():.3f})'
+
+
+# deadline of the lookup running in the current thread / asyncio task
+_current_deadline = contextvars.ContextVar('anilist_deadline', default=None)
+
+
+def current_deadline():
+    '''
+    :return: the deadline of the current lookup or None
+    :rtype: Deadline or NoneType
+    '''
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(timeout=None, deadline=None):
+    '''
+    Applies a deadline to every request sent inside the with block (including nested lookups).
+    When a deadline is already active, the earliest one wins.
+
+    :param timeout: budget in seconds for the block (None for no new budget)
+    :param deadline: a Deadline shared with other calls (None for no shared budget)
+    '''
+    candidates = [d for d in (deadline, Deadline(timeout) if timeout is not None else None, _current_deadline.get())
+                  if d is not None]
+    if not candidates:
+        yield None
+        return
+
+    earliest = min(candidates, key=lambda d: d.expires_at)
+    token = _current_deadline.set(earliest)
+    try:
+        yield earliest
+    finally:
+        _current_deadline.reset(token)
+
+
+def request_timeout(timeout, operation='request'):
+    '''
+    Caps the timeout of a single request by the time left on the current deadline.
+
+    :param timeout: the default timeout of the request in seconds (None to wait forever)
+    :param operation: what is about to run, used in the error message
+    :return: the timeout to use
+    :rtype: float or NoneType
+    :raises DeadlineExceeded: if the current deadline has already passed
+    '''
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return timeout
+
+    deadline.check(operation)
+    remaining = deadline.remaining()
+    return remaining if timeout is None else min(timeout, remaining)
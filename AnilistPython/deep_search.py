@@ -1,5 +1,5 @@
 import re
-from support_files.translate import AnilistPythonTranslate
+from .support_files.translate import AnilistPythonTranslate
 
 class DeepSearch():
     '''
@@ -0,0 +1,185 @@
+import time
+import threading
+import statistics
+from collections import deque
+
+import requests
+
+
+class CircuitOpenError(ConnectionError):
+    '''
+    Raised instead of sending a request while Anilist is considered unreachable or too slow (see HealthMonitor).
+    '''
+    pass
+
+
+class HealthMonitor:
+    '''
+    Tracks the health of the Anilist API and acts as a circuit breaker for the request handlers.
+    Every request reports its round-trip time and outcome, and a background thread probes the API with a tiny query.
+    When too many requests fail in a row, the error rate is too high, or the median round-trip time is too slow,
+    the circuit opens: requests fail right away with CircuitOpenError (and Anilist routes lookups to the local
+    database) instead of waiting on timeouts. The circuit closes again as soon as a probe comes back fast and healthy.
+    Safe to share across threads.
+    '''
+    PROBE_QUERY = 'query { Page(page: 1, perPage: 1) { pageInfo { total } } }'
+
+    def __init__(self, url='https://graphql.anilist.co', window=20, min_samples=5, failure_threshold=5, error_rate=0.5,
+                 slow_threshold=5.0, probe_interval=60.0, recovery_interval=10.0, probe_timeout=5.0):
+        '''
+        :param url: the url of the Anilist API
+        :param window: number of recent requests used for the error rate and the median round-trip time. Default = 20
+        :param min_samples: requests needed in the window before the error rate or latency can open the circuit. Default = 5
+        :param failure_threshold: consecutive failures that open the circuit. Default = 5
+        :param error_rate: error rate of the window that opens the circuit. Default = 0.5
+        :param slow_threshold: median round-trip time (in seconds) that opens the circuit. Default = 5
+        :param probe_interval: seconds between two probes while the circuit is closed (None to only probe while open). Default = 60
+        :param recovery_interval: seconds between two probes while the circuit is open. Default = 10
+        :param probe_timeout: timeout of a probe in seconds. Default = 5
+        '''
+        self.url = url
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.slow_threshold = slow_threshold
+        self.probe_interval = probe_interval
+        self.recovery_interval = recovery_interval
+        self.probe_timeout = probe_timeout
+
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window) # (round-trip time, success)
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self.reason = None
+
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def online(self) -> bool:
+        '''
+        False while the circuit is open.
+        '''
+        return self._opened_at is None
+
+    def allow_request(self) -> bool:
+        '''
+        Called by the request handlers before each request. Starts the background probes on first use.
+
+        :rtype: bool
+        '''
+        if self._thread is None and not self._stopped:
+            self.start()
+        return self._opened_at is None
+
+    def record(self, latency, success):
+        '''
+        Reports the outcome of a request.
+
+        :param latency: round-trip time in seconds
+        :param success: False for connection errors, timeouts and 5xx responses
+        '''
+        with self._lock:
+            self._samples.append((latency, success))
+            self._consecutive_failures = 0 if success else self._consecutive_failures + 1
+
+            if self._opened_at is None:
+                reason = self._check()
+                if reason is not None:
+                    self._open(reason)
+
+    def _check(self):
+        if self._consecutive_failures >= self.failure_threshold:
+            return f'{self._consecutive_failures} consecutive failures'
+        if len(self._samples) < self.min_samples:
+            return None
+
+        failures = sum(1 for _, success in self._samples if not success)
+        if failures / len(self._samples) >= self.error_rate:
+            return f'error rate of {failures}/{len(self._samples)}'
+
+        latencies = [latency for latency, success in self._samples if success]
+        if latencies and statistics.median(latencies) > self.slow_threshold:
+            return f'median round-trip time of {statistics.median(latencies):.1f}s'
+        return None
+
+    def _open(self, reason):
+        self._opened_at = time.monotonic()
+        self.reason = reason
+        self._wakeup.set() # switch the background thread to the recovery interval
+
+    def _close(self):
+        self._opened_at = None
+        self.reason = None
+        self._samples.clear()
+        self._consecutive_failures = 0
+
+    def probe(self) -> bool:
+        '''
+        Sends the probe query and updates the state of the circuit with its outcome.
+
+        :return: True if Anilist answered in time
+        :rtype: bool
+        '''
+        start = time.monotonic()
+        try:
+            response = requests.post(self.url, json={'query': self.PROBE_QUERY}, timeout=self.probe_timeout)
+            success = response.status_code < 500
+        except requests.RequestException:
+            success = False
+        latency = time.monotonic() - start
+
+        with self._lock:
+            if self._opened_at is None:
+                self._samples.append((latency, success))
+                self._consecutive_failures = 0 if success else self._consecutive_failures + 1
+                reason = self._check()
+                if reason is not None:
+                    self._open(reason)
+            elif success and latency <= self.slow_threshold:
+                self._close()
+        return success
+
+    def _run(self):
+        while not self._stopped:
+            interval = self.recovery_interval if self._opened_at is not None else self.probe_interval
+            woken = self._wakeup.wait(interval)
+            self._wakeup.clear()
+            # woken up when the circuit opens: wait for the recovery interval before the first probe
+            if not self._stopped and not woken:
+                self.probe()
+
+    def start(self):
+        '''
+        Starts the background probes (daemon thread).
+        '''
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='AnilistHealthMonitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        '''
+        Stops the background probes.
+        '''
+        self._stopped = True
+        self._wakeup.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.probe_timeout + 1)
+
+    def stats(self) -> dict:
+        '''
+        :return: dict with the state of the circuit, why it opened, and the error rate / median round-trip time of the window
+        :rtype: dict
+        '''
+        with self._lock:
+            latencies = [latency for latency, success in self._samples if success]
+            return {'online': self._opened_at is None,
+                    'reason': self.reason,
+                    'samples': len(self._samples),
+                    'error_rate': sum(1 for _, success in self._samples if not success) / len(self._samples) if self._samples else 0.0,
+                    'median_latency': statistics.median(latencies) if latencies else None}
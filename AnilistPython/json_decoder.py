@@ -0,0 +1,37 @@
+import json
+
+# orjson is optional (pip install orjson). It parses bytes directly and is several times faster than the stdlib.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def loads(body):
+    '''
+    Decodes a json response straight from its raw bytes (no intermediate str).
+    Uses orjson when installed, the stdlib json module otherwise (which also accepts bytes).
+    Both backends raise a ValueError on invalid json.
+
+    :param body: the raw response body
+    :return: the decoded json obj
+    :rtype: dict
+    '''
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(obj) -> bytes:
+    '''
+    Encodes an object to compact json bytes.
+
+    :param obj: the obj to encode
+    :return: the utf-8 encoded json
+    :rtype: bytes
+    '''
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
@@ -1,112 +1,146 @@
 import time
 import requests
-from retrieve_data import ExtractInfo
-from retrieve_id import ExtractID
+from .retrieve_data import ExtractInfo
+from .retrieve_id import ExtractID
+
+# parsers of every key of the manga dict, in display order (QSData.FIELD_PATHS lists the GraphQL fields each key needs)
+MANGA_PARSERS = {
+    'name_romaji':    lambda lvl: lvl['title']['romaji'],
+    'name_english':   lambda lvl: lvl['title']['english'],
+    'starting_time':  lambda lvl: f"{lvl['startDate']['month']}/{lvl['startDate']['day']}/{lvl['startDate']['year']}",
+    'ending_time':    lambda lvl: f"{lvl['endDate']['month']}/{lvl['endDate']['day']}/{lvl['endDate']['year']}",
+    'cover_image':    lambda lvl: lvl['coverImage']['large'],
+    'banner_image':   lambda lvl: lvl['bannerImage'],
+    'release_format': lambda lvl: lvl['format'],
+    'release_status': lambda lvl: lvl['status'],
+    'chapters':       lambda lvl: lvl['chapters'],
+    'volumes':        lambda lvl: lvl['volumes'],
+    'desc':           lambda lvl: lvl['description'],
+    'average_score':  lambda lvl: lvl['averageScore'],
+    'mean_score':     lambda lvl: lvl['meanScore'],
+    'genres':         lambda lvl: lvl['genres'],
+    'synonyms':       lambda lvl: lvl['synonyms'],
+}
+
 
 class Manga:
-    def __init__(self, access_info, activated=True):
+    def __init__(self, access_info, activated=True, fused_search=True, id_cache=None):
         self.extractInfo = ExtractInfo(access_info, activated)
         self.extractID = ExtractID(access_info, activated)
+        self.fused_search = fused_search # resolve the name and retrieve the info with a single request
+        self.id_cache = id_cache # IDCache of previously searched names (None to disable)
 
 
-    def getManga(self, manga_name, manual_select=False):
+    def getManga(self, manga_name, manual_select=False, fields=None):
         '''
         Retrieve character info in the form of a json object.
         Retrieve json object will be reformatted in a easily accessable json obj.
 
         :param character_name: The name of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'chapters']). All keys by default.
         :return: parsed dict containing the character's data
         :rtype: dict
         '''
-        manga_dict = {}
+        if manual_select == False:
+            manga_id = self._cachedID(manga_name)
+            if manga_id is not None:
+                return self.getMangaWithID(manga_id, fields)
+
+        if manual_select == False and self.fused_search == True:
+            data = self.extractID.manga_with_info(manga_name, fields=fields)
+            try:
+                media_lvl = data['data']['Page']['media'][0]
+            except IndexError:
+                self._storeID(manga_name, None)
+                raise IndexError('Manga Not Found')
+            self._storeID(manga_name, media_lvl['id'])
+            return self.parseMangaInfo(media_lvl, fields)
 
         manga_id = self.getMangaID(manga_name, manual_select)
         if manga_id == -1:
             return None
 
-        data = self.extractInfo.manga(manga_id)
-        media_lvl = data['data']['Media']
-        
-        manga_dict['name_romaji'] = media_lvl['title']['romaji']
-        manga_dict['name_english'] = media_lvl['title']['english']
-
-        start_year = media_lvl['startDate']['year']
-        start_month = media_lvl['startDate']['month']
-        start_day = media_lvl['startDate']['day']
-
-        end_year = media_lvl['endDate']['year']
-        end_month = media_lvl['endDate']['month']
-        end_day = media_lvl['endDate']['day']
-
-        manga_dict['starting_time'] = f'{start_month}/{start_day}/{start_year}'
-        manga_dict['ending_time'] = f'{end_month}/{end_day}/{end_year}'
-
-        manga_dict['cover_image'] = media_lvl['coverImage']['large']
-        manga_dict['banner_image'] = media_lvl['bannerImage']
-
-        manga_dict['release_format'] = media_lvl['format']
-        manga_dict['release_status'] = media_lvl['status']
-
-        manga_dict['chapters'] = media_lvl['chapters']
-        manga_dict['volumes'] = media_lvl['volumes']
-
-        manga_dict['desc'] = media_lvl['description']
-
-        manga_dict['average_score'] = media_lvl['averageScore']
-        manga_dict['mean_score'] = media_lvl['meanScore']
-
-        manga_dict['genres'] = media_lvl['genres']
-        manga_dict['synonyms'] = media_lvl['synonyms']
-
-        return manga_dict
+        data = self.extractInfo.manga(manga_id, fields)
+        return self.parseMangaInfo(data['data']['Media'], fields)
 
 
-    def getMangaWithID(self, manga_id) -> dict:
+    def getMangaWithID(self, manga_id, fields=None) -> dict:
         '''
         Retrieve character info in the form of a json object.
         Retrieve json object will be reformatted in a easily accessable json obj.
 
         :param character_name: The name of the character
+        :param fields: only retrieve these keys of the parsed dict (i.e. ['name_romaji', 'chapters']). All keys by default.
         :return: parsed dict containing the character's data
         :rtype: dict
         '''
-        manga_dict = {}
+        data = self.extractInfo.manga(manga_id, fields)
+        return self.parseMangaInfo(data['data']['Media'], fields)
 
-        data = self.extractInfo.manga(manga_id)
-        media_lvl = data['data']['Media']
-        
-        manga_dict['name_romaji'] = media_lvl['title']['romaji']
-        manga_dict['name_english'] = media_lvl['title']['english']
 
-        start_year = media_lvl['startDate']['year']
-        start_month = media_lvl['startDate']['month']
-        start_day = media_lvl['startDate']['day']
+    def getMangaWithIDs(self, manga_ids, batch_size=25, fields=None) -> list:
+        '''
+        Retrieve the info of many manga at once using their IDs.
+        IDs are packed into aliased queries of batch_size IDs, so only len(manga_ids) / batch_size requests are made.
+
+        :param manga_ids: list of manga IDs on Anilist
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve these keys of the parsed dicts. All keys by default.
+        :return: list of parsed dicts in the order of manga_ids (None for IDs that were not found)
+        :rtype: list
+        '''
+        data = self.extractInfo.batch('manga', manga_ids, batch_size, fields)
+        return [self.parseMangaInfo(media_lvl, fields) if media_lvl is not None else None for media_lvl in data]
+
+
+    def iterMangaSearch(self, manga_name, page_size=50):
+        '''
+        Lazily walks every page of the search results of a manga name (see ExtractID.iter_search).
+
+        :param manga_name: The name of the manga
+        :param page_size: number of results requested per page (max 50). Default = 50
+        :return: generator of search entries (dicts containing the ID, title and image of each result)
+        :rtype: generator
+        '''
+
+        return self.extractID.iter_search('manga', manga_name, page_size)
 
-        end_year = media_lvl['endDate']['year']
-        end_month = media_lvl['endDate']['month']
-        end_day = media_lvl['endDate']['day']
 
-        manga_dict['starting_time'] = f'{start_month}/{start_day}/{start_year}'
-        manga_dict['ending_time'] = f'{end_month}/{end_day}/{end_year}'
+    @staticmethod
+    def parseMangaInfo(media_lvl, fields=None) -> dict:
+        '''
+        Reformats the Media level of a manga info query into an easily accessable dict.
 
-        manga_dict['cover_image'] = media_lvl['coverImage']['large']
-        manga_dict['banner_image'] = media_lvl['bannerImage']
+        :param media_lvl: the 'Media' obj of the json returned by ExtractInfo.manga
+        :param fields: only return these keys (the query must have been built with the same fields). All keys by default.
+        :return: parsed dict containing the manga's data
+        :rtype: dict
+        '''
 
-        manga_dict['release_format'] = media_lvl['format']
-        manga_dict['release_status'] = media_lvl['status']
+        if fields is None:
+            return {key: parser(media_lvl) for key, parser in MANGA_PARSERS.items()}
 
-        manga_dict['chapters'] = media_lvl['chapters']
-        manga_dict['volumes'] = media_lvl['volumes']
+        for field in fields:
+            if field not in MANGA_PARSERS:
+                raise KeyError(f'Incorrect manga field -> {field}')
+        return {key: parser(media_lvl) for key, parser in MANGA_PARSERS.items() if key in fields}
 
-        manga_dict['desc'] = media_lvl['description']
 
-        manga_dict['average_score'] = media_lvl['averageScore']
-        manga_dict['mean_score'] = media_lvl['meanScore']
+    def _cachedID(self, manga_name):
+        '''
+        Resolves a manga name searched before without the search API (see IDCache). None if it has to be searched on Anilist.
+        '''
+        if self.id_cache is None:
+            return None
+        manga_id = self.id_cache.get('manga', manga_name)
+        if manga_id == self.id_cache.NOT_FOUND:
+            raise IndexError('Manga Not Found')
+        return manga_id
 
-        manga_dict['genres'] = media_lvl['genres']
-        manga_dict['synonyms'] = media_lvl['synonyms']
 
-        return manga_dict
+    def _storeID(self, manga_name, manga_id):
+        if self.id_cache is not None:
+            self.id_cache.set('manga', manga_name, manga_id)
 
 
     def getMangaID(self, manga_name, manual_select=False):
@@ -119,6 +153,11 @@ class Manga:
         '''
 
         if manual_select == False:
+            # names searched before are resolved locally
+            manga_id = self._cachedID(manga_name)
+            if manga_id is not None:
+                return manga_id
+
             manga_list = []
             data = self.extractID.manga(manga_name)
             for i in range(len(data['data']['Page']['media'])):
@@ -131,7 +170,9 @@ class Manga:
             try:
                 manga_ID = data['data']['Page']['media'][0]['id']
             except IndexError:
+                self._storeID(manga_name, None)
                 raise IndexError('Manga Not Found')
+            self._storeID(manga_name, manga_ID)
 
             return manga_ID
 
@@ -2,11 +2,54 @@ class QSData:
     '''
     Class for storing query strings.
     '''
+    # root field and extra arguments of the info queries
+    QUERY_ROOTS = {'anime': ('Media', ', type: ANIME'),
+                   'manga': ('Media', ', type: MANGA'),
+                   'character': ('Character', '')}
+
+    # GraphQL fields required by each key of the parsed anime/manga/character dicts (used for field projection)
+    FIELD_PATHS = {
+        'anime': {'name_romaji': ['title.romaji'],
+                  'name_english': ['title.english'],
+                  'starting_time': ['startDate.year', 'startDate.month', 'startDate.day'],
+                  'ending_time': ['endDate.year', 'endDate.month', 'endDate.day'],
+                  'cover_image': ['coverImage.large'],
+                  'banner_image': ['bannerImage'],
+                  'airing_format': ['format'],
+                  'airing_status': ['status'],
+                  'airing_episodes': ['episodes'],
+                  'season': ['season'],
+                  'desc': ['description'],
+                  'average_score': ['averageScore'],
+                  'genres': ['genres'],
+                  'next_airing_ep': ['nextAiringEpisode.airingAt', 'nextAiringEpisode.timeUntilAiring', 'nextAiringEpisode.episode']},
+        'manga': {'name_romaji': ['title.romaji'],
+                  'name_english': ['title.english'],
+                  'starting_time': ['startDate.year', 'startDate.month', 'startDate.day'],
+                  'ending_time': ['endDate.year', 'endDate.month', 'endDate.day'],
+                  'cover_image': ['coverImage.large'],
+                  'banner_image': ['bannerImage'],
+                  'release_format': ['format'],
+                  'release_status': ['status'],
+                  'chapters': ['chapters'],
+                  'volumes': ['volumes'],
+                  'desc': ['description'],
+                  'average_score': ['averageScore'],
+                  'mean_score': ['meanScore'],
+                  'genres': ['genres'],
+                  'synonyms': ['synonyms']},
+        'character': {'first_name': ['name.first'],
+                      'last_name': ['name.last'],
+                      'native_name': ['name.native'],
+                      'desc': ['description'],
+                      'image': ['image.large']},
+    }
+
     def __init__(self):
+        self._qs_cache = {}
+
         # ANIME =====================================================
-        self.animeInfoQS = """\
-            query ($id: Int) {
-                Media(id: $id, type: ANIME) {
+        self.animeInfoFields = """\
                     title {
                         romaji
                         english
@@ -39,14 +82,17 @@ class QSData:
                         timeUntilAiring
                         episode
                     }
+"""
+        self.animeInfoQS = """\
+            query ($id: Int) {
+                Media(id: $id, type: ANIME) {
+""" + self.animeInfoFields + """\
                 }
             }
         """
 
         # MANGA =====================================================
-        self.mangaInfoQS = """\
-            query ($id: Int) {
-                Media(id: $id, type: MANGA) {
+        self.mangaInfoFields = """\
                     title {
                         romaji
                         english
@@ -77,6 +123,11 @@ class QSData:
                     meanScore
                     genres
                     synonyms
+"""
+        self.mangaInfoQS = """\
+            query ($id: Int) {
+                Media(id: $id, type: MANGA) {
+""" + self.mangaInfoFields + """\
                 }
             }
         """
@@ -106,9 +157,7 @@ class QSData:
         """
 
         # CHARACTER =====================================================
-        self.characterInfoQS = """\
-            query ($id: Int) {
-                Character (id: $id) {
+        self.characterInfoFields = """\
                     name {
                         first
                         last
@@ -118,6 +167,11 @@ class QSData:
                     image {
                         large
                     }
+"""
+        self.characterInfoQS = """\
+            query ($id: Int) {
+                Character (id: $id) {
+""" + self.characterInfoFields + """\
                 }
             }
         """
@@ -183,6 +237,23 @@ class QSData:
             }
         """
 
+        # ANIME UPDATES ==============================================================
+        # every anime, most recently updated first (used by the delta sync of the local database)
+        self.animeUpdatesQS = """\
+            query ($page: Int, $perpage: Int) {
+                Page (page: $page, perPage: $perpage) {
+                    pageInfo {
+                        currentPage
+                        hasNextPage
+                    }
+                    media (type: ANIME, sort: UPDATED_AT_DESC) {
+                        id
+                        updatedAt
+                    }
+                }
+            }
+        """
+
         # CHARACTER ID ===================================================================
         self.characterIDQS = """\
             query ($query: String, $page: Int, $perpage: Int) {
@@ -280,6 +351,42 @@ class QSData:
             }
         """
 
+        # ANIME SEARCH + INFO (single round trip) ===================================
+        self.animeSearchInfoQS = """\
+            query ($query: String, $page: Int, $perpage: Int) {
+                Page (page: $page, perPage: $perpage) {
+                    media (search: $query, type: ANIME) {
+                        id
+""" + self.animeInfoFields + """\
+                    }
+                }
+            }
+        """
+
+        # CHARACTER SEARCH + INFO (single round trip) ===================================
+        self.characterSearchInfoQS = """\
+            query ($query: String, $page: Int, $perpage: Int) {
+                Page (page: $page, perPage: $perpage) {
+                    characters (search: $query) {
+                        id
+""" + self.characterInfoFields + """\
+                    }
+                }
+            }
+        """
+
+        # MANGA SEARCH + INFO (single round trip) ===================================
+        self.mangaSearchInfoQS = """\
+            query ($query: String, $page: Int, $perpage: Int) {
+                Page (page: $page, perPage: $perpage) {
+                    media (search: $query, type: MANGA) {
+                        id
+""" + self.mangaInfoFields + """\
+                    }
+                }
+            }
+        """
+
         # GET AUTHENTICATED CURRENT USER ID
         self.user_get_idQS = """\
             query{
@@ -381,4 +488,145 @@ class QSData:
                 }
             }
             }
-        """
\ No newline at end of file
+        """
+
+    def fieldSelection(self, category, fields=None) -> str:
+        '''
+        Returns the selection set of an info query. With fields, only the GraphQL fields needed by those keys of the
+        parsed dict are selected (see FIELD_PATHS), which keeps payloads small (i.e. without the description).
+        Generated selections are cached.
+
+        :param category: 'anime', 'manga' or 'character'
+        :param fields: keys of the parsed dict to retrieve (i.e. ['name_romaji', 'average_score']). All fields by default.
+        :return: the selection set
+        :rtype: str
+        '''
+        if category not in self.FIELD_PATHS:
+            raise KeyError(f'Incorrect category -> {category}')
+
+        if fields is None:
+            return getattr(self, f'{category}InfoFields')
+        # a single key would be read as its characters
+        if isinstance(fields, str):
+            raise TypeError(f"Incorrect {category} fields -> '{fields}'. fields needs to be a list of keys (i.e. ['{fields}'])")
+        fields = list(fields)
+        if len(fields) == 0:
+            raise KeyError(f'Incorrect {category} fields -> no field selected. Available fields: {", ".join(self.FIELD_PATHS[category])}')
+
+        key = ('fields', category, frozenset(fields))
+        if key in self._qs_cache:
+            return self._qs_cache[key]
+
+        # merge the dotted paths into a tree, i.e. {'title': {'romaji': {}, 'english': {}}}
+        tree = {}
+        for field in fields:
+            try:
+                paths = self.FIELD_PATHS[category][field]
+            except KeyError:
+                raise KeyError(f'Incorrect {category} field -> {field}. Available fields: {", ".join(self.FIELD_PATHS[category])}')
+            for path in paths:
+                node = tree
+                for part in path.split('.'):
+                    node = node.setdefault(part, {})
+
+        def render(node, depth):
+            lines = ''
+            for name, children in node.items():
+                indent = ' ' * (20 + 4 * depth)
+                if children:
+                    lines += f'{indent}{name} {{\n' + render(children, depth + 1) + f'{indent}}}\n'
+                else:
+                    lines += f'{indent}{name}\n'
+            return lines
+
+        selection = render(tree, 0)
+        self._qs_cache[key] = selection
+        return selection
+
+    def infoQS(self, category, fields=None) -> str:
+        '''
+        Info query of an anime, manga or character by ID ($id), optionally trimmed to the given fields.
+        Generated query strings are cached per (category, fields).
+
+        :param category: 'anime', 'manga' or 'character'
+        :param fields: keys of the parsed dict to retrieve. All fields by default.
+        :rtype: str
+        '''
+        if fields is None:
+            return getattr(self, f'{category}InfoQS')
+
+        # a bare string is left for fieldSelection to reject
+        fields = fields if isinstance(fields, str) else list(fields)
+        key = ('info', category, fields if isinstance(fields, str) else frozenset(fields))
+        if key in self._qs_cache:
+            return self._qs_cache[key]
+
+        root, args = self.QUERY_ROOTS[category]
+        query = ('            query ($id: Int) {\n'
+                 f'                {root}(id: $id{args}) {{\n'
+                 + self.fieldSelection(category, fields) +
+                 '                }\n'
+                 '            }\n')
+        self._qs_cache[key] = query
+        return query
+
+    def searchInfoQS(self, category, fields=None) -> str:
+        '''
+        Page search ($query, $page, $perpage) returning the ID and the info of every result,
+        optionally trimmed to the given fields.
+        Generated query strings are cached per (category, fields).
+
+        :param category: 'anime', 'manga' or 'character'
+        :param fields: keys of the parsed dict to retrieve. All fields by default.
+        :rtype: str
+        '''
+        if fields is None:
+            return getattr(self, f'{category}SearchInfoQS')
+
+        # a bare string is left for fieldSelection to reject
+        fields = fields if isinstance(fields, str) else list(fields)
+        key = ('searchInfo', category, fields if isinstance(fields, str) else frozenset(fields))
+        if key in self._qs_cache:
+            return self._qs_cache[key]
+
+        root = 'characters' if category == 'character' else 'media'
+        args = self.QUERY_ROOTS[category][1]
+        query = ('            query ($query: String, $page: Int, $perpage: Int) {\n'
+                 '                Page (page: $page, perPage: $perpage) {\n'
+                 f'                    {root} (search: $query{args}) {{\n'
+                 '                        id\n'
+                 + self.fieldSelection(category, fields) +
+                 '                    }\n'
+                 '                }\n'
+                 '            }\n')
+        self._qs_cache[key] = query
+        return query
+
+    def batchInfoQS(self, category, count, fields=None) -> str:
+        '''
+        Builds a query retrieving `count` anime, manga or characters in a single request.
+        Every selection is aliased (item0, item1, ...) and takes its ID from the variables $id0, $id1, ...
+        Generated query strings are cached per (category, count, fields).
+
+        :param category: 'anime', 'manga' or 'character'
+        :param count: number of IDs in the batch
+        :param fields: keys of the parsed dict to retrieve. All fields by default.
+        :return: the aliased query string
+        :rtype: str
+        '''
+        key = ('batch', category, count, frozenset(fields) if fields is not None else None)
+        if key in self._qs_cache:
+            return self._qs_cache[key]
+
+        if category not in self.QUERY_ROOTS:
+            raise KeyError(f'Incorrect batch category -> {category}')
+        root, args = self.QUERY_ROOTS[category]
+        selection = self.fieldSelection(category, fields)
+
+        variables = ', '.join(f'$id{i}: Int' for i in range(count))
+        selections = ''.join(f'                item{i}: {root}(id: $id{i}{args}) {{\n' + selection + '                }\n'
+                             for i in range(count))
+
+        query = f'            query ({variables}) {{\n' + selections + '            }\n'
+        self._qs_cache[key] = query
+        return query
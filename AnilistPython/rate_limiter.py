@@ -0,0 +1,149 @@
+import time
+import random
+import threading
+
+
+class RateLimiter:
+    '''
+    Client-side token bucket that paces every request sent to Anilist.
+    Anilist allows a fixed number of requests per minute; the bucket refills at that rate and is re-synced with the
+    X-RateLimit-* headers of each response, so sustained throughput stays right under the limit instead of hitting 429s.
+    Safe to share across threads (sync) and tasks (async) - callers reserve a slot and sleep for the returned delay.
+    '''
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, requests_per_minute=90, burst=None, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        '''
+        :param requests_per_minute: Request budget per minute. Updated from the X-RateLimit-Limit header. Default = 90
+        :param burst: Max number of requests sent back to back before pacing kicks in. Default = requests_per_minute
+        :param max_retries: Number of retries for 429 and 5xx responses. Default = 5
+        :param backoff_base: First backoff delay in seconds (doubles on every retry). Default = 1
+        :param backoff_max: Upper bound of a single backoff delay in seconds. Default = 60
+        '''
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._tokens = float(self._capacity())
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+        self.request_count = 0
+        self.retry_count = 0
+
+    def _capacity(self) -> int:
+        return self.burst if self.burst is not None else self.requests_per_minute
+
+    def _refill(self, now):
+        rate = self.requests_per_minute / 60.0
+        self._tokens = min(self._capacity(), self._tokens + (now - self._last_refill) * rate)
+        self._last_refill = now
+
+    def reserve(self) -> float:
+        '''
+        Takes one token from the bucket and returns how long the caller has to sleep before sending its request.
+        Tokens may go negative: every waiting caller owns a distinct slot in the future, so callers are served in order.
+
+        :return: delay in seconds
+        :rtype: float
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            self.request_count += 1
+
+            delay = 0.0
+            if self._tokens < 0:
+                delay = -self._tokens / (self.requests_per_minute / 60.0)
+            delay = max(delay, self._blocked_until - now)
+
+            self._record_wait(delay)
+            return delay
+
+    def acquire(self) -> float:
+        '''
+        Blocking version of reserve() for the sync request path.
+
+        :return: the time waited in seconds
+        :rtype: float
+        '''
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def update(self, headers):
+        '''
+        Re-syncs the bucket with the rate limit headers of an Anilist response.
+
+        :param headers: the response headers (any mapping)
+        '''
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if limit is not None and limit.isdigit() and int(limit) > 0:
+                self.requests_per_minute = int(limit)
+
+            if remaining is not None and remaining.isdigit():
+                self._tokens = min(self._tokens, float(remaining))
+
+                if int(remaining) == 0 and reset is not None and reset.isdigit():
+                    self._blocked_until = max(self._blocked_until, now + max(0.0, int(reset) - time.time()))
+
+    def backoff(self, attempt, headers=None) -> float:
+        '''
+        Computes the delay before retrying a failed request and holds back every caller (including the retrying one,
+        on its next acquire/reserve) for that duration.
+        Retry-After is honoured when present, otherwise an exponential backoff with full jitter is used.
+
+        :param attempt: number of the retry (0 for the first one)
+        :param headers: the headers of the failed response
+        :return: delay in seconds
+        :rtype: float
+        '''
+        retry_after = headers.get('Retry-After') if headers is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            delay = float(retry_after) + random.uniform(0, self.backoff_base)
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self.retry_count += 1
+        return delay
+
+    def _record_wait(self, delay):
+        self.last_wait = delay
+        self.total_wait += delay
+
+    def should_retry(self, status_code, attempt) -> bool:
+        '''
+        :param status_code: the status code of the response
+        :param attempt: number of retries already made
+        :rtype: bool
+        '''
+        return status_code in self.RETRY_STATUS and attempt < self.max_retries
+
+    def stats(self) -> dict:
+        '''
+        Reports how much the limiter has slowed the client down.
+
+        :return: dict with the number of requests and retries, and the total/last wait in seconds
+        :rtype: dict
+        '''
+        with self._lock:
+            return {'requests': self.request_count,
+                    'retries': self.retry_count,
+                    'total_wait': self.total_wait,
+                    'last_wait': self.last_wait}
@@ -0,0 +1,189 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .deadline import DeadlineExceeded, current_deadline, request_timeout
+from .health_monitor import CircuitOpenError
+from . import json_decoder
+
+
+class RequestHandler:
+    '''
+    Pooled HTTP layer shared by every extractor of an Anilist instance.
+    Connections to graphql.anilist.co are kept alive and reused instead of paying for a new TCP/TLS handshake per lookup.
+    Every request is paced by the rate limiter, and 429/5xx responses are retried with backoff.
+    Responses of post_query are served from the in-memory cache, then from the persistent cache, when they are set,
+    and identical queries sent at the same time from several threads share a single request.
+    A single instance is safe to share across threads.
+    '''
+    def __init__(self, pool_size=10, keep_alive=True, timeout=30, rate_limiter=None, cache=None, persistent_cache=None, health_monitor=None):
+        '''
+        :param pool_size: Max number of connections kept open per host. Default = 10
+        :param keep_alive: Reuse connections between requests. Default = True
+        :param timeout: Per-request timeout in seconds (None to wait forever). Default = 30
+        :param rate_limiter: RateLimiter shared by every request (None to send requests unpaced and without retries)
+        :param cache: ResponseCache used by post_query (None to disable caching)
+        :param persistent_cache: SQLiteCache checked after the in-memory cache (None to disable)
+        :param health_monitor: HealthMonitor fed with the outcome of every request, fails fast while its circuit is open (None to disable)
+        '''
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.persistent_cache = persistent_cache
+        self.health_monitor = health_monitor
+        self.single_flight = SingleFlight()
+
+        self._lock = threading.Lock()
+        self._session = None
+
+    def _get_session(self) -> requests.Session:
+        '''
+        Lazily builds the shared session. The adapter blocks once pool_size connections are in use
+        so the pool never grows beyond the configured size.
+        '''
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    if not self.keep_alive:
+                        session.headers['Connection'] = 'close'
+                    self._session = session
+        return self._session
+
+    def post(self, url, headers=None, json=None, timeout=None) -> requests.Response:
+        '''
+        Sends a POST request through the connection pool.
+        Waits for the rate limiter before sending, and retries 429/5xx responses until the limiter gives up.
+        The last response is returned either way.
+        Inside a deadline_scope, the timeout of each attempt is capped by the time left, and DeadlineExceeded is raised
+        instead of waiting (for the rate limiter, a backoff or the response) past the deadline.
+
+        :param url: the url of the endpoint
+        :param headers: request headers
+        :param json: the json body of the request
+        :param timeout: overrides the handler's default timeout for this request only
+        :rtype: requests.Response
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        session = self._get_session()
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve()
+                deadline = current_deadline()
+                if deadline is not None and delay > 0 and delay >= deadline.remaining():
+                    raise DeadlineExceeded(f'Deadline of {deadline.timeout}s exceeded while waiting for the rate limiter ({delay:.1f}s).')
+                if delay > 0:
+                    time.sleep(delay)
+
+            if self.health_monitor is not None and not self.health_monitor.allow_request():
+                raise CircuitOpenError(f'Anilist is unavailable ({self.health_monitor.reason}).')
+
+            start = time.monotonic()
+            try:
+                response = session.post(url, headers=headers, json=json, timeout=request_timeout(timeout))
+            except requests.RequestException as e:
+                if self.health_monitor is not None:
+                    self.health_monitor.record(time.monotonic() - start, False)
+                deadline = current_deadline()
+                if isinstance(e, requests.Timeout) and deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f'Deadline of {deadline.timeout}s exceeded while waiting for Anilist.') from e
+                raise
+
+            if self.health_monitor is not None:
+                self.health_monitor.record(time.monotonic() - start, response.status_code < 500)
+
+            if self.rate_limiter is None:
+                return response
+
+            self.rate_limiter.update(response.headers)
+            if not self.rate_limiter.should_retry(response.status_code, attempt):
+                return response
+
+            self.rate_limiter.backoff(attempt, response.headers)
+            attempt += 1
+
+    def post_query(self, url, headers, query, variables, entity=None, accept_status=(200,)):
+        '''
+        Posts a GraphQL query and decodes the json response straight from its raw bytes (see json_decoder).
+        Authenticated requests (with an Authorization header) are never cached.
+
+        :param url: the url of the endpoint
+        :param headers: request headers
+        :param query: GraphQL query string (see QSData)
+        :param variables: the variables of the query
+        :param entity: entity type of the response, picks the cache TTL ('anime', 'manga', 'character', 'search', ...)
+        :param accept_status: status codes that are not an error (None to accept any). Default = (200,)
+        :return: dict or None if the response is not valid json
+        :rtype: dict or NoneType
+        '''
+        caches = []
+        if 'Authorization' not in headers:
+            caches = [cache for cache in (self.cache, self.persistent_cache) if cache is not None]
+
+        body = None
+        for level, cache in enumerate(caches):
+            body = cache.get(query, variables)
+            if body is not None:
+                # promote persistent hits to the in-memory cache
+                for upper_cache in caches[:level]:
+                    upper_cache.set(query, variables, body, entity)
+                break
+
+        if body is None:
+            flight_key = (url, headers.get('Authorization')) + ResponseCache.make_key(query, variables)
+            send = lambda: self.post(url, headers=headers, json={'query': query, 'variables': variables})
+            deadline = current_deadline()
+            try:
+                response = self.single_flight.do(flight_key, send, timeout=deadline.remaining() if deadline is not None else None)
+            except DeadlineExceeded:
+                # without a deadline of its own, this caller only failed because the shared request was cut short
+                # by the deadline of another caller
+                if deadline is not None:
+                    raise
+                response = send()
+
+            if accept_status is not None and response.status_code not in accept_status:
+                raise Exception(f"Data post unsuccessful. ({response.status_code})")
+
+            body = response.content
+            if response.status_code == 200:
+                for cache in caches:
+                    cache.set(query, variables, body, entity)
+
+        try:
+            extracted_data = json_decoder.loads(body)
+        except ValueError:
+            return None
+        except TypeError:
+            return None
+        else:
+            return extracted_data
+
+    def close(self):
+        '''
+        Closes every pooled connection. The handler can still be used afterwards (a new pool is created).
+        '''
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+default_handler = RequestHandler(rate_limiter=RateLimiter())
@@ -0,0 +1,140 @@
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    '''
+    In-process LRU cache of Anilist GraphQL responses, keyed on (query string, variables).
+    Entries expire after a TTL that depends on the entity type: airing anime (with a nextAiringEpisode) expire much
+    sooner than titles or characters, which barely change. Safe to share across threads.
+    '''
+    DEFAULT_TTL = {'anime': 6 * 3600,
+                   'manga': 6 * 3600,
+                   'character': 24 * 3600,
+                   'staff': 24 * 3600,
+                   'studio': 24 * 3600,
+                   'search': 3600,
+                   'airing': 300,
+                   None: 3600}
+
+    AIRING_PATTERN = re.compile(rb'"nextAiringEpisode"\s*:\s*\{')
+
+    def __init__(self, max_entries=1024, ttl=None):
+        '''
+        :param max_entries: Max number of responses kept in memory. Least recently used ones are evicted first. Default = 1024
+        :param ttl: dict of {entity type: seconds} overriding DEFAULT_TTL (i.e. {'airing': 60})
+        '''
+        self.max_entries = max_entries
+        self.ttl = dict(self.DEFAULT_TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expires_at, entity, body)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(query, variables) -> tuple:
+        '''
+        :param query: GraphQL query string
+        :param variables: the variables of the query
+        :rtype: tuple
+        '''
+        return (query, json.dumps(variables, sort_keys=True, default=str))
+
+    def get_ttl(self, entity, body) -> float:
+        '''
+        Returns how long a response stays fresh. Anime that are still airing use the 'airing' TTL.
+
+        :param entity: entity type of the response ('anime', 'manga', 'character', 'search', ...)
+        :param body: the raw response body
+        :rtype: float
+        '''
+        if self.AIRING_PATTERN.search(body) is not None:
+            return self.ttl['airing']
+        return self.ttl.get(entity, self.ttl[None])
+
+    def get(self, query, variables):
+        '''
+        :param query: GraphQL query string
+        :param variables: the variables of the query
+        :return: the cached raw response body or None on a miss
+        :rtype: bytes or NoneType
+        '''
+        key = self.make_key(query, variables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, query, variables, body, entity=None):
+        '''
+        :param query: GraphQL query string
+        :param variables: the variables of the query
+        :param body: the raw response body
+        :param entity: entity type used to pick the TTL
+        '''
+        ttl = self.get_ttl(entity, body)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+
+        key = self.make_key(query, variables)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, entity, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, query=None, variables=None, entity=None) -> int:
+        '''
+        Removes cached responses. Without arguments the whole cache is cleared.
+
+        :param query: only remove responses of this query (with variables: only this exact request)
+        :param variables: the variables of the request to remove
+        :param entity: only remove responses of this entity type
+        :return: number of removed responses
+        :rtype: int
+        '''
+        with self._lock:
+            if query is not None and variables is not None:
+                return 1 if self._entries.pop(self.make_key(query, variables), None) is not None else 0
+
+            removed = [key for key, entry in self._entries.items()
+                       if (query is None or key[0] == query) and (entity is None or entry[1] == entity)]
+            for key in removed:
+                del self._entries[key]
+            return len(removed)
+
+    def clear(self):
+        '''
+        Removes every cached response.
+        '''
+        self.invalidate()
+
+    def stats(self) -> dict:
+        '''
+        :return: dict with the number of entries, hits, misses and evictions
+        :rtype: dict
+        '''
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
@@ -1,23 +1,24 @@
 import os
 import datetime
-import json
-import requests
 from .query_strings import QSData
+from .request_handler import default_handler
 qsObj = QSData()
 
 class ExtractInfo:
     def __init__(self, access, status):
         self.access = access
         self.status = status # Boolean value used for bots
+        self.request_handler = access.get('request_handler', default_handler)
 
         self.logfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'error-log.txt')
 
-    def anime(self, anime_id):
+    def anime(self, anime_id, fields=None):
         """
         Function to extract anime info provided the anime ID num.
         Returns None if activte status is False.
 
         :param anime_id: input anime ID number
+        :param fields: only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
         :return: dict or None
         :rtype: dict or NoneType
         """
@@ -26,28 +27,16 @@ class ExtractInfo:
             raise Exception("Current function status is False.")
 
         id_val = {"id": anime_id}
-        req = requests.post(self.access['apiurl'],
-                         headers=self.access['header'],
-                         json={'query': qsObj.animeInfoQS, 'variables': id_val})
-        
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.infoQS('anime', fields), id_val, entity='anime')
 
-    def manga(self, manga_id):
+    def manga(self, manga_id, fields=None):
         """
         The function to retrieve an manga's information.
         Returns None if activte status is False.
 
         :param int manga_id: the manga's ID
+        :param fields: only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
         :return: dict or None
         :rtype: dict or NoneType
         """
@@ -56,21 +45,8 @@ class ExtractInfo:
             raise Exception("Current function status is False.")
 
         id_val = {"id": manga_id}
-        req = requests.post(self.access['apiurl'],
-                         headers=self.access['header'],
-                         json={'query': qsObj.mangaInfoQS, 'variables': id_val})
-        
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.infoQS('manga', fields), id_val, entity='manga')
 
     def staff(self, staff_id):
         """
@@ -86,21 +62,8 @@ class ExtractInfo:
             raise Exception("Current function status is False.")
 
         id_val = {"id": staff_id}
-        req = requests.post(self.access['apiurl'],
-                         headers=self.access['header'],
-                         json={'query': qsObj.staffInfoQS, 'variables': id_val})
-        
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.staffInfoQS, id_val, entity='staff')
 
     def studio(self, studio_id):
         """
@@ -116,28 +79,16 @@ class ExtractInfo:
             raise Exception("Current function status is False.")
 
         id_val = {"id": studio_id}
-        req = requests.post(self.access['apiurl'],
-                         headers=self.access['header'],
-                         json={'query': qsObj.studioInfoQS, 'variables': id_val})
-        
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.studioInfoQS, id_val, entity='studio')
 
-    def character(self, character_id):
+    def character(self, character_id, fields=None):
         """
         The function to retrieve a character's information.
         Returns None if activte status is False.
 
         :param int character_id: the character's ID
+        :param fields: only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
         :return: dict or None
         :rtype: dict or NoneType
         """
@@ -146,21 +97,54 @@ class ExtractInfo:
             raise Exception("Current function status is False.")
 
         id_val = {"id": character_id}
-        req = requests.post(self.access['apiurl'],
-                         headers=self.access['header'],
-                         json={'query': qsObj.characterInfoQS, 'variables': id_val})
-        
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.infoQS('character', fields), id_val, entity='character')
 
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+    def batch(self, category, ids, batch_size=25, fields=None):
+        """
+        Function to extract the info of many anime, manga or characters with as few requests as possible.
+        The IDs are split into chunks of batch_size and each chunk is retrieved with one aliased query.
+
+        :param category: 'anime', 'manga' or 'character'
+        :param ids: list of ID numbers
+        :param batch_size: max number of IDs per request. Default = 25
+        :param fields: only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
+        :return: list of Media/Character objs in the order of ids (None for IDs that were not found)
+        :rtype: list
+        """
+
+        if self.status == False:
+            raise Exception("Current function status is False.")
+
+        found = {}
+
+        # entities kept in the persistent cache are not requested again (only complete entities are cached)
+        entity_cache = self.request_handler.persistent_cache if fields is None else None
+        if entity_cache is not None:
+            for entity_id in set(ids):
+                entity = entity_cache.get_entity(category, entity_id)
+                if entity is not None:
+                    found[entity_id] = entity
+
+        unique_ids = [entity_id for entity_id in dict.fromkeys(ids) if entity_id not in found]
+        for start in range(0, len(unique_ids), batch_size):
+            chunk = unique_ids[start:start + batch_size]
+            id_val = {f"id{i}": chunk_id for i, chunk_id in enumerate(chunk)}
+            # Anilist answers 404 when any ID of the chunk is missing, the other items are still in 'data'
+            extracted_data = self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                                             qsObj.batchInfoQS(category, len(chunk), fields), id_val,
+                                                             entity=category, accept_status=(200, 404))
+            try:
+                chunk_data = extracted_data['data'] or {}
+            except (TypeError, KeyError):
+                raise Exception("Data post unsuccessful. (invalid batch response)")
+
+            for i, chunk_id in enumerate(chunk):
+                found[chunk_id] = chunk_data.get(f"item{i}")
+                if entity_cache is not None and found[chunk_id] is not None:
+                    entity_cache.set_entity(category, chunk_id, found[chunk_id])
+
+        return [found[entity_id] for entity_id in ids]
 
     def review(self, review_id, html):
         """
@@ -174,18 +158,8 @@ class ExtractInfo:
         """
 
         id_val = {"id": review_id, "html": html}
-        req = requests.post(self.access['apiurl'],
-                          headers=self.access['header'],
-                          json={'query': qsObj.reviewInfoQS, 'variables': id_val})
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.reviewInfoQS, id_val, entity='review', accept_status=None)
 
     def user_activity(self, page, perpage):
         """
@@ -206,24 +180,9 @@ class ExtractInfo:
                 "Content-Type": "application/json",
                 "Accept": "application/json"
             }
-            req = requests.post(self.access['apiurl'], headers=headers, json={'query': qsObj.user_get_idQS, 'variables': {}})
-            if req.status_code != 200:
-                raise Exception(f"Data post unsuccessful. ({req.status_code})")
-            else:
-                try:
-                    extracted_user = json.loads(req.text)
-                    id_val2 = {"id": extracted_user["data"]["Viewer"]["id"], "page": page, "perPage": perpage}
-                    req2 = requests.post(self.access['apiurl'], headers=headers, json={'query': qsObj.user_activyQS, 'variables': id_val2})
-                    if req2.status_code != 200:
-                        raise Exception(f"Data post unsuccessful. ({req.status_code})")
-                    else:
-                        try:
-                            extracted_data = json.loads(req2.text)
-                        except ValueError:
-                            return None
-                        except TypeError:
-                            return None
-                        else:
-                            return extracted_data
-                except:
-                    return None
\ No newline at end of file
+            extracted_user = self.request_handler.post_query(self.access['apiurl'], headers, qsObj.user_get_idQS, {})
+            try:
+                id_val2 = {"id": extracted_user["data"]["Viewer"]["id"], "page": page, "perPage": perpage}
+                return self.request_handler.post_query(self.access['apiurl'], headers, qsObj.user_activyQS, id_val2)
+            except:
+                return None
@@ -1,12 +1,14 @@
-import json
-import requests
-from query_strings import QSData
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from .query_strings import QSData
+from .request_handler import default_handler
 qsObj = QSData()
 
 class ExtractID:
     def __init__(self, access, status):
         self.access = access
         self.status = status # Boolean value used for bots
+        self.request_handler = access.get('request_handler', default_handler)
 
     def anime(self, term, page = 1, perpage = 3):
         """
@@ -22,21 +24,8 @@ class ExtractID:
         """
 
         preset = {"query": term, "page": page, "perpage": perpage}
-        req = requests.post(self.access['apiurl'],
-                          headers=self.access['header'],
-                          json={'query': qsObj.animeIDQS, 'variables': preset})
-
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.animeIDQS, preset, entity='search')
 
 
     def character(self, term, page = 1, perpage = 3):
@@ -53,21 +42,8 @@ class ExtractID:
         """
 
         preset = {"query": term, "page": page, "perpage": perpage}
-        req = requests.post(self.access['apiurl'],
-                          headers=self.access['header'],
-                          json={'query': qsObj.characterIDQS, 'variables': preset})
-
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.characterIDQS, preset, entity='search')
                     
     def manga(self, term, page = 1, perpage = 3):
         """
@@ -83,21 +59,8 @@ class ExtractID:
         """
 
         preset = {"query": term, "page": page, "perpage": perpage}
-        req = requests.post(self.access['apiurl'],
-                          headers=self.access['header'],
-                          json={'query': qsObj.mangaIDQS, 'variables': preset})
-
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.mangaIDQS, preset, entity='search')
                     
     def staff(self, term, page = 1, perpage = 3):
         """
@@ -113,21 +76,8 @@ class ExtractID:
         """
 
         preset = {"query": term, "page": page, "perpage": perpage}
-        req = requests.post(self.access['apiurl'],
-                          headers=self.access['header'],
-                          json={'query': qsObj.staffIDQS, 'variables': preset})
-
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
-
-        try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.staffIDQS, preset, entity='search')
                     
     def studio(self, term, page = 1, perpage = 3):
         """
@@ -143,18 +93,105 @@ class ExtractID:
         """
 
         preset = {"query": term, "page": page, "perpage": perpage}
-        req = requests.post(self.access['apiurl'],
-                          headers=self.access['header'],
-                          json={'query': qsObj.studioIDQS, 'variables': preset})
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.studioIDQS, preset, entity='search')
 
-        if req.status_code != 200:
-            raise Exception(f"Data post unsuccessful. ({req.status_code})")
+    def iter_search(self, category, term, page_size = 50):
+        """
+        Walks every page of a search lazily and yields the results one by one.
+        The next page is requested in the background while the caller consumes the current one,
+        and no more pages are requested once the caller stops iterating (i.e. breaks out of the loop).
+
+        :param category str: 'anime', 'manga', 'character', 'staff' or 'studio'
+        :param term str: Name to search for
+        :param page_size int: Number of results requested per page (Anilist caps it at 50). Default = 50
+        :return: generator of the search entries (the same dicts as in the 'media'/'characters'/... list of a page)
+        :rtype: generator
+        """
 
+        searches = {'anime': (self.anime, 'media'),
+                    'manga': (self.manga, 'media'),
+                    'character': (self.character, 'characters'),
+                    'staff': (self.staff, 'staff'),
+                    'studio': (self.studio, 'studios')}
+        try:
+            search, page_key = searches[category]
+        except KeyError:
+            raise KeyError(f'Incorrect search category -> {category}')
+
+        page_size = max(1, min(page_size, 50))
+        # the prefetch thread runs in the caller's context, so it shares the caller's deadline (see deadline_scope)
+        context = contextvars.copy_context()
+        executor = ThreadPoolExecutor(max_workers=1)
+        page = 1
+        future = executor.submit(context.run, search, term, page, page_size)
         try:
-            extracted_data = json.loads(req.text)
-        except ValueError:
-            return None
-        except TypeError:
-            return None
-        else:
-            return extracted_data
\ No newline at end of file
+            while future is not None:
+                data = future.result()
+                try:
+                    page_lvl = data['data']['Page']
+                except (TypeError, KeyError):
+                    raise Exception("Data post unsuccessful. (invalid search page)")
+
+                # prefetch the next page before handing out the results of this one
+                future = None
+                if page_lvl['pageInfo']['hasNextPage'] and len(page_lvl[page_key]) > 0:
+                    page += 1
+                    future = executor.submit(context.run, search, term, page, page_size)
+
+                yield from page_lvl[page_key]
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def anime_with_info(self, term, page = 1, perpage = 1, fields = None):
+        """
+        Search for an anime by string (words) and retrieve the full info of the results in the same request.
+        Saves the second round trip of Anime.getAnimeID followed by ExtractInfo.anime.
+
+        :param term str: Name of the anime
+        :param page int: Which page for the program to start looking at. Default = 1
+        :param perpage int: Number of retreived results from the page. Default = 1
+        :param fields list: Only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
+        :return: The search page whose media entries contain the ID and every info field of each anime or None.
+        :rtype: dict or None
+        """
+
+        preset = {"query": term, "page": page, "perpage": perpage}
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.searchInfoQS('anime', fields), preset, entity='search')
+
+    def character_with_info(self, term, page = 1, perpage = 1, fields = None):
+        """
+        Search for a character by string (words) and retrieve the full info of the results in the same request.
+        Saves the second round trip of Character.getCharacterID followed by ExtractInfo.character.
+
+        :param term str: Name of the character
+        :param page int: Which page for the program to start looking at. Default = 1
+        :param perpage int: Number of retreived results from the page. Default = 1
+        :param fields list: Only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
+        :return: The search page whose characters entries contain the ID and every info field of each character or None.
+        :rtype: dict or None
+        """
+
+        preset = {"query": term, "page": page, "perpage": perpage}
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.searchInfoQS('character', fields), preset, entity='search')
+
+    def manga_with_info(self, term, page = 1, perpage = 1, fields = None):
+        """
+        Search for a manga by string (words) and retrieve the full info of the results in the same request.
+        Saves the second round trip of Manga.getMangaID followed by ExtractInfo.manga.
+
+        :param term str: Name of the manga
+        :param page int: Which page for the program to start looking at. Default = 1
+        :param perpage int: Number of retreived results from the page. Default = 1
+        :param fields list: Only retrieve the GraphQL fields of these keys of the parsed dict. All fields by default.
+        :return: The search page whose media entries contain the ID and every info field of each manga or None.
+        :rtype: dict or None
+        """
+
+        preset = {"query": term, "page": page, "perpage": perpage}
+        return self.request_handler.post_query(self.access['apiurl'], self.access['header'],
+                                               qsObj.searchInfoQS('manga', fields), preset, entity='search')
\ No newline at end of file
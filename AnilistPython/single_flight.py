@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from .deadline import DeadlineExceeded
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    Coalesces identical calls made concurrently from several threads: the first caller runs the function,
+    every caller arriving while it is still in flight waits for it and receives the same result (or exception).
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared_count = 0 # number of calls answered by another caller's request
+
+    def do(self, key, fn, timeout=None):
+        '''
+        :param key: hashable key identifying identical calls
+        :param fn: function without arguments to run if no identical call is in flight
+        :param timeout: max seconds to wait for an identical call in flight (None to wait until it completes)
+        :return: the result of fn
+        :raises DeadlineExceeded: if the identical call does not complete within timeout
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.shared_count += 1
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise DeadlineExceeded(f'Deadline exceeded while waiting for an identical request ({timeout:.1f}s).')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    '''
+    asyncio version of SingleFlight: identical coroutines awaited concurrently on one event loop share one execution.
+    When the task running it is cancelled, the tasks waiting for it are not: one of them runs the coroutine again.
+    '''
+    def __init__(self):
+        self._calls = {}
+        self.shared_count = 0 # number of calls answered by another caller's request
+
+    async def do(self, key, coro_fn, timeout=None):
+        '''
+        :param key: hashable key identifying identical calls
+        :param coro_fn: coroutine function without arguments to await if no identical call is in flight
+        :param timeout: max seconds to wait for an identical call in flight (None to wait until it completes)
+        :return: the result of coro_fn
+        :raises DeadlineExceeded: if the identical call does not complete within timeout
+        '''
+        loop = asyncio.get_running_loop()
+        expires_at = loop.time() + timeout if timeout is not None else None
+        task = asyncio.current_task()
+        while key in self._calls:
+            future = self._calls[key]
+            self.shared_count += 1
+            # shield: a cancelled (or timed out) follower must not cancel the request of the others
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), expires_at - loop.time() if expires_at is not None else None)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f'Deadline exceeded while waiting for an identical request ({timeout:.1f}s).')
+            except asyncio.CancelledError:
+                # the leader was cancelled, not this task: run the call again (the first follower becomes the leader)
+                if not future.cancelled() or getattr(task, 'cancelling', lambda: 0)():
+                    raise
+
+        future = loop.create_future()
+        self._calls[key] = future
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # mark as retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
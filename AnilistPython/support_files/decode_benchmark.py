@@ -0,0 +1,84 @@
+'''
+Micro-benchmark of the json decoding cost per entity type.
+Compares the old path (bytes -> str -> json.loads) with the bytes path of json_decoder (stdlib, and orjson when installed).
+The payloads are synthetic but follow the shape of the query strings in QSData.
+
+Run with: python -m AnilistPython.support_files.decode_benchmark
+'''
+import json
+import timeit
+
+from .. import json_decoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+DESCRIPTION = 'After the sudden appearance of a mysterious virus, humanity has been wiped out. <br><br>' * 8
+
+
+def media(media_id):
+    return {'id': media_id,
+            'title': {'romaji': f'Owari no Seraph {media_id}', 'english': f'Seraph of the End {media_id}'},
+            'startDate': {'year': 2015, 'month': 4, 'day': 4},
+            'endDate': {'year': 2015, 'month': 6, 'day': 20},
+            'coverImage': {'large': f'https://s4.anilist.co/file/anilistcdn/media/anime/cover/medium/bx{media_id}.jpg'},
+            'bannerImage': f'https://s4.anilist.co/file/anilistcdn/media/anime/banner/{media_id}.jpg',
+            'format': 'TV', 'status': 'FINISHED', 'episodes': 12, 'season': 'SPRING', 'chapters': None, 'volumes': None,
+            'description': DESCRIPTION, 'averageScore': 72, 'meanScore': 73,
+            'genres': ['Action', 'Drama', 'Fantasy', 'Supernatural'], 'synonyms': ['Seraph of the End: Vampire Reign'],
+            'nextAiringEpisode': None}
+
+
+def character(character_id):
+    return {'id': character_id,
+            'name': {'first': 'Yuuichirou', 'last': 'Hyakuya', 'native': '百夜優一郎'},
+            'description': DESCRIPTION,
+            'image': {'large': f'https://s4.anilist.co/file/anilistcdn/character/large/b{character_id}.png'}}
+
+
+def activity(activity_id):
+    return {'id': activity_id, 'type': 'ANIME_LIST', 'replyCount': 0, 'status': 'watched episode', 'progress': '3',
+            'isLocked': False, 'isSubscribed': True, 'isLiked': False, 'isPinned': False, 'likeCount': 2,
+            'createdAt': 1650000000 + activity_id,
+            'user': {'id': 1, 'name': 'user', 'avatar': {'large': 'https://s4.anilist.co/file/anilistcdn/user/avatar/large/1.png'}},
+            'media': {'id': 20829, 'type': 'ANIME', 'status': 'FINISHED', 'isAdult': False, 'bannerImage': None,
+                      'title': {'userPreferred': 'Owari no Seraph'},
+                      'coverImage': {'large': 'https://s4.anilist.co/file/anilistcdn/media/anime/cover/medium/bx20829.jpg'}}}
+
+
+def page_info(count):
+    return {'total': 5000, 'perPage': count, 'currentPage': 1, 'lastPage': 100, 'hasNextPage': True}
+
+
+PAYLOADS = {
+    'anime': {'data': {'Media': media(20829)}},
+    'character': {'data': {'Character': character(123)}},
+    'search': {'data': {'Page': {'pageInfo': page_info(3),
+                                 'media': [{'id': i, 'title': media(i)['title'], 'coverImage': media(i)['coverImage']} for i in range(3)]}}},
+    'batch (25)': {'data': {f'item{i}': media(i) for i in range(25)}},
+    'user activity (50)': {'data': {'Page': {'pageInfo': page_info(50), 'activities': [activity(i) for i in range(50)]}}},
+}
+
+
+def main(number=2000):
+    decoders = [('str + json', lambda body: json.loads(body.decode('utf-8'))),
+                ('bytes + json', json.loads)]
+    if orjson is not None:
+        decoders.append(('bytes + orjson', orjson.loads))
+
+    print(f'json_decoder backend: {json_decoder.BACKEND}')
+    print(f'{"entity":<20}{"size":>10}' + ''.join(f'{name:>18}' for name, _ in decoders))
+    for entity, payload in PAYLOADS.items():
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        row = f'{entity:<20}{len(body):>9}B'
+        for name, decode in decoders:
+            seconds = timeit.timeit(lambda: decode(body), number=number)
+            row += f'{seconds / number * 1e6:>15.1f} us'
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
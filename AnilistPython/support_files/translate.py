@@ -1,6 +1,7 @@
 from .constants import BASE_URLS, GOOGLE_LANGUAGES_TO_CODES
 from .deep_search_exceptions import DeepSearchError, InvalidInput
 from .translate_structure import BaseTranslator
+from ..deadline import DeadlineExceeded, current_deadline, request_timeout
 
 from time import sleep
 import requests
@@ -13,13 +14,15 @@ class AnilistPythonTranslate(BaseTranslator):
     _languages = GOOGLE_LANGUAGES_TO_CODES
     supported_languages = list(_languages.keys())
 
-    def __init__(self, source="en", target="ja", proxies=None, **kwargs):
+    def __init__(self, source="en", target="ja", proxies=None, timeout=10, **kwargs):
         """
         @param source: source language to translate from
         @param target: target language to translate to
+        @param timeout: timeout of the translation request in seconds (capped by the current deadline)
         """
         self.__base_url = BASE_URLS.get("GOOGLE_TRANSLATE")
         self.proxies = proxies
+        self.timeout = timeout
 
         self._source, self._target = self.map_language_to_code(source.lower(), target.lower())
 
@@ -59,8 +62,15 @@ class AnilistPythonTranslate(BaseTranslator):
             if self.payload_key:
                 self._url_params[self.payload_key] = text
 
-            response = requests.get(self.__base_url,
-                                    params=self._url_params)
+            try:
+                response = requests.get(self.__base_url,
+                                        params=self._url_params,
+                                        timeout=request_timeout(self.timeout, 'translation'))
+            except requests.Timeout as e:
+                deadline = current_deadline()
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f'Deadline of {deadline.timeout}s exceeded while waiting for the translation.') from e
+                raise
                                     
             if response.status_code == 429:
                 raise InvalidInput(response.status_code)
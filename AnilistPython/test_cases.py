@@ -1,9 +1,150 @@
-from __init__ import Anilist
+import os
+import re
+import sys
+import json
+import shutil
+import asyncio
+import time
+import random
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+# run from the root of the repository: python -m AnilistPython.test_cases (--offline to skip the tests that need Anilist)
+from . import Anilist, AsyncAnilist
 instance = Anilist()
 
-from deep_search import DeepSearch
+from .deep_search import DeepSearch
 ds = DeepSearch()
 
+from .databases.database_anime_retrieval import DatabaseSearcher
+from .databases.postings_index import PostingsIndex, page_ids
+from .databases.record_store import load_record_store
+from .databases.local_catalog import LocalCatalog
+from .databases.delta_sync import DeltaSync, SyncInProgressError
+from .databases.index_registry import IndexRegistry
+from .databases.sqlite_cache import SQLiteCache
+from .databases.id_cache import IDCache
+from .databases.title_resolver import TitleResolver, normalize_title
+from .single_flight import SingleFlight, AsyncSingleFlight
+from .query_strings import QSData
+from .rate_limiter import RateLimiter
+from .request_handler import RequestHandler
+from .response_cache import ResponseCache
+from .deadline import Deadline, DeadlineExceeded, deadline_scope, request_timeout
+from .health_monitor import HealthMonitor, CircuitOpenError
+
+STORAGE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'databases', 'anime_database_files')
+
+
+def copy_storage_dir(tmp_dir):
+    '''
+    Copies the json files of the bundled database (not the indexes built from them) into tmp_dir.
+    '''
+    storage_dir = os.path.join(tmp_dir, 'anime_database_files')
+    shutil.copytree(STORAGE_DIR, storage_dir, ignore=lambda path, filenames: [f for f in filenames if not f.endswith('.json') or f.startswith('anime_sync')])
+    return storage_dir
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.stub.requests.append(body)
+        status, data, headers = self.server.stub.respond(body['query'], body.get('variables') or {})
+        content = json.dumps(data).encode('utf-8')
+        try:
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except ConnectionError:
+            pass # the client gave up (i.e. its deadline passed)
+
+
+class StubServer:
+    '''
+    Local stand-in for the Anilist GraphQL endpoint: respond(query, variables) returns (status code, json body, headers).
+    '''
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.stub = self
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def stub_media(anime_id, updated_at=None, title=None, genres=('Action',), year=2012, score=80):
+    return {'id': anime_id, 'updatedAt': updated_at, 'title': {'romaji': title or f'Romaji {anime_id}', 'english': None},
+            'startDate': {'year': year, 'month': 1, 'day': 2}, 'endDate': {'year': None, 'month': None, 'day': None},
+            'coverImage': {'large': 'cover'}, 'bannerImage': None, 'format': 'TV', 'status': 'FINISHED', 'episodes': 12,
+            'season': 'WINTER', 'description': 'desc', 'averageScore': score, 'meanScore': score, 'genres': list(genres),
+            'synonyms': [], 'nextAiringEpisode': None}
+
+
+def stub_anilist(media_by_id, failures=None):
+    '''
+    Stub of the Anilist endpoint serving media_by_id: Media pages sorted by UPDATED_AT_DESC and aliased batches
+    (404 when one of the IDs is missing). Requests listed in failures (their request number) are answered with a 500.
+    '''
+    def respond(query, variables):
+        if len(stub.requests) in (failures or ()):
+            return 500, {'data': None}, {}
+        if 'UPDATED_AT_DESC' in query:
+            # anime never updated come first, the sync has to skip them
+            media_list = sorted(media_by_id.values(), key=lambda media: -(media['updatedAt'] if media['updatedAt'] is not None else float('inf')))
+            start = (variables['page'] - 1) * variables['perpage']
+            page = media_list[start:start + variables['perpage']]
+            return 200, {'data': {'Page': {'pageInfo': {'currentPage': variables['page'], 'hasNextPage': start + len(page) < len(media_list)},
+                                           'media': [{'id': media['id'], 'updatedAt': media['updatedAt']} for media in page]}}}, {}
+        data = {alias: media_by_id.get(variables[var]) for alias, var in re.findall(r'(\w+)\s*:\s*Media\s*\(id:\s*\$(\w+)', query)}
+        return (404 if None in data.values() else 200), {'data': data}, {}
+    stub = StubServer(respond)
+    return stub
+
+
+def stub_media_server():
+    '''
+    Stub of the Anilist endpoint answering Media lookups by ID with stub_media, and Media searches with anime 1
+    (no result for 'nothing').
+    '''
+    def respond(query, variables):
+        if 'Page' in query:
+            media_list = [] if variables.get('query') == 'nothing' else [stub_media(1)]
+            return 200, {'data': {'Page': {'pageInfo': {'currentPage': 1, 'hasNextPage': False}, 'media': media_list}}}, {}
+        return 200, {'data': {'Media': stub_media(variables['id'])}}, {}
+    return StubServer(respond)
+
+
+def record_threads(obj, names):
+    '''
+    Wraps the methods of obj to record the thread each call runs on.
+
+    :return: list the thread identifiers are appended to
+    '''
+    threads = []
+    for name in names:
+        def call(*args, method=getattr(obj, name)):
+            threads.append(threading.get_ident())
+            return method(*args)
+        setattr(obj, name, call)
+    return threads
+
+
 class TestCase:
     '''
         Simple AnilistPython test case module provided to the users.
@@ -18,6 +159,7 @@ class TestCase:
         '''
         self.test_getAnime()
         self.test_getAnimeWithID()
+        self.test_getAnimeWithIDs()
 
         self.test_getCharacter()
         self.test_getCharacterWithID()
@@ -27,6 +169,38 @@ class TestCase:
 
         self.test_searchAnime()
 
+    def runOfflineTests(self):
+        '''
+        Test cases that only use the bundled database and local stub servers (no internet connection needed).
+        '''
+        self.test_rateLimiter()
+        self.test_retries()
+        self.test_responseCache()
+        self.test_sqliteCache()
+        self.test_requestHandlerCaches()
+        self.test_singleFlight()
+        self.test_deadlines()
+        self.test_circuitBreaker()
+        self.test_titleResolver()
+        self.test_idCache()
+
+        self.test_fieldSelection()
+
+        self.test_localSearchDuplicateKeys()
+        self.test_localIndexFiles()
+        self.test_localStorageDir()
+        self.test_localBackends()
+        self.test_localPlanner()
+        self.test_indexRegistry()
+        self.test_localPaging()
+
+        self.test_deltaSync()
+
+        self.test_asyncPersistentCache()
+        self.test_asyncEntityCache()
+        self.test_asyncIDCache()
+        self.test_asyncSingleFlightCancel()
+
     def test_getAnime(self):
         data = instance.get_anime("Code Geass Rebellion")
         assert data["name_romaji"] == "Code Geass: Hangyaku no Lelouch"
@@ -47,6 +221,14 @@ class TestCase:
         assert data["ending_time"] == "3/26/2013"
         assert data["airing_episodes"] == 24
 
+    def test_getAnimeWithIDs(self):
+        IDs = [13759, 1535, 13759] #Sakurasou, Death Note, Sakurasou
+        data = instance.get_anime_with_ids(IDs)
+        assert len(data) == 3
+        assert data[0]["name_romaji"] == "Sakurasou no Pet na Kanojo"
+        assert data[1]["name_english"] == "Death Note"
+        assert data[2] == data[0]
+
     def test_getCharacter(self):
         data = instance.get_character("Emilia Tan")
         assert data["first_name"] == "Emilia"
@@ -79,15 +261,572 @@ class TestCase:
 
     def test_searchAnime(self):
         data = instance.get_anime('Re:Zero kara Hajimeru Isekai Seikatsu')
-        assert instance.search_anime(genre=['Action', 'Adventure', 'Drama', 'Fantasy', 'Psychological', 'Romance', 'Thriller'], year='2016', score=range(80, 90)) == [data]
+        # Re:Zero has no stored record in the bundled database, it is found as a partial record
+        results = instance.search_anime(genre=['Action', 'Adventure', 'Drama', 'Fantasy', 'Psychological', 'Romance', 'Thriller'], year='2016', score=range(80, 90))
+        assert [(record['name_romaji'], record['name_english'], record['partial']) for record in results] == [(data['name_romaji'], data['name_english'], True)]
 
         data_id = instance.get_anime_id('Re:Zero kara Hajimeru Isekai Seikatsu')
         assert instance.search_anime(genre=['Action', 'Adventure', 'Drama', 'Fantasy', 'Psychological', 'Romance', 'Thriller'], year='2016', score=range(80, 90), id_only=True) == [str(data_id)]
         
 
 
-testCase = TestCase()
-testCase.runTests()
-print('=====================================')
-print("|  TEST COMPLETED! NO ERRORS FOUND! |")
-print('=====================================')
+    # NETWORK LAYER ====================================================================================
+    def test_rateLimiter(self):
+        limiter = RateLimiter(60, burst=2)
+        assert limiter.reserve() == 0 and limiter.reserve() == 0
+        assert 0.9 < limiter.reserve() <= 1.0 # one request per second once the burst is spent
+        assert limiter.stats()['requests'] == 3
+
+        limiter.update({'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 30)})
+        assert limiter.requests_per_minute == 120 and limiter.reserve() > 20 # blocked until the reset
+
+        assert limiter.should_retry(429, 0) and limiter.should_retry(503, 4)
+        assert not limiter.should_retry(429, 5) and not limiter.should_retry(404, 0)
+        assert 2 <= RateLimiter().backoff(0, {'Retry-After': '2'}) <= 3
+        assert RateLimiter(backoff_base=1, backoff_max=4).backoff(10) <= 4
+
+    def test_retries(self):
+        statuses = []
+        def respond(query, variables):
+            status = statuses.pop(0) if statuses else 200
+            return status, {'data': {'Media': stub_media(variables['id'])}}, {'Retry-After': '0'}
+        stub = StubServer(respond)
+
+        limiter = RateLimiter(6000, max_retries=2, backoff_base=0.01)
+        handler = RequestHandler(rate_limiter=limiter)
+        statuses += [429, 503]
+        data = handler.post_query(stub.url, {}, 'query ($id: Int) { Media (id: $id) { id } }', {'id': 1})
+        assert data['data']['Media']['id'] == 1
+        assert len(stub.requests) == 3 and limiter.stats()['retries'] == 2
+
+        # the last response is kept once the retries are spent
+        statuses += [500, 502, 503]
+        try:
+            handler.post_query(stub.url, {}, 'query ($id: Int) { Media (id: $id) { id } }', {'id': 2})
+            assert False
+        except Exception as e:
+            assert '503' in str(e)
+        assert len(stub.requests) == 6
+        handler.close()
+        stub.close()
+
+    def test_responseCache(self):
+        cache = ResponseCache(max_entries=2, ttl={'search': 0, 'airing': 0})
+        cache.set('q', {'id': 1}, b'{"id": 1}', 'anime')
+        cache.set('q', {'id': 2}, b'{"id": 2}', 'anime')
+        assert cache.get('q', {'id': 1}) == b'{"id": 1}' # 1 becomes the most recently used
+        cache.set('q', {'id': 3}, b'{"id": 3}', 'anime')
+        assert cache.get('q', {'id': 2}) is None and cache.get('q', {'id': 3}) == b'{"id": 3}'
+        assert cache.stats() == {'entries': 2, 'hits': 2, 'misses': 1, 'evictions': 1}
+
+        # zero TTLs are not stored, airing anime use the airing TTL
+        cache.set('q', {'page': 1}, b'{}', 'search')
+        cache.set('q', {'id': 4}, b'{"nextAiringEpisode": {"episode": 2}}', 'anime')
+        assert cache.get('q', {'page': 1}) is None and cache.get('q', {'id': 4}) is None
+        assert cache.invalidate(entity='anime') == 2 and cache.stats()['entries'] == 0
+
+    def test_sqliteCache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.sqlite3')
+            cache = SQLiteCache(path=path)
+            cache.set('q', {'id': 1}, b'{"id": 1}', 'anime')
+            cache.set_entity('anime', 1, {'id': 1, 'title': {'romaji': 'Romaji 1'}})
+            cache.close()
+
+            # a new instance (i.e. after a restart) starts warm
+            cache = SQLiteCache(path=path)
+            assert cache.get('q', {'id': 1}) == b'{"id": 1}' and cache.get('q', {'id': 2}) is None
+            assert cache.get_entity('anime', 1) == {'id': 1, 'title': {'romaji': 'Romaji 1'}}
+            assert cache.invalidate('q', {'id': 1}) == 1 and cache.get('q', {'id': 1}) is None
+
+            cache.max_bytes = 1000
+            for i in range(20):
+                cache.set('q', {'id': i}, b'x' * 100, 'anime')
+            cache.evict()
+            assert cache.stats()['bytes'] <= 1000 and cache.get('q', {'id': 19}) is not None
+            cache.close()
+
+    def test_requestHandlerCaches(self):
+        stub = stub_media_server()
+        query = 'query ($id: Int) { Media (id: $id) { id } }'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persistent_cache = SQLiteCache(path=os.path.join(tmp_dir, 'cache.sqlite3'))
+            handler = RequestHandler(cache=ResponseCache(), persistent_cache=persistent_cache)
+            assert handler.post_query(stub.url, {}, query, {'id': 1}, entity='anime') == handler.post_query(stub.url, {}, query, {'id': 1}, entity='anime')
+            assert len(stub.requests) == 1
+
+            # a new handler (empty in-memory cache) is answered by the persistent cache, and warms its memory
+            handler = RequestHandler(cache=ResponseCache(), persistent_cache=persistent_cache)
+            assert handler.post_query(stub.url, {}, query, {'id': 1}, entity='anime')['data']['Media']['id'] == 1
+            assert len(stub.requests) == 1 and handler.cache.stats()['entries'] == 1
+
+            # authenticated requests are never cached
+            handler.post_query(stub.url, {'Authorization': 'Bearer token'}, query, {'id': 1}, entity='anime')
+            assert len(stub.requests) == 2
+            handler.close()
+            persistent_cache.close()
+        stub.close()
+
+    def test_singleFlight(self):
+        single_flight = SingleFlight()
+        calls = []
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', fetch))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ['result'] * 5 and len(calls) == 1 and single_flight.shared_count == 4
+
+        # errors are shared too, and a follower stops waiting after its timeout
+        def fail():
+            time.sleep(0.2)
+            raise ValueError('failed')
+        errors = []
+        def call(timeout=None):
+            try:
+                single_flight.do('key', fail, timeout)
+            except (ValueError, DeadlineExceeded) as e:
+                errors.append(type(e))
+        threads = [threading.Thread(target=call), threading.Thread(target=call), threading.Thread(target=call, args=(0.05,))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        assert sorted(error.__name__ for error in errors) == ['DeadlineExceeded', 'ValueError', 'ValueError']
+
+    def test_deadlines(self):
+        deadline = Deadline(0.5)
+        assert 0.4 < deadline.remaining() <= 0.5 and not deadline.expired()
+        with deadline_scope(10):
+            assert 9 < request_timeout(30) <= 10
+            with deadline_scope(deadline=deadline) as scope:
+                assert scope is deadline and request_timeout(None) <= 0.5 # the earliest deadline wins
+            with deadline_scope(60) as scope:
+                assert scope.timeout == 10
+        assert request_timeout(30) == 30
+
+        def respond(query, variables):
+            time.sleep(0.5)
+            return 200, {'data': {'Media': stub_media(variables['id'])}}, {}
+        stub = StubServer(respond)
+        handler = RequestHandler()
+        start = time.monotonic()
+        try:
+            with deadline_scope(0.1):
+                handler.post_query(stub.url, {}, 'query ($id: Int) { Media (id: $id) { id } }', {'id': 1})
+            assert False
+        except DeadlineExceeded:
+            assert time.monotonic() - start < 0.4
+
+        # a request that would have to wait for the rate limiter past the deadline is not sent
+        requests_sent = len(stub.requests)
+        handler = RequestHandler(rate_limiter=RateLimiter(1, burst=1))
+        handler.rate_limiter.reserve()
+        try:
+            with deadline_scope(1):
+                handler.post_query(stub.url, {}, 'query ($id: Int) { Media (id: $id) { id } }', {'id': 2})
+            assert False
+        except DeadlineExceeded:
+            assert len(stub.requests) == requests_sent
+        handler.close()
+        stub.close()
+
+    def test_circuitBreaker(self):
+        stub = stub_media_server()
+        monitor = HealthMonitor(url=stub.url, failure_threshold=2, probe_interval=None, recovery_interval=60)
+        assert monitor.allow_request()
+        monitor.record(0.1, False)
+        assert monitor.online
+        monitor.record(0.1, False)
+        assert not monitor.online and monitor.reason == '2 consecutive failures'
+
+        # requests fail fast while the circuit is open, lookups fall back to the local database
+        handler = RequestHandler(health_monitor=monitor)
+        try:
+            handler.post_query(stub.url, {}, 'query ($id: Int) { Media (id: $id) { id } }', {'id': 1})
+            assert False
+        except CircuitOpenError:
+            assert len(stub.requests) == 0
+        client = Anilist(rate_limit=None, health_monitor=monitor)
+        client.access['apiurl'] = stub.url
+        assert client.get_anime_with_id(11757, fields=['name_romaji']) == {'name_romaji': 'Sword Art Online'}
+        assert len(stub.requests) == 0
+
+        # a healthy probe closes it
+        assert monitor.probe() and monitor.online
+        assert client.get_anime_with_id(11757, fields=['name_romaji']) == {'name_romaji': 'Romaji 11757'}
+        monitor.stop()
+        handler.close()
+        stub.close()
+
+    def test_titleResolver(self):
+        assert normalize_title("Kino's Journey") == 'kinos journey' and normalize_title('Ｒｅ：ＺＥＲＯ') == 're zero'
+        resolver = TitleResolver()
+        assert resolver.resolve('Sword Art Online') == 11757 and resolver.resolve('  sword art online!! ') == 11757
+        assert resolver.resolve('Berserk') is None # several anime share the title
+        assert resolver.resolve('Not The Title Of Any Anime') is None
+
+        # resolved titles only need the info request
+        stub = stub_media_server()
+        client = Anilist(rate_limit=None)
+        client.access['apiurl'] = stub.url
+        assert client.get_anime('COWBOY BEBOP', fields=['name_romaji']) == {'name_romaji': 'Romaji 1'}
+        assert len(stub.requests) == 1 and 'Page' not in stub.requests[0]['query']
+        stub.close()
+
+    def test_idCache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            id_cache = IDCache(path=os.path.join(tmp_dir, 'ids.sqlite3'), negative_ttl=0)
+            id_cache.set('anime', 'Code Geass!', 1575)
+            assert id_cache.get('anime', 'code geass') == 1575 and id_cache.get('manga', 'code geass') is None
+            id_cache.set('anime', 'nothing', None)
+            assert id_cache.get('anime', 'nothing') is None # not found results expired already
+            assert id_cache.invalidate('anime', 'CODE GEASS') == 1 and id_cache.get('anime', 'code geass') is None
+
+            stub = stub_media_server()
+            client = Anilist(rate_limit=None, local_resolution=False, id_cache=IDCache(path=os.path.join(tmp_dir, 'ids.sqlite3')))
+            client.access['apiurl'] = stub.url
+            assert client.get_anime_id('stub anime') == client.get_anime_id('Stub Anime!') == 1
+            assert len(stub.requests) == 1
+            client.id_cache.close()
+            id_cache.close()
+            stub.close()
+
+    # QUERIES ==========================================================================================
+    def test_fieldSelection(self):
+        qs = QSData()
+        assert 'description' not in qs.fieldSelection('anime', ['name_romaji', 'average_score'])
+        assert qs.fieldSelection('anime', ('name_romaji', 'average_score')) == qs.fieldSelection('anime', ['average_score', 'name_romaji'])
+        for build in (qs.infoQS, qs.searchInfoQS):
+            assert build('anime', ['name_romaji', 'average_score']) is build('anime', ('average_score', 'name_romaji'))
+        for fields, error in [([], KeyError), ('name_romaji', TypeError), (['name'], KeyError)]:
+            for build in (qs.fieldSelection, qs.infoQS, qs.searchInfoQS):
+                try:
+                    build('anime', fields)
+                    assert False
+                except error:
+                    pass
+
+    # LOCAL DATABASE ===================================================================================
+    def test_localSearchDuplicateKeys(self):
+        json_searcher = DatabaseSearcher(backend='json')
+        postings_searcher = DatabaseSearcher(backend='postings')
+        for filters in [{'year': ['1990', '1990', '2021'], 'score': '31-48'},
+                        {'genre': ['Action', 'action', 'Comedy'], 'year': 2010},
+                        {'genre': ['Action', 'Drama', 'Action'], 'genre_mode': 'or', 'year': [2012, 2013, 2012]},
+                        {'genre': 'Romance', 'exclude_genre': ['Comedy', 'Comedy'], 'exclude_year': [2015, 2015]}]:
+            expected = json_searcher.anime_mix_search(id_only=True, **filters)
+            assert len(expected) == len(set(expected)) > 0
+            assert postings_searcher.anime_mix_search(id_only=True, **filters) == expected
+
+        ids = postings_searcher.anime_mix_search(year=['1990', '1990', '2021'], score='31-48', id_only=True)
+        assert len(ids) == len(set(ids)) == 54
+
+    def test_localIndexFiles(self):
+        database_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'databases', 'anime_database.sqlite3')
+        placeholder = os.path.getsize(database_path)
+        index = DatabaseSearcher(backend='sqlite').index
+        assert index.path != database_path and os.path.isfile(index.path)
+        assert index.query(years=[2016], min_score=80, max_score=90, id_only=True) == DatabaseSearcher(backend='json').anime_mix_search(year=2016, score=range(80, 90), id_only=True)
+        for cache in (SQLiteCache(), IDCache()):
+            assert cache.path != database_path and os.path.isfile(cache.path)
+            cache.close()
+        assert os.path.getsize(database_path) == placeholder
+
+    def test_localStorageDir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage_dir = copy_storage_dir(tmp_dir)
+            with open(os.path.join(storage_dir, 'anime_by_id_cache.json'), 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            records['11757']['name_romaji'] = 'Sword Art Online (copy)'
+            with open(os.path.join(storage_dir, 'anime_by_id_cache.json'), 'w', encoding='utf-8') as f:
+                json.dump(records, f)
+
+            store = load_record_store(storage_dir)
+            assert os.path.dirname(store.path) == storage_dir
+            assert os.path.dirname(PostingsIndex(storage_dir=storage_dir).path) == storage_dir
+            assert store.get(11757)['name_romaji'] == 'Sword Art Online (copy)'
+            assert load_record_store().get(11757)['name_romaji'] == 'Sword Art Online'
+            assert [record['name_romaji'] for record in LocalCatalog(storage_dir=storage_dir).query(years=[2012], min_score=67, max_score=68) if not record.get('partial')] == ['Sword Art Online (copy)']
+            store.close()
+
+    def test_localBackends(self):
+        searchers = [DatabaseSearcher(backend=backend) for backend in ('json', 'postings', 'sqlite', 'catalog')]
+        genres = sorted(searchers[1].index.genres())
+        years = sorted(year for year in searchers[1].index.years() if year is not None)
+        rng = random.Random(1)
+        for _ in range(100):
+            filters = {'genre': rng.sample(genres, rng.randint(0, 3)) or None, 'genre_mode': rng.choice(['and', 'or']),
+                       'year': rng.sample(years, rng.randint(0, 2)) or None,
+                       'score': rng.choice([None, (50, 80), (None, 30), (70, None), 75]),
+                       'score_bounds': rng.choice(['(]', '[]', '()']),
+                       'exclude_genre': rng.sample(genres, rng.randint(0, 2)) or None,
+                       'exclude_year': rng.sample(years + ['None'], rng.randint(0, 2)) or None}
+            if not (filters['genre'] or filters['year'] or filters['score'] is not None):
+                filters['score'] = (None, None)
+            expected = searchers[0].anime_mix_search(id_only=True, **filters)
+            for searcher in searchers[1:]:
+                assert searcher.anime_mix_search(id_only=True, **filters) == expected, filters
+
+        # records are returned in the same order, for the same anime as the IDs (partial records for most of them)
+        records = [searcher.anime_mix_search(genre='Action', year=2012) for searcher in searchers]
+        assert all(result == records[0] for result in records) and len(records[0]) == len(searchers[0].anime_mix_search(genre='Action', year=2012, id_only=True))
+        assert [record['name_romaji'] for record in records[0] if not record.get('partial')] == ['Sword Art Online']
+        assert all(record['year'] == 2012 and 'Action' in record['genres'] for record in records[0] if record.get('partial'))
+        for searcher in searchers:
+            anime_ids = searcher.anime_mix_search(genre='Action', year=2012, order_by='score', limit=5, id_only=True)
+            page = searcher.anime_mix_search(genre='Action', year=2012, order_by='score', limit=5)
+            assert [str(record['id']) if record.get('partial') else '11757' for record in page] == anime_ids
+
+    def test_localPlanner(self):
+        index = DatabaseSearcher(backend='postings').index
+        plan = index.plan(genres=['action', 'romance'], years=[2012], exclude_genres=['ecchi'], exclude_years=[2013])
+        restrictions = [predicate for predicate in plan if not predicate.negate]
+        exclusions = [predicate for predicate in plan if predicate.negate]
+        assert plan == restrictions + exclusions and len(restrictions) == 3 and len(exclusions) == 2
+        assert [predicate.estimate for predicate in restrictions] == sorted(predicate.estimate for predicate in restrictions)
+        assert [predicate.estimate for predicate in exclusions] == sorted((predicate.estimate for predicate in exclusions), reverse=True)
+
+    def test_indexRegistry(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'index.json')
+            with open(path, 'w') as f:
+                f.write('1')
+            registry = IndexRegistry(idle_timeout=None)
+            assert registry.get('index', lambda: 1, [path]) == 1
+
+            loading = threading.Event()
+            release = threading.Event()
+            loads = []
+            def slow_loader():
+                loads.append(len(loads))
+                loading.set()
+                release.wait(5)
+                return 2
+
+            # an index evicted while it is being reloaded is still loaded once
+            with open(path, 'w') as f:
+                f.write('22')
+            results = []
+            first = threading.Thread(target=lambda: results.append(registry.get('index', slow_loader, [path])))
+            first.start()
+            loading.wait(5)
+            registry.idle_timeout = 0.0
+            time.sleep(0.01)
+            assert registry.evict_idle() == 1
+            registry.idle_timeout = None
+            second = threading.Thread(target=lambda: results.append(registry.get('index', slow_loader, [path])))
+            second.start()
+            time.sleep(0.05)
+            release.set()
+            first.join()
+            second.join()
+            assert results == [2, 2] and len(loads) == 1
+
+    def test_localPaging(self):
+        ids = [5, 1, 4, 2, 3]
+        keys = {1: 10, 2: 30, 3: 30, 4: 20, 5: 10}
+        key_array = np.full(6, -np.inf)
+        for anime_id, key in keys.items():
+            key_array[anime_id] = key
+        ids = np.array(sorted(ids))
+        assert page_ids(ids, key_array).tolist() == [2, 3, 4, 1, 5] # highest first, ties by ID
+        assert page_ids(ids, key_array, offset=1, limit=2).tolist() == [3, 4]
+        assert page_ids(ids, None, offset=3).tolist() == [4, 5]
+
+        # pages of every backend add up to the full ordered search
+        for backend in ('json', 'postings', 'sqlite', 'catalog'):
+            searcher = DatabaseSearcher(backend=backend)
+            for order_by in ('id', 'score', 'year'):
+                full = searcher.anime_mix_search(genre='Action', year=[2010, 2011], order_by=order_by, id_only=True)
+                pages = [searcher.anime_mix_search(genre='Action', year=[2010, 2011], order_by=order_by, offset=offset, limit=25, id_only=True)
+                         for offset in range(0, len(full), 25)]
+                assert sum(pages, []) == full and len(full) > 25
+                expected = DatabaseSearcher(backend='json').anime_mix_search(genre='Action', year=[2010, 2011], order_by=order_by, id_only=True)
+                assert full == expected, (backend, order_by)
+
+            # no local record holds a popularity, ordering by it would silently be the ID order
+            searches = [lambda: searcher.anime_mix_search(genre='Action', order_by='popularity', limit=10)]
+            if searcher.index is not None:
+                searches.append(lambda: searcher.index.query(genres=['action'], order_by='popularity', limit=10))
+            for search in searches:
+                try:
+                    search()
+                    assert False
+                except ValueError:
+                    pass
+
+    # DELTA SYNC =======================================================================================
+    def test_deltaSync(self):
+        mark = DeltaSync.DEFAULT_HIGH_WATER_MARK
+        media_by_id = {1: stub_media(1, mark + 500, 'Bebop Remastered', ['Comedy'], 2030, 77),
+                       5: stub_media(5, mark - 10, 'Not Synced', ['Drama'], 2001, 50), # updated before the mark
+                       900009: stub_media(900009, None, 'Never Updated')}
+        for k in range(5):
+            media_by_id[900001 + k] = stub_media(900001 + k, mark + 100 + k, f'New Show {k}', ['Action'], 2025, 60 + k)
+        failures = set()
+        stub = stub_anilist(media_by_id, failures)
+        client = Anilist(rate_limit=None) # 5xx are not retried
+        client.access['apiurl'] = stub.url
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage_dir = copy_storage_dir(tmp_dir)
+            read_json = lambda filename: json.load(open(os.path.join(storage_dir, filename), 'r', encoding='utf-8'))
+            sync = DeltaSync(client.access, storage_dir=storage_dir, page_size=2, batch_size=2, flush_every=2)
+
+            # stopped by max_pages: [never updated, 1], [900005, 900004] listed, nothing retrieved yet
+            result = sync.run(max_pages=2)
+            assert not result['complete'] and result['pending'] == 3 and result['updated'] == 0
+            assert sync.load_state()['run']['page'] == 3 and not os.path.exists(sync.lock_path)
+
+            # resumed from page 3, then the second batch fails: the first one is kept
+            failures.add(len(stub.requests) + 4)
+            try:
+                sync.run()
+                assert False
+            except Exception as e:
+                assert '500' in str(e)
+            run = sync.load_state()['run']
+            assert run['pending'] == [900004, 900003, 900002, 900001] and run['updated'] == 2
+            assert '1' in read_json('anime_by_genre.json')['comedy'] and not os.path.exists(sync.lock_path)
+
+            # resumed from the failed batch
+            requests_sent = len(stub.requests)
+            result = sync.run()
+            assert result == {'complete': True, 'pending': 0, 'updated': 6, 'removed': 0, 'high_water_mark': mark + 500}
+            assert len(stub.requests) - requests_sent == 2 # the two batches left, no page listed again
+
+            genre_dict, year_dict, score_dict = read_json('anime_by_genre.json'), read_json('anime_by_year.json'), read_json('anime_by_score.json')
+            assert '1' in genre_dict['comedy'] and '1' not in genre_dict['action'] and '900003' in genre_dict['action']
+            assert [year for year, anime_ids in year_dict.items() if '1' in anime_ids] == ['2030']
+            assert [score for score, anime_ids in score_dict.items() if '1' in anime_ids] == ['77'] and '900004' in score_dict['63']
+            assert read_json('anime_by_tag.json')['Bebop Remastered'] == '1' and 'Cowboy Bebop' not in read_json('anime_by_tag.json')
+            # patched into the cached records, in their shape: the full database is not shipped
+            records = read_json('anime_by_id_cache.json')
+            assert not os.path.exists(os.path.join(storage_dir, 'anime_by_id.json')) and records['placeholder'] == 'placeholder'
+            assert records['900002']['name_romaji'] == 'New Show 1' and records['11757']['cache_pos'] == 1
+            assert sorted(record['cache_pos'] for anime_id, record in records.items() if anime_id.isdigit()) == list(range(1, len(records)))
+            assert 'Not Synced' not in read_json('anime_by_tag.json') and all('900009' not in anime_ids for anime_ids in genre_dict.values())
+            assert PostingsIndex(storage_dir=storage_dir).query(genres=['comedy'], years=[2030], id_only=True) == ['1']
+            assert load_record_store(storage_dir).get(900005)['name_romaji'] == 'New Show 4'
+
+            # applying the same batch twice gives the same result
+            filenames = ['anime_by_genre.json', 'anime_by_year.json', 'anime_by_score.json', 'anime_by_tag.json', 'anime_by_id_cache.json']
+            records = sync.fetch_records([1, 900003])
+            sync.apply(records)
+            sync.flush()
+            once = [read_json(filename) for filename in filenames]
+            sync.apply(records)
+            sync.flush()
+            assert [read_json(filename) for filename in filenames] == once
+
+            # one sync per storage directory
+            open(sync.lock_path, 'w').close()
+            try:
+                sync.run()
+                assert False
+            except SyncInProgressError:
+                pass
+            os.remove(sync.lock_path)
+            load_record_store(storage_dir).close()
+        stub.close()
+
+    # ASYNC ============================================================================================
+    def test_asyncPersistentCache(self):
+        stub = stub_media_server()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persistent_cache = SQLiteCache(path=os.path.join(tmp_dir, 'cache.sqlite3'))
+            cache_threads = record_threads(persistent_cache, ['get', 'set'])
+
+            async def lookups():
+                async with AsyncAnilist(rate_limit=None, persistent_cache=persistent_cache) as client:
+                    client.access['apiurl'] = stub.url
+                    return [await client.get_anime_with_id(1, fields=['name_romaji']) for _ in range(2)]
+            assert asyncio.run(lookups()) == [{'name_romaji': 'Romaji 1'}] * 2
+            assert len(stub.requests) == 1 # the second lookup is answered by the persistent cache
+            assert len(cache_threads) == 3 and threading.get_ident() not in cache_threads # get, set, get off the event loop
+            persistent_cache.close()
+        stub.close()
+
+    def test_asyncEntityCache(self):
+        stub = stub_anilist({1: stub_media(1), 2: stub_media(2)})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persistent_cache = SQLiteCache(path=os.path.join(tmp_dir, 'cache.sqlite3'))
+            entity_threads = record_threads(persistent_cache, ['get_entity', 'set_entity'])
+
+            async def lookups():
+                async with AsyncAnilist(rate_limit=None, persistent_cache=persistent_cache) as client:
+                    client.access['apiurl'] = stub.url
+                    return [await client.get_anime_with_ids([1, 2, 1]) for _ in range(2)]
+            first, second = asyncio.run(lookups())
+            assert [anime['name_romaji'] for anime in first] == ['Romaji 1', 'Romaji 2', 'Romaji 1'] and second == first
+            assert len(stub.requests) == 1 # the second batch is answered by the persistent cache
+            assert len(entity_threads) == 6 and threading.get_ident() not in entity_threads # get, get, set, set, get, get off the event loop
+            persistent_cache.close()
+        stub.close()
+
+    def test_asyncIDCache(self):
+        stub = stub_media_server()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            id_cache = IDCache(path=os.path.join(tmp_dir, 'ids.sqlite3'))
+            cache_threads = record_threads(id_cache, ['get', 'set'])
+
+            async def lookups():
+                async with AsyncAnilist(rate_limit=None, local_resolution=False, id_cache=id_cache) as client:
+                    client.access['apiurl'] = stub.url
+                    anime_ids = [await client.get_anime_id('stub anime') for _ in range(2)]
+                    for _ in range(2):
+                        try:
+                            await client.get_anime_id('nothing')
+                            assert False
+                        except IndexError:
+                            pass
+                    return anime_ids
+            assert asyncio.run(lookups()) == [1, 1]
+            assert len(stub.requests) == 2 # the second lookups are answered by the ID cache, not found included
+            assert len(cache_threads) == 6 and threading.get_ident() not in cache_threads
+            id_cache.close()
+        stub.close()
+
+    def test_asyncSingleFlightCancel(self):
+        async def flights():
+            single_flight = AsyncSingleFlight()
+            calls = []
+            async def fetch():
+                calls.append(len(calls))
+                await asyncio.sleep(0.05)
+                return f'result {len(calls)}'
+
+            leader = asyncio.ensure_future(single_flight.do('key', fetch))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(single_flight.do('key', fetch)) for _ in range(3)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            # the first follower runs the call again, the others share its result
+            assert await asyncio.gather(*followers) == ['result 2'] * 3 and len(calls) == 2
+            assert leader.cancelled()
+
+            # a cancelled follower does not cancel the call
+            leader = asyncio.ensure_future(single_flight.do('key', fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do('key', fetch))
+            await asyncio.sleep(0)
+            follower.cancel()
+            assert await leader == 'result 3' and follower.cancelled()
+        asyncio.run(flights())
+
+
+if __name__ == '__main__':
+    testCase = TestCase()
+    testCase.runOfflineTests()
+    if '--offline' not in sys.argv:
+        testCase.runTests()
+    print('=====================================')
+    print("|  TEST COMPLETED! NO ERRORS FOUND! |")
+    print('=====================================')